@@ -0,0 +1,91 @@
+"""Partition user_event_interactions by month
+
+Revision ID: b81f5d2c9a64
+Revises: 9c4e2a7b1d36
+Create Date: 2026-10-18 15:12:06.481925
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f5d2c9a64'
+down_revision = '9c4e2a7b1d36'
+branch_labels = None
+depends_on = None
+
+# Partitions are created for the months holding existing rows plus this many ahead;
+# webapp/partitions.py keeps creating them from then on
+MONTHS_AHEAD = 3
+
+COLUMNS = '''
+    id INTEGER NOT NULL DEFAULT nextval('user_event_interactions_id_seq'),
+    user_id INTEGER NOT NULL REFERENCES "user" (id),
+    event_id INTEGER NOT NULL REFERENCES event (id),
+    interaction_type VARCHAR(50) NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE {timestamp_null},
+    interaction_metadata JSONB
+'''
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    # Range partitioning is PostgreSQL only; SQLite keeps the plain table
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    bind = op.get_bind()
+    op.execute("UPDATE user_event_interactions SET timestamp = timezone('utc', now()) WHERE timestamp IS NULL")
+    op.execute('ALTER TABLE user_event_interactions RENAME TO user_event_interactions_unpartitioned')
+    op.execute('ALTER TABLE user_event_interactions_unpartitioned '
+               'RENAME CONSTRAINT user_event_interactions_pkey TO user_event_interactions_unpartitioned_pkey')
+
+    # The partition key has to be part of the primary key
+    op.execute(
+        'CREATE TABLE user_event_interactions ('
+        + COLUMNS.format(timestamp_null='NOT NULL')
+        + ', PRIMARY KEY (id, timestamp)) PARTITION BY RANGE (timestamp)'
+    )
+    op.execute('ALTER SEQUENCE user_event_interactions_id_seq OWNED BY user_event_interactions.id')
+    op.execute('CREATE TABLE user_event_interactions_default PARTITION OF user_event_interactions DEFAULT')
+
+    now = datetime.utcnow()
+    oldest = bind.execute(sa.text('SELECT min(timestamp) FROM user_event_interactions_unpartitioned')).scalar() or now
+    month = datetime(oldest.year, oldest.month, 1)
+    last = _add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        following = _add_months(month, 1)
+        op.execute(
+            f'CREATE TABLE user_event_interactions_y{month.year:04d}m{month.month:02d} '
+            f'PARTITION OF user_event_interactions '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        month = following
+
+    op.execute('INSERT INTO user_event_interactions SELECT * FROM user_event_interactions_unpartitioned')
+    op.execute('DROP TABLE user_event_interactions_unpartitioned')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('ALTER TABLE user_event_interactions RENAME TO user_event_interactions_partitioned')
+    op.execute('ALTER TABLE user_event_interactions_partitioned '
+               'RENAME CONSTRAINT user_event_interactions_pkey TO user_event_interactions_partitioned_pkey')
+    op.execute(
+        'CREATE TABLE user_event_interactions ('
+        + COLUMNS.format(timestamp_null='NULL')
+        + ', PRIMARY KEY (id))'
+    )
+    op.execute('ALTER SEQUENCE user_event_interactions_id_seq OWNED BY user_event_interactions.id')
+    op.execute('INSERT INTO user_event_interactions SELECT * FROM user_event_interactions_partitioned')
+    # Dropping the parent drops every partition with it
+    op.execute('DROP TABLE user_event_interactions_partitioned')
@@ -0,0 +1,156 @@
+# tests/conftest.py
+"""
+Shared fixtures: the application bound to an in-memory SQLite database, seeded with
+the same fake data generator as `flask seed-db`, and a local SerpApi stand-in.
+"""
+import json
+import os
+import random
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# The app reads its configuration at import time. A named shared-cache in-memory database
+# gives every pooled connection (and so every thread) its own connection to the same data.
+DATABASE_URI = 'file:eventflow-tests?mode=memory&cache=shared'
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_URI}&uri=true'
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('AI_API', 'http://127.0.0.1:9')
+os.environ.setdefault('SERPAPI_KEY', 'test')
+os.environ['EVENT_SEARCH_CACHE_PATH'] = ''
+os.environ['GEOCODE_CACHE_PATH'] = ''
+os.environ['GEOCODER_NOMINATIM'] = '0'
+os.environ['INTERACTION_BUFFER_ENABLED'] = 'false'
+os.environ['TRENDING_REFRESH_INTERVAL'] = '0'
+
+import sqlite3
+
+import pytest
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+
+@compiles(JSONB, 'sqlite')
+def _compile_jsonb_for_sqlite(type_, compiler, **kwargs):
+    # SQLite has no JSONB; its JSON type stores the same documents
+    return 'JSON'
+
+
+# The database lives as long as one connection to it is open
+_keep_alive = sqlite3.connect(DATABASE_URI, uri=True)
+
+with warnings.catch_warnings():
+    # SQLAlchemy picks SingletonThreadPool (a connection per thread) for this URL, which
+    # is what the concurrency tests need; it warns that the default will change
+    warnings.filterwarnings('ignore', message='Selection of the SingletonThreadPool')
+    from webapp import commands
+    from webapp.app import app as flask_app
+    from webapp.models import db
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The application, with a fresh schema for the test session"""
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.create_all()
+    yield flask_app
+
+
+@pytest.fixture
+def empty_db(app):
+    """An app context on an empty schema"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def seeded_db(empty_db):
+    """An app context on a database seeded with 40 users and 30 events"""
+    random.seed(1)
+    commands.fake.seed_instance(1)
+    commands.seed_database(40, 30)
+    empty_db.session.commit()
+    return empty_db
+
+
+@pytest.fixture
+def client(app):
+    """Test client for the app"""
+    return app.test_client()
+
+
+class SerpApiStub:
+    """
+    A minimal SerpApi /search endpoint on localhost. Every search is answered with one
+    event after `delay` seconds unless respond() set something else for its location;
+    `received` lists the query strings in arrival order.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = []
+        self.responses = {}
+        stub = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.received.append(self.path)
+                location = parse_qs(urlparse(self.path).query).get('location', [None])[0]
+                count, delay = stub.responses.get(location, (1, stub.delay))
+                time.sleep(delay)
+                body = json.dumps({'events_results': [
+                    {'title': f'Stub event {len(stub.received)}.{index}', 'date': {'start_date': 'Oct 20'},
+                     'address': [location or 'Nairobi']}
+                    for index in range(count)
+                ]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.url = f'http://127.0.0.1:{self._server.server_port}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def respond(self, location, events=1, delay=None):
+        """Answer searches for `location` with `events` events after `delay` seconds"""
+        self.responses[location] = (events, self.delay if delay is None else delay)
+
+    def locations_received(self):
+        """The location parameter of every received search, in arrival order"""
+        return [parse_qs(urlparse(path).query).get('location', [None])[0] for path in self.received]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class NoCoalescing:
+    """SingleFlight stand-in that runs every call (the behaviour before coalescing)"""
+
+    def do(self, key, fn, recheck=None):
+        return fn()
+
+
+@pytest.fixture
+def serpapi_stub():
+    """A SerpApi stub answering each search after 0.3 seconds"""
+    stub = SerpApiStub(0.3)
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def no_coalescing():
+    """A single-flight stand-in that lets every identical search through"""
+    return NoCoalescing()
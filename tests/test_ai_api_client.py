@@ -0,0 +1,79 @@
+# tests/test_ai_api_client.py
+import time
+
+import pytest
+import requests
+
+from webapp.ai_api_client import RecommendationAPIClient, CircuitBreaker, CircuitOpenError
+from webapp.stub_ai_api import StubAIServer
+
+
+@pytest.fixture
+def stub():
+    server = StubAIServer(failure_rate=1.0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def make_client(stub, recovery_timeout=0.2):
+    return RecommendationAPIClient(
+        stub.url, max_retries=0, backoff=0,
+        breaker=CircuitBreaker(failure_threshold=2, recovery_timeout=recovery_timeout)
+    )
+
+
+def test_breaker_opens_after_consecutive_failures(stub):
+    client = make_client(stub, recovery_timeout=60)
+
+    for _ in range(2):
+        assert client.post('/api/recommendations', json={}).status_code == 503
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        client.post('/api/recommendations', json={})
+    assert stub.request_count == 2
+
+
+def test_half_open_trial_closes_or_reopens_the_circuit(stub):
+    client = make_client(stub)
+    for _ in range(2):
+        client.post('/api/recommendations', json={})
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.25)
+    assert client.post('/api/recommendations', json={}).status_code == 503
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    stub.failure_rate = 0.0
+    time.sleep(0.25)
+    assert client.post('/api/recommendations', json={'events': []}).status_code == 200
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.breaker.failures == 0
+
+
+def test_unexpected_error_in_half_open_trial_reopens_the_circuit(stub):
+    client = make_client(stub)
+    for _ in range(2):
+        client.post('/api/recommendations', json={})
+
+    time.sleep(0.25)
+    with pytest.raises(TypeError):
+        client.post('/api/recommendations', unknown_argument=True)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # The failed trial must not block the next one
+    stub.failure_rate = 0.0
+    time.sleep(0.25)
+    assert client.post('/api/recommendations', json={'events': []}).status_code == 200
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_connection_errors_count_as_failures():
+    client = RecommendationAPIClient(
+        'http://127.0.0.1:9', max_retries=0, backoff=0,
+        breaker=CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    )
+    with pytest.raises(requests.ConnectionError):
+        client.post('/api/recommendations', json={})
+    assert client.breaker.state == CircuitBreaker.OPEN
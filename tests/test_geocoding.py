@@ -0,0 +1,79 @@
+# tests/test_geocoding.py
+import os
+import shutil
+import sqlite3
+
+from webapp import geocoding
+from webapp.geocoding import BUNDLED_CITIES, GeocodeCache, ReverseGeocoder, geohash, read_stamp
+
+
+def test_index_is_rebuilt_when_its_source_changes(tmp_path):
+    source = tmp_path / 'cities.csv'
+    shutil.copy(BUNDLED_CITIES, source)
+    data_dir = str(tmp_path / 'geocoder')
+
+    geocoder = ReverseGeocoder(data_dir, source=str(source), nominatim=False)
+    assert geocoder.nearest_city(-1.2864, 36.8172)['city'] == 'Nairobi'
+    assert read_stamp(data_dir)['source'] == str(source)
+
+    # Touching the table without changing it keeps the index
+    os.utime(source, ns=(0, 0))
+    built_at = os.stat(os.path.join(data_dir, 'points.npy')).st_mtime_ns
+    ReverseGeocoder(data_dir, source=str(source), nominatim=False).load()
+    assert os.stat(os.path.join(data_dir, 'points.npy')).st_mtime_ns == built_at
+
+    source.write_text(source.read_text().replace('Nairobi,Nairobi,KE', 'Nairobi City,Nairobi,KE'))
+    geocoder = ReverseGeocoder(data_dir, source=str(source), nominatim=False)
+    assert geocoder.nearest_city(-1.2864, 36.8172)['city'] == 'Nairobi City'
+
+
+def test_only_nominatim_answers_are_cached(tmp_path, monkeypatch):
+    path = str(tmp_path / 'geocode.sqlite3')
+    cache = GeocodeCache(path=path)
+    geocoder = ReverseGeocoder(str(tmp_path / 'geocoder'), cache=cache)
+    monkeypatch.setattr(geocoding, 'nominatim_reverse', lambda lat, lng, timeout: 'Mid-Atlantic')
+
+    assert geocoder.resolve(-1.2864, 36.8172) == 'Nairobi'
+    assert geocoder.resolve(0.0, -30.0) == 'Mid-Atlantic'
+    assert geocoder.resolve(0.0, -30.0) == 'Mid-Atlantic'
+
+    assert geocoder.stats()['nominatim_calls'] == 1
+    with sqlite3.connect(path) as connection:
+        keys = [key for key, in connection.execute('SELECT key FROM geocode_cache')]
+    assert keys == [f'reverse:{geohash(0.0, -30.0)}']
+
+
+def test_unreadable_cache_falls_through_to_the_lookup(tmp_path):
+    path = str(tmp_path / 'geocode.sqlite3')
+    cache = GeocodeCache(path=path)
+    with sqlite3.connect(path) as connection:
+        connection.execute('DROP TABLE geocode_cache')
+
+    assert cache.get_or_lookup('forward:nairobi', lambda: [-1.2864, 36.8172]) == [-1.2864, 36.8172]
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['persistent_errors'] == 2
+
+
+def test_cache_file_is_shared_by_nearby_points_and_across_restarts(tmp_path):
+    path = str(tmp_path / 'geocode.sqlite3')
+    calls = []
+
+    def lookup(lat, lng):
+        calls.append((lat, lng))
+        return 'Mid-Atlantic'
+
+    # Both points lie in the same ~1.2 x 0.6 km geohash cell
+    assert geohash(0.0, -30.0) == geohash(0.002, -29.998)
+    cache = GeocodeCache(path=path)
+    assert cache.reverse(0.0, -30.0, lookup) == 'Mid-Atlantic'
+    assert cache.reverse(0.002, -29.998, lookup) == 'Mid-Atlantic'
+    assert len(calls) == 1
+
+    restarted = GeocodeCache(path=path)
+    assert restarted.reverse(0.001, -29.999, lookup) == 'Mid-Atlantic'
+    assert len(calls) == 1
+    stats = restarted.stats()
+    assert (stats['persistent_hits'], stats['misses']) == (1, 0)
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM geocode_cache').fetchone() == (1,)
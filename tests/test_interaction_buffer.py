@@ -0,0 +1,56 @@
+# tests/test_interaction_buffer.py
+from datetime import datetime
+
+from webapp import app as app_module
+from webapp.interaction_buffer import InteractionBuffer
+from webapp.models import db, Event, User, UserEventInteraction
+
+
+def interaction(user_id, event_id, interaction_type='view', metadata=None):
+    return {
+        'user_id': user_id,
+        'event_id': event_id,
+        'interaction_type': interaction_type,
+        'timestamp': datetime.utcnow(),
+        'interaction_metadata': metadata
+    }
+
+
+def test_flush_isolates_rows_that_cannot_be_written(app, seeded_db):
+    user_id = db.session.query(User.id).first()[0]
+    event_id = db.session.query(Event.id).first()[0]
+    before = UserEventInteraction.query.count()
+    db.session.commit()
+
+    buffer = InteractionBuffer(app, batch_size=4, flush_interval=3600)
+    written = []
+    buffer.add_listener(written.extend)
+    rows = [interaction(user_id, event_id) for _ in range(9)]
+    rows[2] = interaction(None, event_id)
+    rows[7] = interaction(user_id, event_id, metadata={'unserializable': object()})
+    for row in rows:
+        buffer.add(row)
+
+    assert buffer.flush() == 7
+    assert buffer.stats()['dead_letters'] == 2
+    assert buffer.stats()['pending'] == 0
+    assert len(written) == 7
+    assert UserEventInteraction.query.count() == before + 7
+    assert buffer.flush() == 0
+
+
+def test_recommendations_are_invalidated_after_the_flush_commits(app, seeded_db):
+    user_id = db.session.query(User.id).first()[0]
+    event_id = db.session.query(Event.id).first()[0]
+    db.session.commit()
+
+    cache = app_module.recommendation_cache
+    buffer = InteractionBuffer(app, flush_interval=3600)
+    buffer.add_listener(app_module.invalidate_recommendations)
+    cache.set(user_id, [(event_id, 1.0)])
+
+    buffer.add(interaction(user_id, event_id, 'join'))
+    assert cache.get(user_id) is not None
+
+    buffer.flush()
+    assert cache.get(user_id) is None
@@ -0,0 +1,30 @@
+# tests/test_listing_routes.py
+from webapp import commands
+from webapp.benchmarks import LISTING_ROUTES, busiest_attendee, count_route_queries
+from webapp.models import db
+
+# Same budget as `flask count-route-queries --max-statements 5`
+MAX_STATEMENTS = 5
+
+
+def statement_counts(app, user_id):
+    counts = {}
+    for route, response, statements in count_route_queries(app, user_id):
+        assert response.status_code == 200, route
+        counts[route] = len(statements)
+    return counts
+
+
+def test_listing_routes_issue_a_bounded_number_of_statements(app, seeded_db):
+    user_id = busiest_attendee()
+    db.session.commit()
+    before = statement_counts(app, user_id)
+    assert set(before) == set(LISTING_ROUTES)
+    assert max(before.values()) <= MAX_STATEMENTS
+
+    # Twice the users and events, with their attendances and interactions
+    commands.seed_database(40, 30)
+    db.session.commit()
+    after = statement_counts(app, user_id)
+
+    assert after == before
@@ -0,0 +1,39 @@
+# tests/test_popularity.py
+import pytest
+
+from webapp.benchmarks import run_concurrently
+from webapp.models import db, Event
+from webapp.popularity import apply_popularity_deltas, add_sharded_popularity_deltas, fold_popularity_shards
+
+
+@pytest.mark.parametrize('shards', [0, 4])
+def test_concurrent_boosts_are_not_lost(app, seeded_db, shards):
+    threads, joins = 8, 25
+    boost = 0.5 / (threads * joins)
+    event_id = db.session.query(Event.id).first()[0]
+    Event.query.filter_by(id=event_id).update({'event_popularity': 0.0})
+    db.session.commit()
+
+    def join():
+        if shards:
+            add_sharded_popularity_deltas({event_id: boost}, shards)
+        else:
+            apply_popularity_deltas({event_id: boost})
+        db.session.commit()
+
+    run_concurrently(app, join, threads, joins, attempts=200)
+    if shards:
+        assert fold_popularity_shards() == 1
+
+    db.session.expire_all()
+    assert db.session.get(Event, event_id).event_popularity == pytest.approx(0.5)
+
+
+def test_boosts_are_capped(seeded_db):
+    event_id = db.session.query(Event.id).first()[0]
+    Event.query.filter_by(id=event_id).update({'event_popularity': 0.99})
+    apply_popularity_deltas({event_id: 0.05})
+    db.session.commit()
+
+    db.session.expire_all()
+    assert db.session.get(Event, event_id).event_popularity == 1.0
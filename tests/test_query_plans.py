@@ -0,0 +1,23 @@
+# tests/test_query_plans.py
+from webapp.commands import check_query_plans_command
+from webapp.models import db, Event, User
+from webapp.query_plans import check_query_plans, hot_queries
+
+
+def test_every_hot_query_uses_its_index(seeded_db):
+    user_id = db.session.query(User.id).limit(1).scalar()
+    event_id = db.session.query(Event.id).limit(1).scalar()
+
+    results = check_query_plans(user_id, event_id)
+
+    assert len(results) == len(hot_queries())
+    missing = {name: plan for name, _, used_index, plan in results if used_index is None}
+    assert not missing
+
+
+def test_check_query_plans_command_fails_without_an_index(app, seeded_db):
+    db.session.execute(db.text('DROP INDEX ix_event_organizer_id'))
+    db.session.commit()
+    result = app.test_cli_runner().invoke(check_query_plans_command)
+    assert result.exit_code == 1
+    assert 'MISSING  events of an organizer' in result.output
@@ -0,0 +1,23 @@
+# tests/test_recommendation_payload.py
+import numpy as np
+
+from webapp.recommendation_payload import encode_request, decode_request, FORMAT_MSGPACK
+
+
+def test_columnar_payload_keeps_missing_integers_distinct_from_zero():
+    events = [
+        {'id': 1, 'title': 'Today', 'days_until_event': 0, 'date': '2026-10-18T20:00:00', 'category': 'music'},
+        {'id': 2, 'title': 'Undated', 'days_until_event': None, 'date': None, 'category': 'music'},
+        {'id': 3, 'title': 'Later', 'days_until_event': 12, 'date': '2026-10-30T20:00:00', 'latitude': None},
+    ]
+    body, content_type = encode_request({'user': {'id': 7}, 'events': events}, FORMAT_MSGPACK)
+    decoded = decode_request(body, content_type)['events']
+
+    days = decoded['days_until_event']
+    assert np.ma.is_masked(days)
+    assert days.tolist() == [0, None, 12]
+    assert decoded['id'].tolist() == [1, 2, 3]
+    assert not np.ma.isMaskedArray(decoded['id'])
+    assert np.isnan(decoded['latitude']).all()
+    assert decoded['date'].tolist()[1] == -1
+    assert decoded['category'] == ['music', 'music', None]
@@ -0,0 +1,145 @@
+# tests/test_recommendation_service.py
+import math
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from webapp import event_features
+from webapp.app import recommendation_service
+from webapp.benchmarks import recorded_statements
+from webapp.collaborative_filtering import SparseCFEngine, SCORE_TIE_DECIMALS
+from webapp.models import db, Event, User, UserEventInteraction
+
+
+def test_events_payload_query_count_does_not_grow_with_events(seeded_db):
+    user = db.session.query(User).first()
+    events = Event.query.order_by(Event.id).all()
+    assert len(events) >= 20
+
+    counts = []
+    for subset in (events[:5], events):
+        db.session.expire_all()
+        subset = Event.query.filter(Event.id.in_([event.id for event in subset])).all()
+        with recorded_statements() as statements:
+            payload = recommendation_service._build_events_payload(user, subset)
+        assert [item['id'] for item in payload] == [event.id for event in subset]
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
+    assert counts[1] <= 2
+
+
+def dense_cosine_ranking(user_id):
+    """The pivot-table user-user CF this service used before the sparse engine, as reference"""
+    interactions = db.session.query(
+        UserEventInteraction.user_id, UserEventInteraction.event_id, UserEventInteraction.interaction_type
+    ).all()
+    user_ids = sorted({row[0] for row in interactions})
+    event_ids = sorted({row[1] for row in interactions})
+    sums = np.zeros((len(user_ids), len(event_ids)))
+    counts = np.zeros_like(sums)
+    for other_id, event_id, interaction_type in interactions:
+        cell = user_ids.index(other_id), event_ids.index(event_id)
+        sums[cell] += {'view': 0.5, 'click': 0.7, 'join': 1.0, 'bookmark': 1.0}.get(interaction_type, 1.0)
+        counts[cell] += 1
+    matrix = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+    vector = matrix[user_ids.index(user_id)]
+    similarities = []
+    for other_id, other in zip(user_ids, matrix):
+        if other_id != user_id:
+            similarity = vector.dot(other) / (np.linalg.norm(vector) * np.linalg.norm(other))
+            if similarity > 0:
+                similarities.append((other_id, similarity))
+    # Documented tie-break: equal similarities by ascending user id
+    similarities.sort(key=lambda item: (-round(item[1], SCORE_TIE_DECIMALS), item[0]))
+    neighbours = dict(similarities[:10])
+
+    own_events = {event_id for other_id, event_id, _ in interactions if other_id == user_id}
+    scores, score_counts = {}, {}
+    for other_id, event_id, interaction_type in interactions:
+        if other_id in neighbours and event_id not in own_events:
+            weight = {'view': 0.3, 'click': 0.5, 'join': 1.0, 'bookmark': 0.8}.get(interaction_type, 0.5)
+            scores[event_id] = scores.get(event_id, 0.0) + weight * neighbours[other_id]
+            score_counts[event_id] = score_counts.get(event_id, 0) + 1
+    ranked = sorted(
+        ((event_id, min(score / score_counts[event_id], 1.0)) for event_id, score in scores.items()),
+        key=lambda item: (-round(item[1], SCORE_TIE_DECIMALS), item[0])
+    )
+    return list(neighbours), ranked
+
+
+def test_sparse_user_similarity_matches_the_dense_cosine_ranking(seeded_db):
+    events = Event.query.all()
+    interactions = db.session.query(
+        UserEventInteraction.user_id, UserEventInteraction.event_id, UserEventInteraction.interaction_type
+    ).all()
+    engine = SparseCFEngine.from_interactions(interactions)
+
+    user_ids = sorted({row[0] for row in interactions})
+    assert len(user_ids) >= 30
+    for user_id in user_ids:
+        neighbours, ranked = dense_cosine_ranking(user_id)
+        assert [other_id for other_id, _ in engine.similar_users(user_id, k=10)] == neighbours
+
+        user = db.session.get(User, user_id)
+        recommendations = recommendation_service._get_user_similarity_recommendations(user, events)
+        assert [rec['event'].id for rec in recommendations] == [event_id for event_id, _ in ranked]
+        assert [rec['score'] for rec in recommendations] == pytest.approx([score for _, score in ranked])
+
+
+def reference_fallback(user, events, excluded, count, now):
+    """The per-event fallback scoring loop the vectorized version replaced"""
+    interests = recommendation_service._create_interest_map(recommendation_service._get_user_interests(user.id))
+
+    def interest_match(event):
+        if not interests['categories'] and not interests['subcategories']:
+            return 0.5
+        if event.subcategory and event.subcategory.lower() in interests['subcategories']:
+            return 1.0
+        if event.category and event.category.lower() in interests['categories']:
+            return 0.8
+        description = (event.description or '').lower()
+        if description and any(subcategory in description for subcategory in interests['subcategories']):
+            return 0.6
+        if description and any(category in description for category in interests['categories']):
+            return 0.5
+        return 0.3
+
+    scored = []
+    for event in events:
+        if event.id in excluded:
+            continue
+        days_since_creation = (now - event.created_at).days if event.created_at else 365
+        score = (
+            0.4 * interest_match(event) +
+            0.3 * float(event.event_popularity or 0.5) +
+            0.3 * math.exp(-0.05 * days_since_creation)
+        )
+        scored.append((event.id, score))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:count]
+
+
+def test_vectorized_fallback_ranks_like_the_per_event_loop(seeded_db, monkeypatch):
+    # Both sides must floor event ages against the same instant, or an age that sits
+    # on a whole-day boundary rounds differently between the two calls
+    now = datetime.utcnow()
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    monkeypatch.setattr(event_features, 'datetime', FrozenDatetime)
+    events = Event.query.order_by(Event.id).all()
+    existing = [{'event': event} for event in events[:3]]
+    excluded = {event.id for event in events[:3]}
+
+    for user in User.query.all():
+        for count in (5, 10):
+            expected = reference_fallback(user, events, excluded, count, now)
+            recommendations = recommendation_service._get_fallback_recommendations(user, events, existing, count)
+            assert [rec['event'].id for rec in recommendations] == [event_id for event_id, _ in expected]
+            assert [rec['score'] for rec in recommendations] == pytest.approx([score for _, score in expected])
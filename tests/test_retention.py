@@ -0,0 +1,38 @@
+# tests/test_retention.py
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from webapp.models import db, InteractionSummary, UserEventInteraction
+from webapp.retention import InteractionCompactor, write_archive
+
+
+def test_failed_archive_write_leaves_no_partial_file(seeded_db, tmp_path):
+    rows = UserEventInteraction.query.limit(3).all()
+    rows[1].interaction_metadata = {'unserializable': object()}
+    path = str(tmp_path / 'batch.jsonl.gz')
+
+    with pytest.raises(TypeError):
+        write_archive(rows, path)
+
+    assert os.listdir(tmp_path) == []
+    db.session.rollback()
+
+
+def test_compaction_archives_under_the_instance_folder_and_keeps_summaries(app, seeded_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'instance_path', str(tmp_path))
+    old = datetime.utcnow() - timedelta(days=400)
+    UserEventInteraction.query.filter_by(interaction_type='view').update({'timestamp': old})
+    views = UserEventInteraction.query.filter_by(interaction_type='view').count()
+    db.session.commit()
+    assert views
+
+    compactor = InteractionCompactor()
+    assert compactor.archive_dir == str(tmp_path / 'archive')
+    removed = compactor.run(log=lambda message: None)
+
+    assert removed['view'] == views
+    assert UserEventInteraction.query.filter_by(interaction_type='view').count() == 0
+    assert db.session.query(db.func.sum(InteractionSummary.interaction_count)).scalar() == views
+    assert os.listdir(tmp_path / 'archive')
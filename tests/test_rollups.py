@@ -0,0 +1,76 @@
+# tests/test_rollups.py
+from datetime import datetime, timedelta
+
+from webapp.benchmarks import benchmark_ingestion_command, recorded_statements
+from webapp.models import db, Event, InteractionRollup, UserEventInteraction
+from webapp.rollups import backfill_rollups, rebuild_starts
+
+
+def rollup_snapshot():
+    return {
+        (rollup.event_id, rollup.interaction_type, rollup.bucket): rollup.count
+        for rollup in InteractionRollup.query
+    }
+
+
+def test_backfill_keeps_rollups_of_compacted_interactions(seeded_db):
+    before = rollup_snapshot()
+    assert before
+
+    # Compact every impression and view older than two days (mid-hour cutoff)
+    cutoff = datetime.utcnow().replace(minute=30) - timedelta(days=2)
+    compacted = UserEventInteraction.query.filter(
+        UserEventInteraction.interaction_type.in_(['impression', 'view']),
+        UserEventInteraction.timestamp < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    assert compacted
+
+    starts = rebuild_starts()
+    assert starts['view'] >= cutoff.replace(minute=0)
+    backfill_rollups()
+
+    assert rollup_snapshot() == before
+
+
+def test_backfill_rebuilds_missing_rollups(seeded_db):
+    before = rollup_snapshot()
+    InteractionRollup.query.delete()
+    db.session.commit()
+
+    backfill_rollups()
+
+    assert rollup_snapshot() == before
+
+
+def test_benchmark_ingestion_leaves_no_trace(app, seeded_db):
+    rollups = rollup_snapshot()
+    events = {
+        event.id: (event.event_popularity, event.recent_interaction_count)
+        for event in Event.query
+    }
+    interactions = UserEventInteraction.query.count()
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(benchmark_ingestion_command, ['--requests', '60', '--threads', '1'])
+    assert result.exit_code == 0, result.output
+
+    db.session.expire_all()
+    assert UserEventInteraction.query.count() == interactions
+    assert rollup_snapshot() == rollups
+    assert {
+        event.id: (event.event_popularity, event.recent_interaction_count)
+        for event in Event.query
+    } == events
+
+
+def test_interaction_writes_do_not_update_events(seeded_db):
+    user_id = db.session.query(UserEventInteraction.user_id).limit(1).scalar()
+    event_id = db.session.query(Event.id).limit(1).scalar()
+
+    with recorded_statements() as statements:
+        db.session.add(UserEventInteraction(user_id=user_id, event_id=event_id, interaction_type='view'))
+        db.session.commit()
+
+    assert any('interaction_rollups' in statement for statement in statements)
+    assert not any(statement.lstrip().upper().startswith('UPDATE EVENT') for statement in statements)
@@ -0,0 +1,149 @@
+# tests/test_search_cache.py
+import sqlite3
+import time
+
+import pytest
+
+from webapp.serpAPIService import SearchResultCache, SearchError
+
+PARAMS = {'engine': 'google_events', 'q': 'Events in Berlin', 'htichips': 'date:week'}
+
+
+class CountingFetch:
+    """fetch() stand-in returning fixed events and counting its calls"""
+
+    def __init__(self, events):
+        self.events = events
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.events
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Shift time.time and time.monotonic forward by clock.advance(seconds)"""
+    class Clock:
+        offset = 0.0
+
+        def advance(self, seconds):
+            self.offset += seconds
+
+    fake = Clock()
+    real_time, real_monotonic = time.time, time.monotonic
+    monkeypatch.setattr(time, 'time', lambda: real_time() + fake.offset)
+    monkeypatch.setattr(time, 'monotonic', lambda: real_monotonic() + fake.offset)
+    return fake
+
+
+def test_equivalent_searches_share_one_entry():
+    cache = SearchResultCache()
+    fetch = CountingFetch([{'title': 'Concert'}])
+    variants = [
+        {'q': 'Jazz events in Nairobi', 'location': '-1.28641,36.81721', 'api_key': 'first'},
+        {'q': '  jazz EVENTS in   nairobi ', 'location': '-1.2864, 36.8172', 'api_key': 'second'},
+        {'q': 'JAZZ events in Nairobi', 'location': ' -1.2881,36.8199 ', 'api_key': 'third'},
+    ]
+
+    for params in variants:
+        assert cache.get_or_fetch(params, fetch) == [{'title': 'Concert'}]
+
+    assert fetch.calls == 1
+    stats = cache.stats()
+    assert (stats['misses'], stats['memory_hits']) == (1, 2)
+
+    # A different rounded coordinate is a different search
+    cache.get_or_fetch(dict(variants[0], location='-1.30,36.81'), fetch)
+    assert fetch.calls == 2
+
+
+def test_repeated_search_is_a_memory_hit():
+    cache = SearchResultCache()
+    fetch = CountingFetch([{'title': 'Concert'}])
+
+    cache.get_or_fetch(PARAMS, fetch)
+    cache.get_or_fetch(PARAMS, fetch)
+
+    stats = cache.stats()
+    assert fetch.calls == 1
+    assert (stats['misses'], stats['memory_hits'], stats['api_fetches']) == (1, 1, 1)
+    assert stats['hit_ratio'] == 0.5
+    assert stats['quota_saved'] == 1
+
+
+def test_new_cache_on_the_same_file_hits_the_persistent_tier(tmp_path):
+    path = str(tmp_path / 'search.db')
+    SearchResultCache(path=path).get_or_fetch(PARAMS, CountingFetch([{'title': 'Concert'}]))
+
+    restarted = SearchResultCache(path=path)
+    fetch = CountingFetch([{'title': 'Other'}])
+    assert restarted.get_or_fetch(PARAMS, fetch) == [{'title': 'Concert'}]
+    assert restarted.get_or_fetch(PARAMS, fetch) == [{'title': 'Concert'}]
+
+    stats = restarted.stats()
+    assert fetch.calls == 0
+    # The first read is promoted into memory, which answers the second
+    assert (stats['persistent_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 0)
+
+
+def test_fresh_lifetime_depends_on_the_date_chip(clock):
+    cache = SearchResultCache(stale_factor=0)
+    today = dict(PARAMS, htichips='date:today')
+    upcoming = dict(PARAMS, htichips='date:upcoming')
+    fetch = CountingFetch([{'title': 'Concert'}])
+    cache.get_or_fetch(today, fetch)
+    cache.get_or_fetch(upcoming, fetch)
+
+    clock.advance(20 * 60)
+    cache.get_or_fetch(today, fetch)
+    cache.get_or_fetch(upcoming, fetch)
+    assert fetch.calls == 3
+
+    clock.advance(12 * 3600)
+    cache.get_or_fetch(upcoming, fetch)
+    assert fetch.calls == 4
+    assert cache.stats()['memory_hits'] == 1
+
+
+def test_unreadable_persistent_tier_is_a_miss(tmp_path):
+    path = str(tmp_path / 'search.db')
+    cache = SearchResultCache(path=path)
+    with sqlite3.connect(path) as connection:
+        connection.execute('DROP TABLE search_results')
+
+    assert cache.get_or_fetch(PARAMS, lambda: [{'title': 'Concert'}]) == [{'title': 'Concert'}]
+    stats = cache.stats()
+    assert stats['misses'] == 1
+    # The read and the write both failed
+    assert stats['persistent_errors'] == 2
+
+
+def test_empty_results_expire_quickly(clock):
+    cache = SearchResultCache(empty_ttl=60)
+    found = dict(PARAMS, q='Events in Paris')
+    cache.get_or_fetch(PARAMS, lambda: [])
+    cache.get_or_fetch(found, lambda: [{'title': 'Opera'}])
+
+    clock.advance(61)
+    assert cache.fresh(PARAMS) is None
+    assert cache.fresh(found) == [{'title': 'Opera'}]
+
+
+def test_failed_refreshes_are_not_counted_as_saved_quota(clock):
+    cache = SearchResultCache()
+    cache.get_or_fetch(PARAMS, lambda: [{'title': 'Concert'}])
+    clock.advance(3 * 3600 + 1)
+
+    def failing_fetch():
+        raise SearchError('quota exceeded')
+
+    assert cache.get_or_fetch(PARAMS, failing_fetch) == [{'title': 'Concert'}]
+    deadline = time.monotonic() + 5
+    while cache.stats()['refresh_errors'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stats = cache.stats()
+    assert stats['stale_hits'] == 1
+    assert stats['refresh_errors'] == 1
+    assert stats['quota_saved'] == 0
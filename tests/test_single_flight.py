@@ -0,0 +1,116 @@
+# tests/test_single_flight.py
+from concurrent.futures import ThreadPoolExecutor
+
+from webapp.serpAPIService import EventService, SearchResultCache, SingleFlight
+
+CALLERS = 8
+
+
+def search_concurrently(services):
+    with ThreadPoolExecutor(max_workers=len(services)) as executor:
+        return list(executor.map(lambda service: service.search_events('jazz', 'Nairobi'), services))
+
+
+def test_uncoalesced_searches_each_reach_the_api(serpapi_stub, no_coalescing):
+    services = [
+        EventService('stub', single_flight=no_coalescing, backend=serpapi_stub.url) for _ in range(CALLERS)
+    ]
+
+    results = search_concurrently(services)
+
+    assert all(results)
+    assert len(serpapi_stub.received) == CALLERS
+
+
+def test_concurrent_identical_searches_make_one_request(serpapi_stub):
+    service = EventService('stub', single_flight=SingleFlight(), backend=serpapi_stub.url)
+
+    results = search_concurrently([service] * CALLERS)
+
+    assert len(serpapi_stub.received) == 1
+    assert all(events == results[0] for events in results)
+    assert results[0]
+    assert service.single_flight.stats()['coalesced'] == CALLERS - 1
+
+
+def test_file_locks_coalesce_across_services(serpapi_stub, tmp_path):
+    services = [
+        EventService(
+            'stub',
+            cache=SearchResultCache(path=str(tmp_path / 'search_cache.sqlite3')),
+            single_flight=SingleFlight(lock_dir=str(tmp_path / 'locks')),
+            backend=serpapi_stub.url
+        )
+        for _ in range(3)
+    ]
+
+    results = search_concurrently([services[index % 3] for index in range(CALLERS)])
+
+    assert len(serpapi_stub.received) == 1
+    assert all(results)
+
+
+def test_fallback_deadline_does_not_count_queue_time(serpapi_stub, no_coalescing):
+    service = EventService('stub', single_flight=no_coalescing, backend=serpapi_stub.url, fallback_workers=1)
+
+    # With one worker the second search waits 0.3s for the first, then runs for 0.3s
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(
+            lambda query: service.search_with_fallbacks(['Nairobi'], query=query, deadline=0.5),
+            ['jazz', 'theatre']
+        ))
+
+    assert all(location == 'Nairobi' and events for location, events in results)
+    stats = service.stats()
+    assert stats['deadline_exceeded'] == 0
+    assert stats['queued'] == 1
+    assert stats['max_queue_wait'] > 0.2
+    assert stats['pending'] == 0
+
+
+def test_fallback_skips_empty_higher_priority_locations(serpapi_stub, no_coalescing):
+    serpapi_stub.respond('Nairobi', events=0, delay=0.05)
+    serpapi_stub.respond('Mombasa', delay=0.2)
+    serpapi_stub.respond('Kisumu', delay=0.05)
+    service = EventService('stub', single_flight=no_coalescing, backend=serpapi_stub.url)
+
+    location, events = service.search_with_fallbacks(['Nairobi', 'Mombasa', 'Kisumu'], query='jazz', deadline=2)
+
+    assert location == 'Mombasa'
+    assert [event['address'] for event in events] == [['Mombasa']]
+    assert service.stats()['answered_by'] == {'1': 1}
+
+
+def test_fallback_waits_for_a_slow_higher_priority_location(serpapi_stub, no_coalescing):
+    serpapi_stub.respond('Nairobi', delay=0.4)
+    serpapi_stub.respond('Mombasa', delay=0.05)
+    service = EventService('stub', single_flight=no_coalescing, backend=serpapi_stub.url)
+
+    location, events = service.search_with_fallbacks(['Nairobi', 'Mombasa'], query='jazz', deadline=2)
+
+    assert location == 'Nairobi'
+    assert [event['address'] for event in events] == [['Nairobi']]
+    stats = service.stats()
+    assert stats['answered_by'] == {'0': 1}
+    assert stats['deadline_exceeded'] == 0
+
+
+def test_fallback_past_the_deadline_settles_for_the_best_finished_result(serpapi_stub, no_coalescing):
+    serpapi_stub.respond('Nairobi', delay=1.0)
+    serpapi_stub.respond('Mombasa', delay=0.05)
+    serpapi_stub.respond('Kisumu', delay=1.0)
+    serpapi_stub.respond('Nakuru', delay=0.05)
+    # Two workers: Kisumu starts once Mombasa is done, Nakuru is still queued at the deadline
+    service = EventService('stub', single_flight=no_coalescing, backend=serpapi_stub.url, fallback_workers=2)
+
+    location, events = service.search_with_fallbacks(
+        ['Nairobi', 'Mombasa', 'Kisumu', 'Nakuru'], query='jazz', deadline=0.3
+    )
+
+    assert location == 'Mombasa'
+    assert [event['address'] for event in events] == [['Mombasa']]
+    stats = service.stats()
+    assert stats['deadline_exceeded'] == 1
+    assert stats['cancelled'] == 1
+    assert stats['answered_by'] == {'1': 1}
+    assert 'Nakuru' not in serpapi_stub.locations_received()
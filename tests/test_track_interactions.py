@@ -0,0 +1,57 @@
+# tests/test_track_interactions.py
+import json
+
+import pytest
+
+from webapp.app import MAX_INTERACTIONS_PER_BATCH, MAX_INTERACTION_METADATA_BYTES
+from webapp.models import db, Event, User, UserEventInteraction
+
+
+@pytest.fixture
+def logged_in(client, seeded_db):
+    user_id = db.session.query(User.id).first()[0]
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return client
+
+
+def event_id():
+    return db.session.query(Event.id).first()[0]
+
+
+def test_batch_requires_a_json_content_type(logged_in):
+    before = UserEventInteraction.query.count()
+    body = json.dumps({'interactions': [{'event_id': event_id(), 'interaction_type': 'join'}]})
+
+    response = logged_in.post('/api/track_interactions', data=body, content_type='text/plain')
+
+    assert response.status_code == 415
+    assert UserEventInteraction.query.count() == before
+
+
+def test_batch_is_accepted_as_json(logged_in):
+    before = UserEventInteraction.query.count()
+    items = [{'event_id': event_id(), 'interaction_type': 'impression', 'metadata': {'source': 'home_page'}}] * 3
+
+    response = logged_in.post('/api/track_interactions', json={'interactions': items})
+
+    assert response.status_code == 202
+    assert response.get_json()['accepted'] == 3
+    db.session.expire_all()
+    assert UserEventInteraction.query.count() == before + 3
+
+
+def test_batch_rejects_oversized_batches_and_metadata(logged_in):
+    item = {'event_id': event_id(), 'interaction_type': 'view'}
+    response = logged_in.post('/api/track_interactions', json=[item] * (MAX_INTERACTIONS_PER_BATCH + 1))
+    assert response.status_code == 413
+
+    items = [
+        dict(item, metadata={'blob': 'x' * MAX_INTERACTION_METADATA_BYTES}),
+        dict(item, metadata='not an object'),
+        item,
+    ]
+    response = logged_in.post('/api/track_interactions', json=items)
+    assert response.status_code == 202
+    assert response.get_json() == {'success': True, 'accepted': 1, 'rejected': 2}
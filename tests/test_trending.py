@@ -0,0 +1,86 @@
+# tests/test_trending.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from webapp.models import db, InteractionRollup, UserEventInteraction
+from webapp.rollups import record_interaction_rollups
+from webapp.trending import TrendingLeaderboard
+
+
+def spread_interactions(days=20, count=400):
+    """Move the seeded interactions back over the last `days` days and rebuild the rollups"""
+    interactions = UserEventInteraction.query.order_by(UserEventInteraction.id).limit(count).all()
+    now = datetime.utcnow()
+    for index, interaction in enumerate(interactions):
+        interaction.timestamp = now - timedelta(minutes=index * days * 24 * 60 // count + 1)
+    db.session.query(InteractionRollup).delete()
+    db.session.flush()
+    record_interaction_rollups([
+        {'event_id': i.event_id, 'interaction_type': i.interaction_type, 'timestamp': i.timestamp}
+        for i in UserEventInteraction.query
+    ])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('days', [1, 3, 7, 30])
+def test_window_counts_match_the_rollups(seeded_db, days):
+    spread_interactions()
+    leaderboard = TrendingLeaderboard()
+    leaderboard.sync()
+
+    expected = InteractionRollup.window_counts(datetime.utcnow() - timedelta(days=days))
+    assert leaderboard.window_counts(days) == {event_id: count for event_id, count in expected.items() if count}
+
+
+def test_ingested_rows_are_not_counted_twice_by_the_next_sync(seeded_db):
+    spread_interactions()
+    leaderboard = TrendingLeaderboard()
+    leaderboard.sync()
+    event_id = UserEventInteraction.query.first().event_id
+    before = leaderboard.window_counts(1).get(event_id, 0)
+
+    rows = [
+        {'user_id': 1, 'event_id': event_id, 'interaction_type': 'view', 'timestamp': datetime.utcnow()}
+        for _ in range(3)
+    ]
+    db.session.execute(db.insert(UserEventInteraction), rows)
+    record_interaction_rollups(rows)
+    db.session.commit()
+
+    leaderboard.ingest(rows)
+    assert leaderboard.window_counts(1)[event_id] == before + 3
+    leaderboard.sync()
+    assert leaderboard.window_counts(1)[event_id] == before + 3
+    assert leaderboard.decayed_scores(5)
+
+
+def test_ingest_waits_for_the_initial_load(seeded_db):
+    leaderboard = TrendingLeaderboard()
+    leaderboard.ingest([{'event_id': 1, 'timestamp': datetime.utcnow()}])
+    assert not leaderboard.ready
+    assert leaderboard.stats()['events'] == 0
+
+
+def test_trending_route_answers_before_and_after_warm_up(client, seeded_db, monkeypatch):
+    from webapp import app as app_module
+
+    spread_interactions()
+    leaderboard = TrendingLeaderboard()
+    monkeypatch.setattr(app_module, 'trending_leaderboard', leaderboard)
+
+    cold = client.get('/api/trending_events?days=30&limit=5').get_json()['trending_events']
+    leaderboard.sync()
+    warm = client.get('/api/trending_events?days=30&limit=5').get_json()['trending_events']
+
+    assert cold
+    assert [event['id'] for event in cold] == [event['id'] for event in warm]
+    assert client.get('/api/trending_events?order=decayed').status_code == 200
+
+
+def test_trending_route_returns_nothing_for_a_non_positive_limit(client, seeded_db):
+    spread_interactions()
+    for limit in (0, -3):
+        response = client.get(f'/api/trending_events?days=30&limit={limit}')
+        assert response.status_code == 200
+        assert response.get_json() == {'trending_events': []}
@@ -0,0 +1,147 @@
+# webapp/ai_api_client.py
+"""
+HTTP client for the AI recommendation API.
+
+Keeps a pooled keep-alive session, uses separate connect and read timeouts, retries
+transient failures with jittered exponential backoff, and stops calling the API
+altogether while a circuit breaker considers it unhealthy, so callers can go straight
+to collaborative filtering and fallback recommendations.
+"""
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Statuses worth retrying; anything else is returned to the caller as-is
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker. After `failure_threshold` consecutive failures
+    the circuit opens for `recovery_timeout` seconds; then a single trial request is
+    let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+        """Create a closed circuit"""
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Check if a request may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """Count a failed call, opening the circuit when the threshold is reached"""
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        """Return the breaker state for monitoring"""
+        return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+class RecommendationAPIClient:
+    """Pooled, retrying, circuit-broken client for the AI recommendation API"""
+
+    def __init__(self, base_url, connect_timeout=2.0, read_timeout=10.0, max_retries=2,
+                 backoff=0.25, pool_size=10, breaker=None):
+        """Create the client and its connection pool"""
+        self.base_url = (base_url or '').rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        # Retries are handled below so they can cooperate with the circuit breaker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def health(self, timeout=2):
+        """Return True if the API health endpoint answers 200"""
+        try:
+            response = self.session.get(f"{self.base_url}/health", timeout=timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def post(self, path, **kwargs):
+        """
+        POST to the API, retrying connection errors, timeouts and retryable statuses.
+        Raises CircuitOpenError without sending anything while the API is unhealthy,
+        and requests.RequestException once retries are exhausted.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"AI API circuit is open; skipping {path}")
+
+        try:
+            return self._post_with_retries(path, **kwargs)
+        except BaseException:
+            # Anything unexpected (a bad argument, an interrupted sleep) still ends the
+            # attempt, otherwise a half-open breaker would wait for its trial forever
+            self.breaker.record_failure()
+            raise
+
+    def _post_with_retries(self, path, **kwargs):
+        """Run the attempt loop; returns the response or raises the last error"""
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                error = requests.HTTPError(f"AI API returned {response.status_code}", response=response)
+            except requests.RequestException as e:
+                error = e
+
+            if attempt >= self.max_retries:
+                if isinstance(error, requests.HTTPError):
+                    self.breaker.record_failure()
+                    return error.response
+                raise error
+
+            # Full jitter: sleep a random fraction of the exponential backoff
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+            attempt += 1
+
+    def stats(self):
+        """Return client health information for monitoring"""
+        return {'circuit_breaker': self.breaker.stats()}
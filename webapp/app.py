@@ -1,13 +1,21 @@
 # webapp/app.py
-from flask import Flask, jsonify, render_template, request, redirect, url_for, flash, json
+from flask import Flask, jsonify, render_template, request, redirect, url_for, flash, json, make_response
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import requests
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import os
 from webapp.recommendation_service import EnhancedRecommendationService
 from webapp.google_calendar import GoogleCalendarService
-from webapp.serpAPIService import EventService
+from webapp.serpAPIService import EventService, SearchResultCache, SingleFlight
+from webapp.geocoding import GeocodeCache, ReverseGeocoder
+from webapp.recommendation_cache import create_recommendation_cache
+from webapp.candidate_generation import CandidateGenerator
+from webapp.ai_api_client import RecommendationAPIClient, CircuitBreaker
+from webapp.interaction_buffer import InteractionBuffer, write_interactions
+from webapp.popularity import POPULARITY_BOOSTS
+from webapp.trending import TrendingLeaderboard
+from webapp import event_listings
+from webapp.cache import TTLCache
 import logging
 from flask import current_app
 import random
@@ -15,7 +23,7 @@ from faker import Faker
 from sqlalchemy import func, desc
 import math
 # Import models using relative imports
-from webapp.models import db, User, Event, UserInterests, EventAttendee, UserEventInteraction
+from webapp.models import db, User, Event, UserInterests, EventAttendee, UserEventInteraction, EventSimilarity, EventPopularityShard, InteractionRollup, InteractionSummary
 
 import os
 from pathlib import Path
@@ -43,6 +51,44 @@ db.init_app(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# SerpAPI search results are cached in process and in a SQLite file shared by the
+# workers (EVENT_SEARCH_CACHE_PATH empty keeps them in process only)
+event_search_cache = SearchResultCache(
+    path=os.getenv("EVENT_SEARCH_CACHE_PATH", os.path.join(app.instance_path, 'event_search_cache.sqlite3')),
+    max_entries=int(os.getenv("EVENT_SEARCH_CACHE_SIZE", 500)),
+    stale_factor=float(os.getenv("EVENT_SEARCH_CACHE_STALE_FACTOR", 1.0))
+)
+# Identical concurrent searches share one SerpAPI call; with EVENT_SEARCH_LOCK_DIR set
+# this also holds across worker processes on the same host
+event_search_flights = SingleFlight(lock_dir=os.getenv("EVENT_SEARCH_LOCK_DIR") or None)
+event_service = EventService(
+    os.getenv('SERPAPI_KEY'),
+    cache=event_search_cache,
+    single_flight=event_search_flights,
+    backend=os.getenv("SERPAPI_BACKEND") or None
+)
+# Seconds /api/events waits for its fallback chain of searches
+event_search_deadline = float(os.getenv("EVENT_SEARCH_DEADLINE", 10))
+
+# Nominatim geocoding answers are cached per geohash cell (precision 6 is ~1 km) in process and
+# in a SQLite file that survives restarts (GEOCODE_CACHE_PATH empty keeps them in process)
+geocode_cache = GeocodeCache(
+    path=os.getenv("GEOCODE_CACHE_PATH", os.path.join(app.instance_path, 'geocode_cache.sqlite3')),
+    precision=int(os.getenv("GEOCODE_CACHE_PRECISION", 6)),
+    ttl=int(os.getenv("GEOCODE_CACHE_TTL", 30 * 86400)),
+    max_entries=int(os.getenv("GEOCODE_CACHE_SIZE", 10000))
+)
+
+# Browser coordinates are resolved to a city offline; Nominatim is only asked for points
+# far from every indexed city
+reverse_geocoder = ReverseGeocoder(
+    data_dir=os.getenv("GEOCODER_DATA_DIR", os.path.join(app.instance_path, 'geocoder')),
+    max_distance_km=float(os.getenv("GEOCODER_MAX_DISTANCE_KM", 25)),
+    nominatim=os.getenv("GEOCODER_NOMINATIM", "1") == "1",
+    nominatim_timeout=float(os.getenv("GEOCODER_NOMINATIM_TIMEOUT", 3)),
+    cache=geocode_cache
+)
+
 
 # Add custom Jinja filters
 @app.template_filter('attr_list')
@@ -61,9 +107,6 @@ def load_user(user_id):
 # Routes
 @app.route('/')
 def index():
-    # Initialize the event service with your API key
-    event_service = EventService(os.getenv('SERPAPI_KEY'))
-    
     # Get query parameters
     query = request.args.get('q')
     location = request.args.get('location')
@@ -96,7 +139,6 @@ def home():
 @app.route('/api/events')
 def api_events():
     app.logger.debug("Received request for events API")
-    event_service = EventService(os.getenv('SERPAPI_KEY'))
     
     # Get location parameters
     lat = request.args.get('lat', type=float)
@@ -115,32 +157,8 @@ def api_events():
     # If we have coordinates, convert to location string (if no direct location was provided)
     resolved_location = None
     if lat and lng and not location:
-        try:
-            app.logger.debug(f"Attempting reverse geocoding for coordinates: {lat}, {lng}")
-            response = requests.get(
-                f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lng}&format=json",
-                headers={'User-Agent': 'EventFlowAI/1.0'}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                address = data.get('address', {})
-                
-                # Try to get location at different levels - from most specific to least
-                # Prefer city, state/province, or country to avoid too-specific locations
-                resolved_location = (
-                    address.get('city') or 
-                    address.get('county') or 
-                    address.get('state') or 
-                    address.get('country')
-                )
-                
-                # If all we got was a specific location (ward, neighborhood), use country instead
-                if not resolved_location and ('ward' in address or 'suburb' in address or 'neighbourhood' in address):
-                    resolved_location = address.get('country')
-                
-                app.logger.debug(f"Reverse geocoded location: {resolved_location}")
-        except Exception as e:
-            app.logger.error(f"Error in reverse geocoding: {e}")
+        resolved_location = reverse_geocoder.resolve(lat, lng)
+        app.logger.debug(f"Reverse geocoded location: {resolved_location}")
     
     # If reverse geocoding failed or returned something too specific, try coordinates
     if not resolved_location and lat and lng:
@@ -162,30 +180,21 @@ def api_events():
         final_location = "Nairobi"  # Assuming this is in Kenya based on the coordinates
         app.logger.debug(f"Using fallback location: {final_location}")
 
-    # Try to search for events
+    # Fallback chain, in priority order: the resolved location, then for a named location
+    # the user's broader location and Nairobi. The candidates are searched concurrently
+    candidates = [final_location]
+    if final_location and "," not in final_location and final_location != "Nairobi":
+        if current_user.is_authenticated and current_user.location:
+            candidates.append(current_user.location.split(',')[0])  # Take the first part of location
+        candidates.append("Nairobi")
+
     events = []
     try:
-        # Search for events using the EventService
-        events = event_service.search_events(
-            query=query,
-            location=final_location,
-            date=date,
-            page=page
+        answered_by, events = event_service.search_with_fallbacks(
+            candidates, query=query, date=date, page=page, deadline=event_search_deadline
         )
-        
-        # If no events found and we have a specific location, try with a broader location
-        if not events and final_location and "," not in final_location and final_location != "Nairobi":
-            app.logger.debug(f"No events found with location '{final_location}', trying with broader location")
-            # Try with a broader location (country or major city)
-            if current_user.is_authenticated and current_user.location:
-                broader_location = current_user.location.split(',')[0]  # Take the first part of location
-                app.logger.debug(f"Trying with user's broader location: {broader_location}")
-                events = event_service.search_events(query=query, location=broader_location, date=date, page=page)
-            
-            # Final fallback to "Nairobi" if still no events
-            if not events:
-                app.logger.debug("Still no events, trying with Nairobi")
-                events = event_service.search_events(query=query, location="Nairobi", date=date, page=page)
+        if answered_by and answered_by != final_location:
+            app.logger.debug(f"No events found with location '{final_location}', used '{answered_by}'")
     except Exception as e:
         app.logger.error(f"Error searching events: {e}")
         # Return empty list in case of errors
@@ -229,8 +238,9 @@ def utility_processor():
 @login_required
 def browse_local_events():
     # Get all events from the database (not from SerpAPI)
-    all_events = Event.query.filter_by(privacy='public').all()
-    return render_template('browse_local_events.html', events=all_events)
+    all_events = event_listings.public_events()
+    attendance = event_listings.attendance_map(current_user.id, all_events)
+    return render_template('browse_local_events.html', events=all_events, attendance=attendance)
 
 # Update your Google Calendar callback route to match your REDIRECT_URI
 @app.route('/auth/google/callback')
@@ -373,6 +383,7 @@ def select_interests():
                 continue
         
         db.session.commit()
+        recommendation_cache.invalidate_user(current_user.id)
         flash('Interests updated successfully!', 'success')
         return redirect(url_for('recommendations'))
     
@@ -444,6 +455,7 @@ def edit_event(event_id):
         event.updated_at = datetime.utcnow()
         
         db.session.commit()
+        recommendation_cache.invalidate_event(event.id)
         
         # Track this as an interaction
         interaction = UserEventInteraction(
@@ -463,7 +475,7 @@ def edit_event(event_id):
 @app.route('/my_events')
 @login_required
 def my_events():
-    events = Event.query.filter_by(organizer_id=current_user.id).all()
+    events = event_listings.organized_events(current_user.id)
     return render_template('my_events.html', events=events)
 
 @app.route('/join_event/<int:event_id>', methods=['POST'])
@@ -471,25 +483,14 @@ def my_events():
 def join_event(event_id):
     event = Event.query.get_or_404(event_id)
     
-    # Check if user is already attending
-    existing_attendee = EventAttendee.query.filter_by(
-        user_id=current_user.id, 
-        event_id=event_id
-    ).first()
-    
-    if existing_attendee:
+    # Insert the attendee record unless the user is already attending (also under concurrent joins)
+    if not EventAttendee.join(current_user.id, event_id):
+        db.session.rollback()
         flash('You are already attending this event.')
         return redirect(url_for('event_details', event_id=event_id))
     
-    # Create new attendee record
-    attendee = EventAttendee(
-        user_id=current_user.id,
-        event_id=event_id,
-        joined_at=datetime.utcnow()
-    )
-    
-    db.session.add(attendee)
     db.session.commit()
+    recommendation_cache.invalidate_user(current_user.id)
     
     flash('You have successfully joined the event!')
     return redirect(url_for('event_details', event_id=event_id))
@@ -497,15 +498,10 @@ def join_event(event_id):
 @app.route('/leave_event/<int:event_id>', methods=['POST'])
 @login_required
 def leave_event(event_id):
-    # Find and delete the attendee record
-    attendee = EventAttendee.query.filter_by(
-        user_id=current_user.id, 
-        event_id=event_id
-    ).first()
-    
-    if attendee:
-        db.session.delete(attendee)
+    # Delete the attendee record and uncount it in the same transaction
+    if EventAttendee.leave(current_user.id, event_id):
         db.session.commit()
+        recommendation_cache.invalidate_user(current_user.id)
         flash('You have left the event.')
     else:
         flash('You are not attending this event.')
@@ -539,12 +535,9 @@ def event_details(event_id):
 @app.route('/joined_events')
 @login_required
 def joined_events():
-    # Get all events the user has joined
-    joined_events = Event.query.join(EventAttendee).filter(
-        EventAttendee.user_id == current_user.id
-    ).all()
-    
-    return render_template('joined_events.html', events=joined_events)
+    # Get all events the user has joined, with their organizers preloaded
+    events = event_listings.joined_events(current_user.id)
+    return render_template('joined_events.html', events=events)
 
 
 @app.route('/delete_event/<int:event_id>', methods=['POST'])
@@ -564,9 +557,20 @@ def delete_event(event_id):
         # Delete all user interactions related to this event
         UserEventInteraction.query.filter_by(event_id=event_id).delete()
         
+        # Delete similarity index entries pointing to or from this event
+        EventSimilarity.query.filter(
+            (EventSimilarity.event_id == event_id) | (EventSimilarity.neighbor_id == event_id)
+        ).delete(synchronize_session=False)
+        
+        # Drop popularity boosts that were not folded into the event yet
+        EventPopularityShard.query.filter_by(event_id=event_id).delete()
+        InteractionRollup.query.filter_by(event_id=event_id).delete()
+        InteractionSummary.query.filter_by(event_id=event_id).delete()
+        
         # Finally, delete the event itself
         db.session.delete(event)
         db.session.commit()
+        recommendation_cache.invalidate_event(event_id)
         
         flash('Event successfully deleted.', 'success')
     except Exception as e:
@@ -579,24 +583,69 @@ def delete_event(event_id):
      
 # Initialize recommendation service
 ai_api = os.getenv("AI_API")
-recommendation_service = EnhancedRecommendationService(ai_api)
+ai_api_client = RecommendationAPIClient(
+    ai_api,
+    connect_timeout=float(os.getenv("AI_API_CONNECT_TIMEOUT", 2)),
+    read_timeout=float(os.getenv("AI_API_READ_TIMEOUT", 10)),
+    max_retries=int(os.getenv("AI_API_MAX_RETRIES", 2)),
+    pool_size=int(os.getenv("AI_API_POOL_SIZE", 10)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("AI_API_BREAKER_THRESHOLD", 5)),
+        recovery_timeout=float(os.getenv("AI_API_BREAKER_RESET", 30))
+    )
+)
+recommendation_service = EnhancedRecommendationService(
+    ai_api,
+    api_client=ai_api_client,
+    pipeline_mode=os.getenv("RECOMMENDATION_PIPELINE", EnhancedRecommendationService.PIPELINE_SEQUENTIAL),
+    latency_budget=float(os.getenv("RECOMMENDATION_LATENCY_BUDGET_MS", 300)) / 1000,
+    payload_format=os.getenv("AI_API_PAYLOAD_FORMAT", "json"),
+    include_fields=[field for field in os.getenv("AI_API_INCLUDE_FIELDS", "").split(",") if field]
+)
+
+# Candidate generation bounds the events sent to the recommender
+candidate_generator = CandidateGenerator(
+    limit=int(os.getenv("RECOMMENDATION_CANDIDATE_LIMIT", 500)),
+    radius_km=float(os.getenv("RECOMMENDATION_CANDIDATE_RADIUS_KM", 50))
+)
+
+# Cache of ranked recommendations per user (in-process unless a redis:// URL is set)
+recommendation_cache = create_recommendation_cache(
+    url=os.getenv("RECOMMENDATION_CACHE_URL"),
+    ttl=int(os.getenv("RECOMMENDATION_CACHE_TTL", 600)),
+    max_entries=int(os.getenv("RECOMMENDATION_CACHE_SIZE", 1000))
+)
 
 # Update the recommendations route
 @app.route('/recommendations')
 @login_required
 def recommendations():
     try:
-        # Get all public events
-        public_events = Event.query.filter_by(privacy='public').all()
+        cached = recommendation_cache.get(current_user.id)
+        if cached is not None:
+            # Reload the cached events in a single query, keeping the cached ranking
+            scores = dict(cached)
+            events = event_listings.events_by_ids([event_id for event_id, _ in cached])
+            recommended_events = [(event, scores[event.id]) for event in events]
+            response = make_response(render_template(
+                'recommendations.html',
+                recommended_events=recommended_events,
+                attendance=event_listings.attendance_map(current_user.id, events)
+            ))
+            response.headers['X-Recommendation-Sources'] = 'cache'
+            return response
+
+        # Get a bounded set of upcoming public candidate events
+        candidate_events = candidate_generator.generate(current_user)
         
-        if not public_events:
+        if not candidate_events:
             flash('No public events available for recommendations.')
             return redirect(url_for('home'))
 
         # Get recommendations from enhanced service
         recommendations = recommendation_service.get_recommendations(
             current_user,
-            public_events
+            candidate_events
         )
 
         # Process recommendations for template
@@ -606,11 +655,23 @@ def recommendations():
             score = rec['score']
             recommended_events.append((event, score))
 
-        return render_template(
-            'recommendations.html',
-            recommended_events=recommended_events
+        recommendation_cache.set(
+            current_user.id,
+            [(event.id, score) for event, score in recommended_events]
         )
 
+        # Record which recommenders contributed to this page
+        sources = sorted({rec.get('source', 'unknown') for rec in recommendations})
+        response = make_response(render_template(
+            'recommendations.html',
+            recommended_events=recommended_events,
+            attendance=event_listings.attendance_map(
+                current_user.id, [event for event, _ in recommended_events]
+            )
+        ))
+        response.headers['X-Recommendation-Sources'] = ','.join(sources)
+        return response
+
     except Exception as e:
         app.logger.error(f"Error in recommendations: {str(e)}")
         flash('Error generating recommendations. Please try again later.', 'error')
@@ -645,6 +706,7 @@ def update_preferences():
                 continue
         
         db.session.commit()
+        recommendation_cache.invalidate_user(current_user.id)
         flash('Your preferences have been updated successfully!', 'success')
         return redirect(url_for('recommendations'))
     
@@ -659,11 +721,88 @@ def update_preferences():
     return render_template('update_preferences.html', user_interests=user_interests)
 
 
+# Write-behind buffer for tracked interactions, flushed in batches by size or time
+interaction_buffer = InteractionBuffer(
+    app,
+    batch_size=int(os.getenv("INTERACTION_BUFFER_BATCH_SIZE", 500)),
+    flush_interval=float(os.getenv("INTERACTION_BUFFER_FLUSH_INTERVAL", 1.0)),
+    # >0 spreads popularity boosts over that many rows per event, folded every POPULARITY_FOLD_INTERVAL seconds
+    popularity_shards=int(os.getenv("POPULARITY_SHARDS", 0)),
+    fold_interval=float(os.getenv("POPULARITY_FOLD_INTERVAL", 10)),
+    # How often upcoming monthly interaction partitions are created on PostgreSQL (0 disables)
+    partition_interval=float(os.getenv("INTERACTION_PARTITION_CHECK_INTERVAL", 6 * 3600))
+)
+interaction_buffer.enabled = os.getenv("INTERACTION_BUFFER_ENABLED", "true").lower() == "true"
+app.extensions['interaction_buffer'] = interaction_buffer
+
+def invalidate_recommendations(rows):
+    """Drop cached recommendations of users whose committed interactions change them"""
+    for user_id in {row['user_id'] for row in rows if row['interaction_type'] in POPULARITY_BOOSTS}:
+        recommendation_cache.invalidate_user(user_id)
+
+# Runs once the interactions are committed, so a recommendation computed in between
+# cannot be cached without them
+interaction_buffer.add_listener(invalidate_recommendations)
+
+# Ids of events known to exist, so validating a tracked interaction rarely needs a query
+known_event_ids = TTLCache(max_entries=50000, ttl=300)
+
+VALID_INTERACTION_TYPES = [
+    'view',             # User viewed event details
+    'click',            # User clicked on event
+    'join',             # User joined event
+    'leave',            # User left event
+    'bookmark',         # User bookmarked event
+    'share',            # User shared event
+    'calendar_add',     # User added event to calendar
+    'recommend_click',  # User clicked on a recommended event
+    'impression'        # Event was shown to user
+]
+
+# Upper bounds on one /api/track_interactions request: interactions, body size, and the
+# serialized metadata stored with each interaction
+MAX_INTERACTIONS_PER_BATCH = 200
+MAX_INTERACTIONS_REQUEST_BYTES = 256 * 1024
+MAX_INTERACTION_METADATA_BYTES = 1024
+
+def valid_metadata(metadata):
+    """Check that interaction metadata is absent or a small JSON object"""
+    if metadata is None:
+        return True
+    return isinstance(metadata, dict) and len(json.dumps(metadata)) <= MAX_INTERACTION_METADATA_BYTES
+
+def event_exists(event_id):
+    """Check if an event exists, caching positive answers"""
+    return event_id in existing_event_ids([event_id])
+
+def existing_event_ids(event_ids):
+    """Return the subset of event_ids that exist, with one IN query for the uncached ones"""
+    existing = {event_id for event_id in event_ids if known_event_ids.get(event_id)}
+    unknown = set(event_ids) - existing
+    if unknown:
+        for event_id, in db.session.query(Event.id).filter(Event.id.in_(unknown)):
+            known_event_ids.set(event_id, True)
+            existing.add(event_id)
+    return existing
+
+def queue_interactions(interactions):
+    """Queue (or, with the buffer disabled, write) validated interactions"""
+    if not interaction_buffer.enabled:
+        # Synchronous write (INTERACTION_BUFFER_ENABLED=false)
+        write_interactions(interactions, interaction_buffer.popularity_shards)
+        db.session.commit()
+        interaction_buffer.notify_written(interactions)
+    else:
+        # Significant interactions also boost event popularity when the batch is flushed
+        for interaction in interactions:
+            interaction_buffer.add(interaction)
+
 @app.route('/api/track_interaction', methods=['POST'])
 @login_required
 def track_interaction():
     """
-    Track user interactions with events for improving recommendations
+    Track user interactions with events for improving recommendations.
+    Interactions are queued and written in batches; the response is 202 Accepted.
     """
     try:
         data = request.get_json()
@@ -677,94 +816,188 @@ def track_interaction():
             return jsonify({'error': 'Missing required fields'}), 400
             
         # Validate event ID
-        event_id = data['event_id']
-        event = Event.query.get(event_id)
-        if not event:
+        try:
+            event_id = int(data['event_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Event not found'}), 404
+        if not event_exists(event_id):
             return jsonify({'error': 'Event not found'}), 404
             
         # Validate interaction type
-        valid_interaction_types = [
-            'view',             # User viewed event details
-            'click',            # User clicked on event
-            'join',             # User joined event
-            'leave',            # User left event
-            'bookmark',         # User bookmarked event
-            'share',            # User shared event
-            'calendar_add',     # User added event to calendar
-            'recommend_click',  # User clicked on a recommended event
-            'impression'        # Event was shown to user
-        ]
-        
         interaction_type = data['interaction_type']
-        if interaction_type not in valid_interaction_types:
+        if interaction_type not in VALID_INTERACTION_TYPES:
             return jsonify({'error': 'Invalid interaction type'}), 400
+        
+        if not valid_metadata(data.get('metadata')):
+            return jsonify({'error': f'Metadata must be an object of at most {MAX_INTERACTION_METADATA_BYTES} bytes'}), 400
             
         # Create new interaction record
-        interaction = UserEventInteraction(
-            user_id=current_user.id,
-            event_id=event_id,
-            interaction_type=interaction_type,
-            timestamp=datetime.now(),
-            interaction_metadata=data.get('metadata')
-        )
-        
-        db.session.add(interaction)
-        db.session.commit()
+        interaction = {
+            'user_id': current_user.id,
+            'event_id': event_id,
+            'interaction_type': interaction_type,
+            'timestamp': datetime.now(),
+            'interaction_metadata': data.get('metadata')
+        }
         
-        # Update event popularity if it's a significant interaction
-        significant_interactions = ['join', 'bookmark', 'share', 'calendar_add']
-        if interaction_type in significant_interactions:
-            # Adjust event popularity based on interaction
-            if interaction_type == 'join':
-                # Joining an event is a strong signal, boost popularity more
-                event.event_popularity = min(1.0, event.event_popularity + 0.02)
-            else:
-                # Other interactions provide smaller boosts
-                event.event_popularity = min(1.0, event.event_popularity + 0.01)
-                
-            db.session.commit()
+        queue_interactions([interaction])
         
         return jsonify({
             'success': True, 
-            'message': 'Interaction tracked successfully',
-            'interaction_id': interaction.id
-        })
+            'message': 'Interaction queued'
+        }), 202
         
     except Exception as e:
         app.logger.error(f"Error tracking interaction: {str(e)}")
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/track_interactions', methods=['POST'])
+@login_required
+def track_interactions():
+    """
+    Track a batch of interactions, e.g. impressions coalesced by the browser and sent
+    with a keepalive fetch. Accepts {"interactions": [...]} or a bare list, each item
+    shaped like a /api/track_interaction body. Invalid items are skipped and counted.
+    """
+    try:
+        # Only application/json: a cross-site form or text/plain beacon cannot send it
+        # without a CORS preflight, which is what keeps this endpoint CSRF-safe
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 415
+        if request.content_length is None:
+            return jsonify({'error': 'Content-Length required'}), 411
+        if request.content_length > MAX_INTERACTIONS_REQUEST_BYTES:
+            return jsonify({'error': f'At most {MAX_INTERACTIONS_REQUEST_BYTES} bytes per request'}), 413
+        data = request.get_json(silent=True)
+        items = data.get('interactions') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'No interactions provided'}), 400
+        if len(items) > MAX_INTERACTIONS_PER_BATCH:
+            return jsonify({'error': f'At most {MAX_INTERACTIONS_PER_BATCH} interactions per request'}), 413
+        
+        parsed = []
+        for item in items:
+            try:
+                event_id = int(item['event_id'])
+                interaction_type = item['interaction_type']
+            except (TypeError, KeyError, ValueError):
+                continue
+            if interaction_type in VALID_INTERACTION_TYPES and valid_metadata(item.get('metadata')):
+                parsed.append((event_id, interaction_type, item.get('metadata')))
+        
+        # Validate every event id with a single IN query
+        valid_event_ids = existing_event_ids({event_id for event_id, _, _ in parsed})
+        
+        now = datetime.now()
+        interactions = [
+            {
+                'user_id': current_user.id,
+                'event_id': event_id,
+                'interaction_type': interaction_type,
+                'timestamp': now,
+                'interaction_metadata': metadata
+            }
+            for event_id, interaction_type, metadata in parsed
+            if event_id in valid_event_ids
+        ]
+        if interactions:
+            queue_interactions(interactions)
+        
+        return jsonify({
+            'success': True,
+            'accepted': len(interactions),
+            'rejected': len(items) - len(interactions)
+        }), 202
+        
+    except Exception as e:
+        app.logger.error(f"Error tracking interactions: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+# Hourly interaction buckets and decayed scores per event, served from memory. A
+# background thread warms it from the rollups and re-syncs the recent hours every
+# TRENDING_REFRESH_INTERVAL seconds (0 disables it); this worker's flushes are added
+# as soon as they commit.
+trending_leaderboard = TrendingLeaderboard(
+    max_days=int(os.getenv("TRENDING_MAX_DAYS", 30)),
+    half_life_hours=float(os.getenv("TRENDING_HALF_LIFE_HOURS", 24)),
+    refresh_interval=float(os.getenv("TRENDING_REFRESH_INTERVAL", 10))
+)
+interaction_buffer.add_listener(trending_leaderboard.ingest)
+trending_leaderboard.start(app)
+
+def rank_trending(limit, order, window_counts):
+    """
+    Return [(event, interaction_count)] for upcoming events, ranked like the database
+    query (interactions in the window, then popularity) or by decayed score.
+    Events are loaded in chunks of candidates until `limit` upcoming ones are found.
+    """
+    # Decayed scores only exist once the leaderboard is warm
+    decayed = order == 'decayed' and trending_leaderboard.ready
+    if decayed:
+        ranked = [
+            (event_id, window_counts.get(event_id, 0))
+            for event_id, _ in trending_leaderboard.decayed_scores(trending_leaderboard.top_k)
+        ]
+    else:
+        ranked = sorted(window_counts.items(), key=lambda item: -item[1])
+    
+    now = datetime.utcnow()
+    chunk_size = max(limit * 2, 50)
+    selected = []
+    for start in range(0, len(ranked), chunk_size):
+        chunk = ranked[start:start + chunk_size]
+        events_by_id = {
+            event.id: event
+            for event in Event.query.filter(Event.id.in_([event_id for event_id, _ in chunk]), Event.date >= now)
+        }
+        selected.extend(
+            (events_by_id[event_id], count) for event_id, count in chunk if event_id in events_by_id
+        )
+        # Stop once the limit is reached and the next candidate cannot tie with the last one kept
+        next_index = start + chunk_size
+        if len(selected) >= limit and (
+            decayed or next_index >= len(ranked) or ranked[next_index][1] < selected[limit - 1][1]
+        ):
+            break
+    
+    if not decayed:
+        selected.sort(key=lambda item: (-item[1], -(item[0].event_popularity or 0)))
+    return selected[:limit]
 
 @app.route('/api/trending_events')
 def trending_events():
     """
-    Get trending events based on recent interactions and popularity
+    Get trending events based on recent interactions and popularity.
+    Served from the in-memory leaderboard for windows it covers; `order=decayed` ranks
+    by time-decayed interaction counts instead of raw counts in the window.
     """
     try:
         # Number of events to return
         limit = request.args.get('limit', default=10, type=int)
+        if limit <= 0:
+            return jsonify({'trending_events': []})
         
         # Time period for trending (default: last 7 days)
         days = request.args.get('days', default=7, type=int)
         period_start = datetime.utcnow() - timedelta(days=days)
+        order = request.args.get('order', default='count')
         
-        # Get events with interaction counts
-        trending_events = db.session.query(
-            Event,
-            func.count(UserEventInteraction.id).label('interaction_count')
-        ).join(
-            UserEventInteraction,
-            Event.id == UserEventInteraction.event_id
-        ).filter(
-            UserEventInteraction.timestamp >= period_start,
-            Event.date >= datetime.utcnow()  # Only future events
-        ).group_by(
-            Event.id
-        ).order_by(
-            desc('interaction_count'),
-            desc(Event.event_popularity)
-        ).limit(limit).all()
+        # Interactions in the last 7 days feed the trending score
+        if trending_leaderboard.ready:
+            recent_counts = trending_leaderboard.window_counts(7)
+        else:
+            recent_counts = InteractionRollup.window_counts(datetime.utcnow() - timedelta(days=7))
+        if days == 7:
+            window_counts = recent_counts
+        elif days <= trending_leaderboard.max_days and trending_leaderboard.ready:
+            window_counts = trending_leaderboard.window_counts(days)
+        else:
+            # Older than the leaderboard keeps (or it is still warming up); sum the hourly rollups
+            window_counts = InteractionRollup.window_counts(period_start)
+        trending_events = rank_trending(limit, order, window_counts)
         
         # Format results
         results = []
@@ -778,7 +1011,9 @@ def trending_events():
                 'popularity': event.event_popularity,
                 'interaction_count': interaction_count,
                 'attendee_count': event.get_attendee_count(),
-                'trending_score': event.calculate_trending_score()
+                'trending_score': event.calculate_trending_score(
+                    recent_interactions=recent_counts.get(event.id, 0)
+                )
             })
             
         return jsonify({'trending_events': results})
@@ -787,6 +1022,22 @@ def trending_events():
         app.logger.error(f"Error getting trending events: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cache_stats')
+@login_required
+def cache_stats():
+    """
+    Get hit/miss counters for the application caches and AI API health
+    """
+    return jsonify({
+        'recommendations': recommendation_cache.stats(),
+        'ai_api': ai_api_client.stats(),
+        'interaction_buffer': interaction_buffer.stats(),
+        'trending': trending_leaderboard.stats(),
+        'event_search': dict(event_search_cache.stats(), single_flight=event_search_flights.stats(),
+                             fallbacks=event_service.stats()),
+        'geocoding': reverse_geocoder.stats()
+    })
+
 @app.route('/api/user/calendar_events')
 @login_required
 def user_calendar_events():
@@ -854,8 +1105,25 @@ def sync_calendar():
         return jsonify({'error': str(e)}), 500
 
 
-from webapp.commands import seed_db_command,update_event_categories_command
+from webapp.commands import seed_db_command,update_event_categories_command,rebuild_similarity_command,follow_similarity_command,fold_popularity_command,backfill_rollups_command,compact_interactions_command,manage_partitions_command,check_query_plans_command,reconcile_event_counters_command,build_geocoder_command
+from webapp.benchmarks import benchmark_similarity_command, benchmark_payload_command, benchmark_ingestion_command, benchmark_popularity_command, benchmark_partitions_command, count_route_queries_command, benchmark_single_flight_command
 app.cli.add_command(seed_db_command)
+app.cli.add_command(rebuild_similarity_command)
+app.cli.add_command(follow_similarity_command)
+app.cli.add_command(fold_popularity_command)
+app.cli.add_command(backfill_rollups_command)
+app.cli.add_command(compact_interactions_command)
+app.cli.add_command(manage_partitions_command)
+app.cli.add_command(check_query_plans_command)
+app.cli.add_command(reconcile_event_counters_command)
+app.cli.add_command(build_geocoder_command)
+app.cli.add_command(benchmark_similarity_command)
+app.cli.add_command(benchmark_payload_command)
+app.cli.add_command(benchmark_ingestion_command)
+app.cli.add_command(benchmark_popularity_command)
+app.cli.add_command(benchmark_partitions_command)
+app.cli.add_command(count_route_queries_command)
+app.cli.add_command(benchmark_single_flight_command)
 app.cli.add_command(update_event_categories_command)
 if __name__ == '__main__':
     required_env_vars = ['SERPAPI_KEY', 'SECRET_KEY', 'DATABASE_URL', 'AI_API']
@@ -0,0 +1,578 @@
+# webapp/benchmarks.py
+"""
+Benchmark commands for the performance-sensitive parts of the application.
+These use synthetic data and do not touch the application database unless stated.
+"""
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event as sa_event, func, text
+from sqlalchemy.exc import OperationalError
+
+from webapp.collaborative_filtering import SparseCFEngine, IncrementalSimilarityModel
+from webapp.models import db, User, Event, EventAttendee, UserEventInteraction
+from webapp.popularity import apply_popularity_deltas, add_sharded_popularity_deltas, fold_popularity_shards
+from webapp.recommendation_payload import encode_request, decode_request, FORMAT_JSON, FORMAT_MSGPACK
+from webapp.rollups import remove_interaction_rollups
+
+INTERACTION_TYPES = ['view', 'view', 'view', 'click', 'click', 'join', 'bookmark', 'share']
+
+
+def synthetic_interactions(count, seed=42):
+    """
+    Generate (user_id, event_id, interaction_type) tuples with a skewed event popularity,
+    roughly matching what the seeded database produces at scale.
+    """
+    rng = random.Random(seed)
+    num_users = max(100, count // 20)
+    num_events = max(50, count // 100)
+    return [
+        (
+            rng.randint(1, num_users),
+            min(num_events, int(rng.paretovariate(1.2))) if rng.random() < 0.3 else rng.randint(1, num_events),
+            rng.choice(INTERACTION_TYPES)
+        )
+        for _ in range(count)
+    ]
+
+
+@click.command('benchmark-similarity')
+@click.option('--sizes', default='10000,100000,1000000', help='Comma-separated interaction counts')
+@click.option('--updates', default=1000, help='Number of incremental updates to time per size')
+@click.option('--neighbours', default=20, help='Number of similar events to keep per event')
+def benchmark_similarity_command(sizes, updates, neighbours):
+    """Compare full similarity rebuilds against incremental updates."""
+    click.echo(f"{'interactions':>12} {'full rebuild (s)':>17} {'incremental (ms/update)':>24} {'speedup':>9}")
+    for size in [int(value) for value in sizes.split(',')]:
+        interactions = synthetic_interactions(size + updates)
+        history, new_interactions = interactions[:size], interactions[size:]
+
+        start = time.perf_counter()
+        engine = SparseCFEngine.from_interactions(history)
+        for _ in engine.item_neighbours(neighbours):
+            pass
+        rebuild_seconds = time.perf_counter() - start
+
+        model = IncrementalSimilarityModel.from_engine(engine, top_n=neighbours)
+        start = time.perf_counter()
+        for user_id, event_id, interaction_type in new_interactions:
+            for changed_event_id in model.apply(user_id, event_id, interaction_type):
+                model.neighbours_of(changed_event_id)
+        update_ms = (time.perf_counter() - start) * 1000 / len(new_interactions)
+
+        speedup = rebuild_seconds * 1000 / update_ms if update_ms else float('inf')
+        click.echo(f"{size:>12} {rebuild_seconds:>17.3f} {update_ms:>24.3f} {speedup:>8.0f}x")
+
+
+def synthetic_events_payload(count, seed=42):
+    """Generate per-event dicts shaped like the JSON payload sent to the AI API"""
+    rng = random.Random(seed)
+    categories = {
+        'music': ['concert', 'festival', 'jazz'],
+        'sports': ['football', 'running', 'tennis'],
+        'technology': ['ai', 'web', 'startups'],
+        'food': ['tasting', 'cooking'],
+        'arts': ['theatre', 'gallery', 'film'],
+    }
+    locations = [f'Venue {index}, City {index % 25}' for index in range(200)]
+    now = datetime(2025, 1, 1)
+    events = []
+    for event_id in range(1, count + 1):
+        category = rng.choice(list(categories))
+        date = now + timedelta(days=rng.randint(0, 120), hours=rng.randint(0, 23))
+        events.append({
+            'id': event_id,
+            'title': f'{category.title()} event {event_id}',
+            'description': ' '.join(rng.choice(['great', 'live', 'community', 'evening', 'meetup', 'local',
+                                                'workshop', 'friends', 'music', 'tickets']) for _ in range(60)),
+            'location': rng.choice(locations),
+            'latitude': rng.uniform(-60, 60),
+            'longitude': rng.uniform(-180, 180),
+            'date': date.isoformat(),
+            'privacy': 'public',
+            'category': category,
+            'subcategory': rng.choice(categories[category]),
+            'event_popularity': rng.random(),
+            'invited': 0,
+            'attendee_count': rng.randint(0, 300),
+            'days_until_event': (date - now).days,
+            'distance_km': rng.uniform(0, 500) if rng.random() < 0.8 else None,
+            'is_trending': rng.random() < 0.1,
+            'created_at': (now - timedelta(days=rng.randint(0, 60))).isoformat()
+        })
+    return events
+
+
+@click.command('benchmark-payload')
+@click.option('--sizes', default='1000,10000', help='Comma-separated event counts')
+@click.option('--repeat', default=5, help='Timing repetitions (best run is reported)')
+def benchmark_payload_command(sizes, repeat):
+    """Compare the JSON and compact columnar AI API payloads by size and serialization time."""
+    variants = [
+        ('json', FORMAT_JSON, ()),
+        ('msgpack', FORMAT_MSGPACK, ()),
+        ('msgpack+desc', FORMAT_MSGPACK, ('description',)),
+    ]
+    click.echo(f"{'events':>7} {'format':>13} {'bytes':>11} {'encode (ms)':>12} {'decode (ms)':>12}")
+    for size in [int(value) for value in sizes.split(',')]:
+        request_data = {
+            'user': {'id': 1},
+            'events': synthetic_events_payload(size),
+            'user_data': {'location': {'latitude': 0.0, 'longitude': 0.0}},
+            'user_interests': [{'category': 'music', 'subcategory': 'jazz'}],
+            'user_interactions': []
+        }
+        for label, payload_format, include_fields in variants:
+            encode_ms = decode_ms = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                body, content_type = encode_request(request_data, payload_format, include_fields)
+                encode_ms = min(encode_ms, (time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                decode_request(body, content_type)
+                decode_ms = min(decode_ms, (time.perf_counter() - start) * 1000)
+            click.echo(f"{size:>7} {label:>13} {len(body):>11,} {encode_ms:>12.2f} {decode_ms:>12.2f}")
+
+
+@click.command('benchmark-ingestion')
+@click.option('--requests', 'request_count', default=2000, help='Interactions to send per mode')
+@click.option('--threads', default=4, help='Concurrent clients')
+@with_appcontext
+def benchmark_ingestion_command(request_count, threads):
+    """
+    Measure sustained /api/track_interaction throughput with synchronous writes and with
+    the write-behind buffer. Writes to the application database; the inserted interactions
+    are deleted, their rollups subtracted and the touched events' popularity restored afterwards.
+    """
+    app = current_app._get_current_object()
+    buffer = app.extensions['interaction_buffer']
+    user_id = db.session.query(User.id).limit(1).scalar()
+    event_ids = [event_id for event_id, in db.session.query(Event.id).limit(500)]
+    if user_id is None or not event_ids:
+        click.echo("Seed the database first (flask seed-db)")
+        return
+
+    popularity = dict(db.session.query(Event.id, Event.event_popularity).filter(Event.id.in_(event_ids)))
+    first_new_id = (db.session.query(func.max(UserEventInteraction.id)).scalar() or 0) + 1
+    rng = random.Random(42)
+    payloads = [
+        {
+            'event_id': rng.choice(event_ids),
+            'interaction_type': 'bookmark' if rng.random() < 0.1 else rng.choice(['view', 'click', 'impression'])
+        }
+        for _ in range(request_count)
+    ]
+
+    def send(chunk):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        for payload in chunk:
+            response = client.post('/api/track_interaction', json=payload)
+            if response.status_code >= 400:
+                raise RuntimeError(f"track_interaction returned {response.status_code}")
+
+    was_enabled = buffer.enabled
+    try:
+        for label, enabled in (('synchronous', False), ('buffered', True)):
+            buffer.enabled = enabled
+            chunks = [payloads[index::threads] for index in range(threads)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(send, chunks))
+            accepted = time.perf_counter() - start
+            buffer.flush()
+            persisted = time.perf_counter() - start
+            click.echo(
+                f"{label:>12}: {request_count / accepted:>8.0f} interactions/s accepted, "
+                f"{request_count / persisted:>8.0f} interactions/s persisted"
+            )
+    finally:
+        buffer.enabled = was_enabled
+        benchmark_rows = UserEventInteraction.query.filter(UserEventInteraction.id >= first_new_id)
+        remove_interaction_rollups([
+            {'event_id': event_id, 'interaction_type': interaction_type, 'timestamp': timestamp}
+            for event_id, interaction_type, timestamp in benchmark_rows.with_entities(
+                UserEventInteraction.event_id, UserEventInteraction.interaction_type, UserEventInteraction.timestamp
+            )
+        ])
+        benchmark_rows.delete(synchronize_session=False)
+        for event_id, value in popularity.items():
+            Event.query.filter_by(id=event_id).update({'event_popularity': value}, synchronize_session=False)
+        db.session.commit()
+
+
+def run_concurrently(app, method, threads, calls, attempts=20):
+    """
+    Call `method` `calls` times from each of `threads` threads, each thread in its own
+    app context. Calls failing on lock contention are rolled back and retried.
+    """
+    def worker():
+        with app.app_context():
+            for _ in range(calls):
+                for attempt in range(attempts):
+                    try:
+                        method()
+                        break
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting for the row lock
+                        db.session.rollback()
+                        time.sleep(0.01 * (attempt + 1))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(worker) for _ in range(threads)]:
+            future.result()
+
+
+@click.command('benchmark-popularity')
+@click.option('--threads', default=16, help='Concurrent writers')
+@click.option('--joins', default=50, help='Joins per thread')
+@click.option('--shards', default=8, help='Shard count for the sharded mode')
+@with_appcontext
+def benchmark_popularity_command(threads, joins, shards):
+    """
+    Join the same event from many threads at once and compare the resulting popularity
+    with the expected value for a Python read-modify-write, the atomic UPDATE and the
+    sharded counters. Writes to the application database; the event is restored afterwards.
+    """
+    app = current_app._get_current_object()
+    event_id = db.session.query(Event.id).limit(1).scalar()
+    if event_id is None:
+        click.echo("Seed the database first (flask seed-db)")
+        return
+    original = db.session.get(Event, event_id).event_popularity
+    # Small enough that the 1.0 cap is never reached
+    boost = 0.5 / (threads * joins)
+    db.session.commit()
+
+    def read_modify_write():
+        event = db.session.get(Event, event_id)
+        event.event_popularity = min(1.0, event.event_popularity + boost)
+        db.session.commit()
+
+    def atomic_update():
+        apply_popularity_deltas({event_id: boost})
+        db.session.commit()
+
+    def sharded():
+        add_sharded_popularity_deltas({event_id: boost}, shards)
+        db.session.commit()
+
+    expected = 0.5
+    click.echo(f"{threads} threads x {joins} joins on event {event_id}, expected gain {expected:.4f}")
+    try:
+        for label, method in (
+            ('read-modify-write', read_modify_write),
+            ('atomic update', atomic_update),
+            ('sharded', sharded),
+        ):
+            Event.query.filter_by(id=event_id).update({'event_popularity': 0.0})
+            db.session.commit()
+
+            start = time.perf_counter()
+            run_concurrently(app, method, threads, joins)
+            if method is sharded:
+                fold_popularity_shards()
+            elapsed = time.perf_counter() - start
+
+            db.session.expire_all()
+            gained = db.session.get(Event, event_id).event_popularity
+            lost = round((expected - gained) / boost)
+            click.echo(
+                f"{label:>18}: gain {gained:.4f}, {lost:>5} lost updates, "
+                f"{threads * joins / elapsed:>7.0f} joins/s"
+            )
+    finally:
+        Event.query.filter_by(id=event_id).update({'event_popularity': original})
+        db.session.commit()
+
+
+BENCHMARK_SCHEMA = 'partition_benchmark'
+TRENDING_QUERY = (
+    'SELECT event_id, count(*) FROM {table} '
+    "WHERE timestamp >= timezone('utc', now()) - make_interval(days => :days) "
+    'GROUP BY event_id ORDER BY count(*) DESC LIMIT 50'
+)
+
+
+@click.command('benchmark-partitions')
+@click.option('--rows', default=10_000_000, help='Synthetic interactions per table')
+@click.option('--months', default=12, help='Months of history the interactions are spread over')
+@click.option('--events', default=20000, help='Distinct events')
+@click.option('--days', default=7, help='Trending window in days')
+@click.option('--repeat', default=5, help='Timed runs per table')
+@click.option('--keep', is_flag=True, help='Keep the scratch tables for inspection')
+@with_appcontext
+def benchmark_partitions_command(rows, months, events, days, repeat, keep):
+    """
+    Time the trending window query against an unpartitioned interactions table (with
+    and without a timestamp index) and a monthly partitioned one. PostgreSQL only;
+    builds scratch tables in the partition_benchmark schema and drops them afterwards.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        click.echo("Partitioning is PostgreSQL only; point DATABASE_URL at a PostgreSQL database")
+        return
+
+    from webapp.partitions import add_months, month_start
+
+    columns = ('id BIGINT NOT NULL, user_id INTEGER NOT NULL, event_id INTEGER NOT NULL, '
+               'interaction_type VARCHAR(50) NOT NULL, timestamp TIMESTAMP NOT NULL, interaction_metadata JSONB')
+    # Skewed event popularity and timestamps spread evenly over the last `months` months
+    generate = (
+        'INSERT INTO {table} SELECT g, 1 + (random() * 50000)::int, 1 + (power(random(), 3) * :events)::int, '
+        "(ARRAY['view', 'view', 'view', 'click', 'click', 'join', 'bookmark', 'share'])[1 + (random() * 7)::int], "
+        "timezone('utc', now()) - random() * make_interval(days => :history_days), NULL "
+        'FROM generate_series(1, :rows) AS g'
+    )
+    parameters = {'rows': rows, 'events': events, 'history_days': months * 30}
+
+    current_month = month_start(datetime.utcnow())
+    tables = {
+        'heap': f'{BENCHMARK_SCHEMA}.interactions_heap',
+        'heap + timestamp index': f'{BENCHMARK_SCHEMA}.interactions_heap',
+        'partitioned by month': f'{BENCHMARK_SCHEMA}.interactions_partitioned',
+    }
+    with db.engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA {BENCHMARK_SCHEMA}'))
+
+        start = time.perf_counter()
+        connection.execute(text(f'CREATE TABLE {BENCHMARK_SCHEMA}.interactions_heap ({columns}, PRIMARY KEY (id))'))
+        connection.execute(text(generate.format(table=f'{BENCHMARK_SCHEMA}.interactions_heap')), parameters)
+        click.echo(f"Loaded {rows} rows into the unpartitioned table in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        partitioned = f'{BENCHMARK_SCHEMA}.interactions_partitioned'
+        connection.execute(text(
+            f'CREATE TABLE {partitioned} ({columns}, PRIMARY KEY (id, timestamp)) PARTITION BY RANGE (timestamp)'
+        ))
+        connection.execute(text(f'CREATE TABLE {partitioned}_default PARTITION OF {partitioned} DEFAULT'))
+        for offset in range(-months - 1, 2):
+            month = add_months(current_month, offset)
+            connection.execute(text(
+                f'CREATE TABLE {partitioned}_y{month.year:04d}m{month.month:02d} PARTITION OF {partitioned} '
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            ))
+        connection.execute(text(
+            f'INSERT INTO {partitioned} SELECT * FROM {BENCHMARK_SCHEMA}.interactions_heap'
+        ))
+        click.echo(f"Loaded the same rows into {months + 3} monthly partitions in {time.perf_counter() - start:.1f}s")
+        connection.execute(text(f'ANALYZE {BENCHMARK_SCHEMA}.interactions_heap'))
+        connection.execute(text(f'ANALYZE {partitioned}'))
+
+    try:
+        for label, table in tables.items():
+            if label == 'heap + timestamp index':
+                with db.engine.begin() as connection:
+                    connection.execute(text(
+                        f'CREATE INDEX interactions_heap_timestamp ON {table} (timestamp)'
+                    ))
+                    connection.execute(text(f'ANALYZE {table}'))
+
+            query = TRENDING_QUERY.format(table=table)
+            timings = []
+            with db.engine.connect() as connection:
+                plan = connection.execute(text('EXPLAIN ' + query), {'days': days}).scalars().all()
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    connection.execute(text(query), {'days': days}).all()
+                    timings.append(time.perf_counter() - start)
+            scanned = sum(1 for line in plan if ' on ' in line and 'Scan' in line)
+            timings.sort()
+            click.echo(
+                f"{label:>22}: median {timings[len(timings) // 2] * 1000:8.1f}ms, "
+                f"best {timings[0] * 1000:8.1f}ms, {scanned} scan node(s)"
+            )
+    finally:
+        if not keep:
+            with db.engine.begin() as connection:
+                connection.execute(text(f'DROP SCHEMA {BENCHMARK_SCHEMA} CASCADE'))
+
+
+LISTING_ROUTES = ('/browse_local_events', '/my_events', '/joined_events', '/recommendations')
+
+
+@contextmanager
+def recorded_statements():
+    """Collect the SQL statements sent to the database inside the block"""
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa_event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        yield statements
+    finally:
+        sa_event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+
+def busiest_attendee():
+    """The user attending the most events, or None on an empty database"""
+    return db.session.query(EventAttendee.user_id).group_by(
+        EventAttendee.user_id
+    ).order_by(func.count().desc()).limit(1).scalar()
+
+
+def count_route_queries(app, user_id):
+    """
+    Request each listing route as user_id and return (route, response, statements).
+    /recommendations is requested twice and the cached rendering is recorded, since the
+    uncached one also runs the recommenders.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    results = []
+    for route in LISTING_ROUTES:
+        if route == '/recommendations':
+            client.get(route)
+        with recorded_statements() as statements:
+            response = client.get(route)
+        results.append((route, response, statements))
+    return results
+
+
+@click.command('count-route-queries')
+@click.option('--user-id', type=int, default=None, help='User to render the pages as (default: the one attending most events)')
+@click.option('--max-statements', type=int, default=0, help='Exit with status 1 if a page needs more statements (0 only reports)')
+@click.option('--show-sql', is_flag=True, help='Print every statement')
+@with_appcontext
+def count_route_queries_command(user_id, max_statements, show_sql):
+    """
+    Render the listing pages as a user and count the SQL statements each one issues
+    (the cached rendering of /recommendations, see count_route_queries()).
+    """
+    app = current_app._get_current_object()
+    if user_id is None:
+        user_id = busiest_attendee()
+    if user_id is None:
+        click.echo("Seed the database first (flask seed-db)")
+        return
+    counts = {
+        '/browse_local_events': Event.query.filter_by(privacy='public').count(),
+        '/my_events': Event.query.filter_by(organizer_id=user_id).count(),
+        '/joined_events': EventAttendee.query.filter_by(user_id=user_id).count(),
+    }
+    db.session.commit()
+
+    click.echo(f"Rendering listing pages as user {user_id}")
+    over_limit = False
+    for route, response, statements in count_route_queries(app, user_id):
+        rows = counts.get(route, '-')
+        click.echo(f"{route:>22}: HTTP {response.status_code}, {rows} events, {len(statements)} statements")
+        if show_sql:
+            for statement in statements:
+                click.echo('    ' + ' '.join(statement.split())[:160])
+        if max_statements and len(statements) > max_statements:
+            over_limit = True
+    if over_limit:
+        raise SystemExit(1)
+
+
+def start_serpapi_stub(delay):
+    """
+    Serve a minimal SerpApi /search endpoint on localhost that answers after `delay`
+    seconds. Returns (server, base URL, list of received query strings).
+    """
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    received = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            received.append(self.path)
+            time.sleep(delay)
+            body = json.dumps({'events_results': [
+                {'title': f'Stub event {len(received)}', 'date': {'start_date': 'Oct 20'}, 'address': ['Nairobi']}
+            ]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}', received
+
+
+class _NoCoalescing:
+    """SingleFlight stand-in that runs every call (the behaviour before coalescing)"""
+
+    def do(self, key, fn, recheck=None):
+        return fn()
+
+
+@click.command('benchmark-single-flight')
+@click.option('--callers', default=20, help='Concurrent identical searches')
+@click.option('--delay', default=0.5, help='Seconds the SerpApi stub takes to answer')
+@click.option('--services', default=1, help='EventService instances sharing a lock directory (stand-ins for worker processes)')
+def benchmark_single_flight_command(callers, delay, services):
+    """
+    Fire concurrent identical searches at a slow local SerpApi stub with and without
+    request coalescing and count the upstream requests. With --services above 1 the
+    searches are spread over services with their own SingleFlight and cache memory,
+    coordinated only by a lock directory and a shared SQLite cache file. Exits with
+    status 1 if coalesced searches made more than one upstream request.
+    """
+    import tempfile
+    from webapp.serpAPIService import EventService, SearchResultCache, SingleFlight
+
+    server, backend, received = start_serpapi_stub(delay)
+    failed = False
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            modes = [
+                ('uncoalesced', lambda index: EventService('stub', single_flight=_NoCoalescing(), backend=backend)),
+            ]
+            if services == 1:
+                service = EventService('stub', single_flight=SingleFlight(), backend=backend)
+                modes.append(('single-flight', lambda index: service))
+            else:
+                lock_dir = os.path.join(scratch, 'locks')
+                cache_path = os.path.join(scratch, 'search_cache.sqlite3')
+                shared = [
+                    EventService(
+                        'stub',
+                        cache=SearchResultCache(path=cache_path),
+                        single_flight=SingleFlight(lock_dir=lock_dir),
+                        backend=backend
+                    )
+                    for _ in range(services)
+                ]
+                modes.append(('file-locked', lambda index: shared[index % services]))
+
+            for label, service_for in modes:
+                received.clear()
+                searchers = [service_for(index) for index in range(callers)]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=callers) as executor:
+                    results = list(executor.map(
+                        lambda service: service.search_events('jazz', 'Nairobi'), searchers
+                    ))
+                elapsed = time.perf_counter() - start
+                empty = sum(1 for events in results if not events)
+                click.echo(
+                    f"{label:>14}: {callers} callers, {len(received)} upstream requests, "
+                    f"{elapsed * 1000:.0f}ms, {empty} empty results"
+                )
+                if label != 'uncoalesced' and (len(received) != 1 or empty):
+                    failed = True
+    finally:
+        server.shutdown()
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,97 @@
+# webapp/cache.py
+"""
+Small in-process caching primitives shared by the application's caches.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a time-to-live.
+    Keeps hit, miss and eviction counters for monitoring. An optional on_remove(key, value)
+    callback is called (outside the lock) for every entry that leaves the cache: evicted,
+    expired, deleted, replaced or cleared.
+    """
+
+    def __init__(self, max_entries=1000, ttl=600, on_remove=None):
+        """Create a cache holding at most max_entries entries for ttl seconds each"""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_remove = on_remove
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            del self._entries[key]
+            self.misses += 1
+        self._removed([(key, value)])
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entries if full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        removed = []
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                removed.append((key, previous[1]))
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, (_, evicted_value) = self._entries.popitem(last=False)
+                removed.append((evicted_key, evicted_value))
+                self.evictions += 1
+        self._removed(removed)
+
+    def delete(self, key):
+        """Remove a key if present"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._removed([(key, entry[1])])
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            removed = [(key, value) for key, (_, value) in self._entries.items()]
+            self._entries.clear()
+        self._removed(removed)
+
+    def _removed(self, entries):
+        if self.on_remove is not None:
+            for key, value in entries:
+                self.on_remove(key, value)
+
+    def __len__(self):
+        """Return the number of stored entries (including not yet purged expired ones)"""
+        return len(self._entries)
+
+    def stats(self):
+        """Return the cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,141 @@
+# webapp/candidate_generation.py
+"""
+Candidate generation stage for recommendations.
+
+Instead of scoring every public event, the recommenders receive a bounded candidate set:
+the union of upcoming public events that are CF neighbours of the user's recent
+interactions, match the user's interest categories, are near the user, or are trending,
+topped up with the soonest upcoming events and capped at a configurable size.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, desc, or_
+
+from webapp.models import db, Event, UserInterests, UserEventInteraction, InteractionRollup
+from webapp.similarity_index import load_neighbours
+from webapp.geo import haversine_km, bounding_box, longitude_ranges
+
+
+class CandidateGenerator:
+    """Builds the bounded set of events passed to the recommendation service"""
+
+    def __init__(self, limit=500, radius_km=50, trending_days=7, history_size=100):
+        """Configure the candidate cap, the 'nearby' radius and the trending window"""
+        self.limit = limit
+        self.radius_km = radius_km
+        self.trending_days = trending_days
+        self.history_size = history_size
+
+    def generate(self, user):
+        """
+        Return up to `limit` upcoming public events for the user. Sources are taken in
+        priority order (CF neighbours, interests, nearby, trending, soonest upcoming)
+        so the cap drops the least specific candidates first.
+        """
+        now = datetime.utcnow()
+        sources = [
+            self._cf_neighbour_ids,
+            self._interest_ids,
+            self._nearby_ids,
+            self._trending_ids,
+            self._upcoming_ids,
+        ]
+
+        candidate_ids = {}  # ordered set of event ids
+        for source in sources:
+            if len(candidate_ids) >= self.limit:
+                break
+            for event_id in source(user, now):
+                candidate_ids.setdefault(event_id, None)
+                if len(candidate_ids) >= self.limit:
+                    break
+
+        if not candidate_ids:
+            return []
+
+        events = self._upcoming_query(now).filter(Event.id.in_(list(candidate_ids))).all()
+        events_by_id = {event.id: event for event in events}
+        return [events_by_id[event_id] for event_id in candidate_ids if event_id in events_by_id]
+
+    def _upcoming_query(self, now):
+        """Public events that have not happened yet"""
+        return Event.query.filter(Event.privacy == 'public', Event.date >= now)
+
+    def _upcoming_id_query(self, now):
+        return db.session.query(Event.id).filter(Event.privacy == 'public', Event.date >= now)
+
+    def _cf_neighbour_ids(self, user, now):
+        """Events most similar to the ones the user recently interacted with"""
+        recent_event_ids = [
+            event_id for (event_id,) in db.session.query(UserEventInteraction.event_id).filter(
+                UserEventInteraction.user_id == user.id
+            ).order_by(UserEventInteraction.timestamp.desc()).limit(self.history_size)
+        ]
+        scores = {}
+        for neighbours in load_neighbours(recent_event_ids).values():
+            for neighbor_id, score in neighbours:
+                scores[neighbor_id] = scores.get(neighbor_id, 0.0) + score
+        if not scores:
+            return []
+
+        # Neighbours may be past or private events
+        upcoming = {
+            event_id for (event_id,) in self._upcoming_id_query(now).filter(Event.id.in_(list(scores)))
+        }
+        return sorted(upcoming, key=scores.get, reverse=True)[:self.limit]
+
+    def _interest_ids(self, user, now):
+        """Upcoming events in the user's interest categories or subcategories"""
+        interests = db.session.query(UserInterests.category, UserInterests.subcategory).filter(
+            UserInterests.user_id == user.id
+        ).all()
+        categories = {category.lower() for category, _ in interests if category}
+        subcategories = {subcategory.lower() for _, subcategory in interests if subcategory}
+        if not categories and not subcategories:
+            return []
+
+        rows = self._upcoming_id_query(now).filter(
+            func.lower(Event.category).in_(categories) | func.lower(Event.subcategory).in_(subcategories)
+        ).order_by(Event.date).limit(self.limit)
+        return [event_id for (event_id,) in rows]
+
+    def _nearby_ids(self, user, now):
+        """Upcoming events within radius_km of the user, nearest first"""
+        # 0.0 is a valid coordinate (equator, prime meridian)
+        if not (user.precise_location_enabled and user.latitude is not None and user.longitude is not None):
+            return []
+
+        min_lat, max_lat, min_lon, max_lon = bounding_box(user.latitude, user.longitude, self.radius_km)
+        rows = self._upcoming_id_query(now).add_columns(Event.latitude, Event.longitude).filter(
+            Event.latitude.between(min_lat, max_lat),
+            or_(*(Event.longitude.between(low, high) for low, high in longitude_ranges(min_lon, max_lon)))
+        ).all()
+
+        nearby = []
+        for event_id, latitude, longitude in rows:
+            distance = haversine_km(user.latitude, user.longitude, latitude, longitude)
+            if distance <= self.radius_km:
+                nearby.append((distance, event_id))
+        nearby.sort()
+        return [event_id for _, event_id in nearby[:self.limit]]
+
+    def _trending_ids(self, user, now):
+        """Upcoming events with the most interactions in the trending window"""
+        # Hourly rollups keep this proportional to the number of buckets, not interactions
+        since = (now - timedelta(days=self.trending_days)).replace(minute=0, second=0, microsecond=0)
+        rows = db.session.query(InteractionRollup.event_id).join(
+            Event, Event.id == InteractionRollup.event_id
+        ).filter(
+            InteractionRollup.bucket >= since,
+            Event.privacy == 'public',
+            Event.date >= now
+        ).group_by(
+            InteractionRollup.event_id
+        ).order_by(
+            desc(func.sum(InteractionRollup.count))
+        ).limit(self.limit)
+        return [event_id for (event_id,) in rows]
+
+    def _upcoming_ids(self, user, now):
+        """Soonest upcoming events, used to top up the candidate set"""
+        rows = self._upcoming_id_query(now).order_by(Event.date).limit(self.limit)
+        return [event_id for (event_id,) in rows]
@@ -0,0 +1,321 @@
+# webapp/collaborative_filtering.py
+"""
+Sparse collaborative filtering engine.
+
+Interactions are folded into a scipy.sparse CSR user x event matrix whose rows are
+L2-normalized, so the cosine similarity between one user and every other user is a
+single sparse mat-vec product. The same matrix also yields the event-event (item-item)
+similarities persisted by `flask rebuild-similarity`, and IncrementalSimilarityModel keeps
+those similarities current as new interactions arrive.
+"""
+import heapq
+import math
+import numpy as np
+import scipy.sparse as sp
+
+# Weight given to each interaction type when building the user x event matrix
+INTERACTION_WEIGHTS = {
+    'view': 0.5,
+    'click': 0.7,
+    'join': 1.0,
+    'bookmark': 1.0,
+}
+DEFAULT_INTERACTION_WEIGHT = 1.0
+# Scores equal to this many decimals are ties: the same score summed in a different order
+# can differ in the last bits, which must not decide the ranking
+SCORE_TIE_DECIMALS = 9
+
+
+def interaction_weight(interaction_type):
+    """Return the matrix weight for an interaction type"""
+    return INTERACTION_WEIGHTS.get(interaction_type, DEFAULT_INTERACTION_WEIGHT)
+
+
+class SparseCFEngine:
+    """
+    User-user collaborative filtering over a row-normalized CSR interaction matrix.
+    Each cell holds the mean weight of a user's interactions with an event, matching
+    the pivot table the recommendation service used to build with pandas.
+    """
+
+    def __init__(self, matrix, user_ids, event_ids, counts=None):
+        """Wrap a (users x events) CSR matrix of mean interaction weights"""
+        self.matrix = matrix
+        self.counts = counts
+        self.user_ids = user_ids
+        self.event_ids = event_ids
+        self._user_index = {int(user_id): row for row, user_id in enumerate(user_ids)}
+        self.normalized = self._normalize_rows(matrix)
+
+    @classmethod
+    def from_interactions(cls, rows, summaries=()):
+        """
+        Build the engine from an iterable of (user_id, event_id, interaction_type) tuples,
+        plus (user_id, event_id, weight_sum, interaction_count) summaries of compacted
+        interactions. Returns None when there are no interactions.
+        """
+        user_col, event_col, weights, row_counts = [], [], [], []
+        for user_id, event_id, interaction_type in rows:
+            user_col.append(user_id)
+            event_col.append(event_id)
+            weights.append(interaction_weight(interaction_type))
+            row_counts.append(1.0)
+        for user_id, event_id, weight_sum, interaction_count in summaries:
+            user_col.append(user_id)
+            event_col.append(event_id)
+            weights.append(weight_sum)
+            row_counts.append(interaction_count)
+
+        if not weights:
+            return None
+
+        user_ids, user_codes = np.unique(np.asarray(user_col, dtype=np.int64), return_inverse=True)
+        event_ids, event_codes = np.unique(np.asarray(event_col, dtype=np.int64), return_inverse=True)
+        shape = (len(user_ids), len(event_ids))
+
+        # Duplicate (user, event) pairs are summed by tocsr(); dividing by the
+        # per-cell counts gives the mean weight per cell.
+        sums = sp.coo_matrix((np.asarray(weights, dtype=np.float64), (user_codes, event_codes)), shape=shape).tocsr()
+        counts = sp.coo_matrix(
+            (np.asarray(row_counts, dtype=np.float64), (user_codes, event_codes)), shape=shape
+        ).tocsr()
+        sums.sort_indices()
+        counts.sort_indices()
+        matrix = sp.csr_matrix((sums.data / counts.data, sums.indices, sums.indptr), shape=shape)
+
+        return cls(matrix, user_ids, event_ids, counts=counts)
+
+    @staticmethod
+    def _normalize_rows(matrix):
+        """Scale every row to unit L2 norm (empty rows stay zero)"""
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        return sp.diags(inverse).dot(matrix).tocsr()
+
+    def has_user(self, user_id):
+        """Check if the user has any interactions in the matrix"""
+        return user_id in self._user_index
+
+    def user_similarities(self, user_id):
+        """Return the cosine similarity of the user against every user in the matrix"""
+        row = self._user_index[user_id]
+        return np.asarray(self.normalized.dot(self.normalized[row].T).todense()).ravel()
+
+    def similar_users(self, user_id, k=10):
+        """
+        Return up to k (user_id, similarity) pairs with positive similarity, most similar
+        first. Ties (to SCORE_TIE_DECIMALS decimals) are broken by ascending user id.
+        """
+        if user_id not in self._user_index:
+            return []
+
+        similarities = self.user_similarities(user_id)
+        similarities[self._user_index[user_id]] = 0.0
+
+        positive = np.flatnonzero(similarities > 0)
+        if len(positive) == 0:
+            return []
+
+        rounded = np.round(similarities, SCORE_TIE_DECIMALS)
+        if len(positive) > k:
+            # Keep everything tied with the k-th best score so the tie-break below
+            # is deterministic regardless of how argpartition splits ties.
+            kth = np.argpartition(-rounded[positive], k - 1)[k - 1]
+            threshold = rounded[positive][kth]
+            positive = positive[rounded[positive] >= threshold]
+
+        order = np.lexsort((self.user_ids[positive], -rounded[positive]))[:k]
+        top = positive[order]
+        return [(int(self.user_ids[row]), float(similarities[row])) for row in top]
+
+    def item_neighbours(self, top_n=20):
+        """
+        Yield (event_id, neighbour_event_id, similarity) for the top_n most similar events
+        of every event, using cosine similarity between the event columns of the matrix.
+        """
+        columns = self.matrix.tocsc()
+        norms = np.sqrt(np.asarray(columns.multiply(columns).sum(axis=0)).ravel())
+        inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        normalized = columns.dot(sp.diags(inverse)).tocsc()
+
+        similarity = normalized.T.dot(normalized).tocsr()
+        similarity.setdiag(0)
+        similarity.eliminate_zeros()
+
+        for row in range(similarity.shape[0]):
+            start, end = similarity.indptr[row], similarity.indptr[row + 1]
+            if start == end:
+                continue
+            scores = similarity.data[start:end]
+            columns_in_row = similarity.indices[start:end]
+            if len(scores) > top_n:
+                keep = np.argpartition(-scores, top_n - 1)[:top_n]
+                scores, columns_in_row = scores[keep], columns_in_row[keep]
+            for column, score in zip(columns_in_row, scores):
+                yield int(self.event_ids[row]), int(self.event_ids[column]), float(score)
+
+
+class IncrementalSimilarityModel:
+    """
+    In-memory item-item similarity model that folds single interactions into the
+    interaction matrix and the affected top-N neighbour rows without a full rebuild.
+
+    Neighbour rows store dot products between event columns and similarities are
+    derived from the current column norms when read. A norm change therefore changes the
+    scores of the event's own row and of every row listing it (tracked in `listed_in`),
+    all of which are reported as affected. Each update only touches the pairs formed by the updated event and
+    the user's `max_user_history` most recent events. A pair not tracked in either row
+    gets its dot product recomputed from the shared users when the smaller event has
+    at most `max_exact_degree` users; otherwise it is treated as zero until the next
+    full rebuild. Per-update cost is therefore bounded by
+    max_user_history * max_exact_degree.
+    """
+
+    def __init__(self, top_n=20, max_user_history=100, max_exact_degree=500):
+        """Create an empty model"""
+        self.top_n = top_n
+        self.max_user_history = max_user_history
+        self.max_exact_degree = max_exact_degree
+        self.user_cells = {}      # user_id -> {event_id: [weight_sum, count]}, oldest first
+        self.event_users = {}     # event_id -> set of user ids with a non-empty cell
+        self.event_norm2 = {}     # event_id -> squared L2 norm of the event column
+        self.dots = {}            # event_id -> {neighbour_id: column dot product}
+        self.listed_in = {}       # neighbour_id -> set of event ids whose row lists it
+
+    @classmethod
+    def from_engine(cls, engine, top_n=20, max_user_history=100, max_exact_degree=500):
+        """Seed the model from a fully built SparseCFEngine"""
+        model = cls(top_n=top_n, max_user_history=max_user_history, max_exact_degree=max_exact_degree)
+        if engine is None:
+            return model
+
+        matrix, counts = engine.matrix, engine.counts
+        for row, user_id in enumerate(engine.user_ids):
+            user_id = int(user_id)
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            cells = {}
+            for index in range(start, end):
+                event_id = int(engine.event_ids[matrix.indices[index]])
+                mean = float(matrix.data[index])
+                count = float(counts.data[index]) if counts is not None else 1.0
+                cells[event_id] = [mean * count, count]
+                model.event_users.setdefault(event_id, set()).add(user_id)
+                model.event_norm2[event_id] = model.event_norm2.get(event_id, 0.0) + mean * mean
+            model.user_cells[user_id] = cells
+
+        for event_id, neighbor_id, score in engine.item_neighbours(top_n):
+            norm = math.sqrt(model.event_norm2[event_id] * model.event_norm2[neighbor_id])
+            model.dots.setdefault(event_id, {})[neighbor_id] = score * norm
+            model.listed_in.setdefault(neighbor_id, set()).add(event_id)
+        return model
+
+    def apply(self, user_id, event_id, interaction_type):
+        """
+        Fold one interaction into the model.
+        Returns the set of event ids whose neighbour rows changed.
+        """
+        cells = self.user_cells.setdefault(user_id, {})
+        weight_sum, count = cells.pop(event_id, [0.0, 0.0])
+        old_weight = weight_sum / count if count else 0.0
+        weight_sum += interaction_weight(interaction_type)
+        count += 1
+        new_weight = weight_sum / count
+        # Re-insert so the cell moves to the most recent end of the user's history
+        cells[event_id] = [weight_sum, count]
+        self.event_users.setdefault(event_id, set()).add(user_id)
+
+        self.event_norm2[event_id] = max(
+            self.event_norm2.get(event_id, 0.0) + new_weight * new_weight - old_weight * old_weight, 0.0
+        )
+
+        # Every similarity in the event's row, and in the rows listing it, depends on its norm
+        affected = {event_id} | self.listed_in.get(event_id, set())
+        delta = new_weight - old_weight
+        if delta == 0:
+            return affected
+
+        history = list(cells.items())[-(self.max_user_history + 1):]
+        for other_id, (other_sum, other_count) in history:
+            if other_id == event_id:
+                continue
+
+            dot = self._tracked_dot(event_id, other_id)
+            if dot is None:
+                # The exact dot already includes this user's updated cell
+                dot = self._exact_dot(event_id, other_id)
+                if dot is None:
+                    dot = delta * (other_sum / other_count)
+            else:
+                dot += delta * (other_sum / other_count)
+
+            self._offer(event_id, other_id, dot)
+            self._offer(other_id, event_id, dot)
+            affected.add(other_id)
+
+        return affected
+
+    def _tracked_dot(self, event_id, other_id):
+        """Return the stored dot product for a pair, if either row tracks it"""
+        dot = self.dots.get(event_id, {}).get(other_id)
+        if dot is None:
+            dot = self.dots.get(other_id, {}).get(event_id)
+        return dot
+
+    def _exact_dot(self, event_id, other_id):
+        """Compute a pair's dot product from shared users, or None if too costly"""
+        users = self.event_users.get(event_id, set())
+        other_users = self.event_users.get(other_id, set())
+        if len(users) > len(other_users):
+            users, other_users = other_users, users
+        if len(users) > self.max_exact_degree:
+            return None
+
+        dot = 0.0
+        for user_id in users:
+            if user_id in other_users:
+                cells = self.user_cells[user_id]
+                first, second = cells[event_id], cells[other_id]
+                dot += (first[0] / first[1]) * (second[0] / second[1])
+        return dot
+
+    def similarity(self, event_id, neighbor_id, dot):
+        """Convert a column dot product into cosine similarity using current norms"""
+        norm = math.sqrt(self.event_norm2.get(event_id, 0.0) * self.event_norm2.get(neighbor_id, 0.0))
+        return dot / norm if norm > 0 else 0.0
+
+    def _offer(self, event_id, neighbor_id, dot):
+        """Insert or update a neighbour, evicting the weakest one if the row is full"""
+        row = self.dots.setdefault(event_id, {})
+        if dot <= 0:
+            if row.pop(neighbor_id, None) is not None:
+                self.listed_in[neighbor_id].discard(event_id)
+            return
+        row[neighbor_id] = dot
+        self.listed_in.setdefault(neighbor_id, set()).add(event_id)
+        if len(row) > self.top_n:
+            weakest = min(row, key=lambda other_id: self.similarity(event_id, other_id, row[other_id]))
+            del row[weakest]
+            self.listed_in[weakest].discard(event_id)
+
+    def remove_event(self, event_id):
+        """
+        Forget a deleted event. Returns the ids of the other events whose rows listed it
+        (their rows changed).
+        """
+        for user_id in self.event_users.pop(event_id, set()):
+            self.user_cells.get(user_id, {}).pop(event_id, None)
+        self.event_norm2.pop(event_id, None)
+        for neighbor_id in self.dots.pop(event_id, {}):
+            self.listed_in.get(neighbor_id, set()).discard(event_id)
+        listing = self.listed_in.pop(event_id, set())
+        for other_id in listing:
+            self.dots.get(other_id, {}).pop(event_id, None)
+        return listing
+
+    def neighbours_of(self, event_id):
+        """Return the event's neighbours as (neighbour_id, similarity), best first"""
+        scored = (
+            (neighbor_id, self.similarity(event_id, neighbor_id, dot))
+            for neighbor_id, dot in self.dots.get(event_id, {}).items()
+        )
+        return heapq.nlargest(self.top_n, scored, key=lambda item: item[1])
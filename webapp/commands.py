@@ -1,5 +1,6 @@
 # webapp/commands.py
 import click
+from flask import current_app
 from flask.cli import with_appcontext
 from webapp.models import db, User, UserInterests, Event, EventAttendee, UserEventInteraction
 from faker import Faker
@@ -7,7 +8,19 @@ import random
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
 import json
+import os
 import math
+from webapp.similarity_index import rebuild_similarity_index, SimilarityIndexFollower, DEFAULT_NEIGHBOURS, FOLLOW_TRAILING_IDS
+from webapp.popularity import fold_popularity_shards
+from webapp.rollups import backfill_rollups, rebuild_starts
+from webapp.retention import InteractionCompactor, parse_retention_policy, ARCHIVE_FORMATS, DEFAULT_BATCH_SIZE
+from webapp.query_plans import check_query_plans
+from webapp.event_counters import reconcile_event_counters, RECENT_INTERACTION_DAYS
+from webapp.geocoding import build_index, read_cities, source_stamp, BUNDLED_CITIES, ReverseGeocoder
+from webapp.partitions import (
+    is_partitioned, list_partitions, ensure_partitions, drop_partitions_before,
+    partition_name, month_start, add_months, DEFAULT_MONTHS_AHEAD
+)
 
 # Initialize Faker
 fake = Faker()
@@ -55,6 +68,7 @@ from webapp.models import db, Event, User, UserInterests, EventAttendee
 import re
 from datetime import datetime, timedelta
 import random
+import time
 
 # Add this to your existing commands.py file
 
@@ -211,6 +225,172 @@ def seed_db_command(users, events, reset):
     # Verify data after seeding
     verify_database()
 
+@click.command('rebuild-similarity')
+@click.option('--neighbours', default=DEFAULT_NEIGHBOURS, help='Number of similar events to keep per event')
+@with_appcontext
+def rebuild_similarity_command(neighbours):
+    """Rebuild the precomputed event-event similarity index from user interactions."""
+    click.echo(f'Rebuilding event similarity index ({neighbours} neighbours per event)...')
+    start = datetime.utcnow()
+    written = rebuild_similarity_index(top_n=neighbours)
+    elapsed = (datetime.utcnow() - start).total_seconds()
+    click.echo(f'Stored {written} event similarity entries in {elapsed:.2f}s')
+
+@click.command('follow-similarity')
+@click.option('--neighbours', default=DEFAULT_NEIGHBOURS, help='Number of similar events to keep per event')
+@click.option('--interval', default=2.0, help='Seconds to wait between polls for new interactions')
+@click.option('--rebuild-every', default=3600, help='Seconds between full rebuilds (0 to disable)')
+@click.option('--trailing-ids', default=FOLLOW_TRAILING_IDS, help='Ids below the newest one re-read for late commits')
+@with_appcontext
+def follow_similarity_command(neighbours, interval, rebuild_every, trailing_ids):
+    """Keep the event similarity index up to date as new interactions are tracked."""
+    follower = SimilarityIndexFollower(top_n=neighbours, trailing_ids=trailing_ids)
+    click.echo('Bootstrapping event similarity model...')
+    follower.bootstrap()
+    click.echo(f'Following user_event_interactions from id {follower.cursor} (Ctrl+C to stop)')
+    try:
+        follower.run(interval=interval, rebuild_every=rebuild_every or None)
+    except KeyboardInterrupt:
+        click.echo(f'Stopped at interaction id {follower.cursor}')
+
+@click.command('fold-popularity')
+@click.option('--interval', default=0.0, help='Keep folding every N seconds (0 folds once)')
+@with_appcontext
+def fold_popularity_command(interval):
+    """Fold pending sharded popularity boosts into event popularity."""
+    while True:
+        updated = fold_popularity_shards()
+        click.echo(f'Folded popularity shards into {updated} events')
+        if not interval:
+            break
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+@click.command('backfill-rollups')
+@click.option('--days', default=0, help='Only rebuild buckets from the last N days (0 rebuilds every hour that still has raw interactions)')
+@with_appcontext
+def backfill_rollups_command(days):
+    """
+    Rebuild the hourly interaction rollups from user_event_interactions. Hours whose raw
+    interactions were compacted or dropped keep their rollups.
+    """
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    for interaction_type, first_bucket in sorted(rebuild_starts(since).items()):
+        click.echo(f'{interaction_type:>16}: rebuilding from {first_bucket:%Y-%m-%d %H:00}')
+    start = datetime.utcnow()
+    buckets = backfill_rollups(since=since)
+    elapsed = (datetime.utcnow() - start).total_seconds()
+    click.echo(f'Stored {buckets} interaction rollup buckets in {elapsed:.2f}s')
+
+@click.command('compact-interactions')
+@click.option('--policy', default=lambda: os.getenv('INTERACTION_RETENTION', ''),
+              help='Per-type retention overrides, e.g. "impression=30,view=90,click=forever"')
+@click.option('--archive-dir', default=lambda: os.getenv('INTERACTION_ARCHIVE_DIR') or None,
+              help='Directory for archived interaction files (default: archive/ in the instance folder)')
+@click.option('--format', 'archive_format', type=click.Choice(ARCHIVE_FORMATS), default='jsonl',
+              help='Archive file format (parquet requires pyarrow)')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, help='Rows archived and deleted per transaction')
+@click.option('--pause', default=0.0, help='Seconds to sleep between batches')
+@click.option('--dry-run', is_flag=True, help='Only report how many rows are past their TTL')
+@with_appcontext
+def compact_interactions_command(policy, archive_dir, archive_format, batch_size, pause, dry_run):
+    """Archive, summarize and delete interactions past their retention period."""
+    compactor = InteractionCompactor(
+        policy=parse_retention_policy(policy),
+        archive_dir=archive_dir,
+        archive_format=archive_format,
+        batch_size=batch_size,
+        pause=pause
+    )
+    click.echo('Retention policy: ' + ', '.join(f'{t}={d}d' for t, d in compactor.policy.items()))
+    if dry_run:
+        for interaction_type, count in compactor.count_expired().items():
+            click.echo(f'- {interaction_type}: {count} rows past their TTL')
+        return
+    
+    start = datetime.utcnow()
+    removed = compactor.run(log=click.echo)
+    elapsed = (datetime.utcnow() - start).total_seconds()
+    click.echo(f'Compacted {sum(removed.values())} interactions in {elapsed:.2f}s')
+
+@click.command('manage-partitions')
+@click.option('--months-ahead', default=DEFAULT_MONTHS_AHEAD, help='Create partitions for this many upcoming months')
+@click.option('--retain-months', type=int, default=lambda: int(os.getenv('INTERACTION_PARTITION_RETAIN_MONTHS', 0)),
+              help='Drop partitions older than this many months, after summarizing them (0 keeps everything)')
+@click.option('--policy', default=lambda: os.getenv('INTERACTION_RETENTION', ''),
+              help='Per-type retention overrides; rows it still keeps are moved out before a drop')
+@with_appcontext
+def manage_partitions_command(months_ahead, retain_months, policy):
+    """Create upcoming and drop expired monthly partitions of user_event_interactions (PostgreSQL)."""
+    if not is_partitioned():
+        click.echo('user_event_interactions is not partitioned (PostgreSQL only, run `flask db upgrade`)')
+        return
+
+    for name in ensure_partitions(months_ahead):
+        click.echo(f'Created partition {name}')
+    if retain_months:
+        cutoff = add_months(month_start(datetime.utcnow()), -retain_months)
+        for name, kept in drop_partitions_before(cutoff, policy=parse_retention_policy(policy)):
+            click.echo(f'Summarized and dropped partition {name} ({kept} retained rows moved to the default partition)')
+    click.echo('Partitions: ' + ', '.join(partition_name(month) for month in list_partitions()))
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print every plan, not only the failing ones')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """EXPLAIN the hot queries and check that each one uses its index (exits 1 if not)."""
+    user_id = db.session.query(User.id).limit(1).scalar() or 1
+    event_id = db.session.query(Event.id).limit(1).scalar() or 1
+    failures = 0
+    for name, index_names, used_index, plan in check_query_plans(user_id, event_id):
+        if used_index:
+            click.echo(f"     ok  {name} ({used_index})")
+        else:
+            click.echo(f"MISSING  {name} (expected {' or '.join(index_names)})")
+            failures += 1
+        if verbose or not used_index:
+            for line in plan:
+                click.echo(f'         {line}')
+    if failures:
+        raise SystemExit(1)
+
+@click.command('reconcile-event-counters')
+@click.option('--days', default=RECENT_INTERACTION_DAYS, help='Window of recent_interaction_count in days')
+@with_appcontext
+def reconcile_event_counters_command(days):
+    """Recompute the denormalized attendee and recent interaction counters on events (run from cron)."""
+    start = datetime.utcnow()
+    fixed = reconcile_event_counters(days)
+    elapsed = (datetime.utcnow() - start).total_seconds()
+    for column, count in fixed.items():
+        click.echo(f'- {column}: corrected {count} events')
+    click.echo(f'Reconciled event counters in {elapsed:.2f}s')
+
+@click.command('build-geocoder')
+@click.option('--source', default=BUNDLED_CITIES, help='City table: the bundled CSV format or a GeoNames cities*.txt dump')
+@click.option('--admin1', 'admin1_path', default=None, help='GeoNames admin1CodesASCII.txt, for region names')
+@click.option('--countries', 'countries_path', default=None, help='GeoNames countryInfo.txt, for country names')
+@click.option('--min-population', default=0, help='Skip smaller places (GeoNames dumps only)')
+@click.option('--data-dir', default=None, help='Index directory (default: GEOCODER_DATA_DIR or instance/geocoder)')
+@click.option('--check', 'check_points', multiple=True, help='lat,lng to resolve with the new index (repeatable)')
+@with_appcontext
+def build_geocoder_command(source, admin1_path, countries_path, min_population, data_dir, check_points):
+    """Build the memory-mappable reverse geocoding index from a city table."""
+    data_dir = data_dir or os.getenv('GEOCODER_DATA_DIR') or os.path.join(current_app.instance_path, 'geocoder')
+    options = {'admin1_path': admin1_path, 'countries_path': countries_path, 'min_population': min_population}
+    cities = read_cities(source, **options)
+    start = datetime.utcnow()
+    count = build_index(cities, data_dir, source_stamp(source, **options))
+    elapsed = (datetime.utcnow() - start).total_seconds()
+    click.echo(f'Indexed {count} cities in {data_dir} in {elapsed:.2f}s (restart the workers to load it)')
+
+    geocoder = ReverseGeocoder(data_dir, nominatim=False)
+    for point in check_points:
+        lat, lng = (float(value) for value in point.split(','))
+        click.echo(f'- {point}: {geocoder.nearest_city(lat, lng)}')
+
 def verify_database():
     """Verify the database has valid data after seeding."""
     click.echo("\nVerifying database:")
@@ -539,6 +719,8 @@ def create_attendees_and_interactions(users, events):
     
     # Final commit
     db.session.commit()
+    # Attendees were added directly, bring the denormalized counters up to date
+    reconcile_event_counters()
     click.echo(f"Created {total_attendees} event attendees and {total_interactions} user-event interactions")
 
 # Add these methods to the Event model
@@ -576,7 +758,7 @@ def add_event_model_methods():
     if not hasattr(Event, '_original_calculate_trending_score'):
         Event._original_calculate_trending_score = Event.calculate_trending_score
         
-        def safe_calculate_trending_score(self):
+        def safe_calculate_trending_score(self, recent_interactions=None):
             """Calculate a trending score for the event, safely handling None dates"""
             score = 50  # Base score
             
@@ -0,0 +1,75 @@
+# webapp/event_counters.py
+"""
+Denormalized counters on Event: attendee_count and recent_interaction_count.
+
+attendee_count is changed in the same transaction as the attendance itself
+(EventAttendee.join / EventAttendee.leave). recent_interaction_count is a snapshot of
+the interactions of the last RECENT_INTERACTION_DAYS days: interaction writes never
+touch the event rows (every write updating the same popular event would contend on it),
+so reconcile_event_counters() recomputes it from the hourly rollups. Run `flask
+reconcile-event-counters` from cron, e.g. hourly; it also repairs attendee counts that
+drifted, e.g. after attendances were changed outside the application. Code that needs
+current counts reads the rollups instead (recent_interaction_counts()).
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from webapp.models import db, Event, EventAttendee, InteractionRollup, IN_CLAUSE_CHUNK_SIZE
+
+RECENT_INTERACTION_DAYS = 7
+
+
+def window_start(days, now=None):
+    """Start of the hour `days` days ago: the first rollup bucket counted as recent"""
+    return ((now or datetime.utcnow()) - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+
+
+def recent_interaction_counts(event_ids, days=RECENT_INTERACTION_DAYS, now=None):
+    """
+    Return {event_id: interactions since the hour boundary `days` days ago} for the given
+    events: the value reconcile_event_counters() stores, summed from the rollups only
+    (one query per chunk of events).
+    """
+    since = window_start(days, now)
+    counts = {}
+    event_ids = list(event_ids)
+    for start in range(0, len(event_ids), IN_CLAUSE_CHUNK_SIZE):
+        chunk = event_ids[start:start + IN_CLAUSE_CHUNK_SIZE]
+        counts.update(db.session.query(
+            InteractionRollup.event_id, func.sum(InteractionRollup.count)
+        ).filter(
+            InteractionRollup.event_id.in_(chunk),
+            InteractionRollup.bucket >= since
+        ).group_by(InteractionRollup.event_id))
+    return {event_id: int(count) for event_id, count in counts.items()}
+
+
+def reconcile_event_counters(days=RECENT_INTERACTION_DAYS, now=None):
+    """
+    Recompute attendee_count and recent_interaction_count for every event whose stored
+    value differs and commit. The interaction window starts at the hour boundary
+    `days` days ago. Returns {'attendee_count': events fixed, 'recent_interaction_count': events fixed}.
+    """
+    since = window_start(days, now)
+    event_table = Event.__table__
+
+    attendees = select(func.count()).where(
+        EventAttendee.event_id == event_table.c.id
+    ).scalar_subquery()
+    recent = select(func.coalesce(func.sum(InteractionRollup.count), 0)).where(
+        InteractionRollup.event_id == event_table.c.id,
+        InteractionRollup.bucket >= since
+    ).scalar_subquery()
+
+    fixed = {}
+    for column, actual in (
+        (event_table.c.attendee_count, attendees),
+        (event_table.c.recent_interaction_count, recent),
+    ):
+        result = db.session.execute(
+            update(event_table).where(column != actual).values({column: actual})
+        )
+        fixed[column.name] = result.rowcount
+    db.session.commit()
+    return fixed
@@ -0,0 +1,64 @@
+# webapp/event_listings.py
+"""
+Listing-ready event queries for the list pages (browse, my events, joined events,
+recommendations).
+
+Every listing loads its events with the organizer preloaded (selectinload, one extra
+query for the whole page) and the current user's attendances for those events in one
+more query, so rendering a page of N events takes a constant number of statements.
+Attendee counts come from the denormalized Event.attendee_count column.
+Templates get the events plus an `attendance` dict {event_id: EventAttendee}.
+"""
+from sqlalchemy.orm import selectinload
+
+from webapp.models import Event, EventAttendee, IN_CLAUSE_CHUNK_SIZE
+
+
+def listing_query():
+    """Event query with everything a listing row renders preloaded"""
+    return Event.query.options(selectinload(Event.organizer))
+
+
+def public_events():
+    """Public events, soonest first"""
+    return listing_query().filter(Event.privacy == 'public').order_by(Event.date).all()
+
+
+def organized_events(user_id):
+    """Events organized by a user, soonest first"""
+    return listing_query().filter(Event.organizer_id == user_id).order_by(Event.date).all()
+
+
+def joined_events(user_id):
+    """Events a user attends, soonest first"""
+    return listing_query().join(
+        EventAttendee, EventAttendee.event_id == Event.id
+    ).filter(EventAttendee.user_id == user_id).order_by(Event.date).all()
+
+
+def events_by_ids(event_ids):
+    """Events for the given ids, in the order of the ids (missing ones are skipped)"""
+    event_ids = list(event_ids)
+    events_by_id = {}
+    for start in range(0, len(event_ids), IN_CLAUSE_CHUNK_SIZE):
+        chunk = event_ids[start:start + IN_CLAUSE_CHUNK_SIZE]
+        events_by_id.update((event.id, event) for event in listing_query().filter(Event.id.in_(chunk)))
+    return [events_by_id[event_id] for event_id in event_ids if event_id in events_by_id]
+
+
+def attendance_map(user_id, events):
+    """Return {event_id: EventAttendee} of a user for the given events, with one query per chunk"""
+    if user_id is None:
+        return {}
+    event_ids = [event.id for event in events]
+    attendance = {}
+    for start in range(0, len(event_ids), IN_CLAUSE_CHUNK_SIZE):
+        chunk = event_ids[start:start + IN_CLAUSE_CHUNK_SIZE]
+        attendance.update(
+            (attendee.event_id, attendee)
+            for attendee in EventAttendee.query.filter(
+                EventAttendee.user_id == user_id,
+                EventAttendee.event_id.in_(chunk)
+            )
+        )
+    return attendance
@@ -0,0 +1,47 @@
+# webapp/geo.py
+"""
+Geographic helpers shared by the recommenders and location lookups.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Calculate distance between two points in kilometers using Haversine formula"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = math.radians(lon2) - math.radians(lon1)
+
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Return (min_lat, max_lat, min_lon, max_lon) of a box containing every point within
+    radius_km of (lat, lon). Used to pre-filter rows with plain column comparisons.
+    Near the antimeridian the longitudes run past +-180; longitude_ranges() splits them
+    into ranges of stored longitudes.
+    """
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    # Near the poles the box spans every longitude
+    lon_delta = 180.0 if cos_lat < 1e-6 else min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+
+def longitude_ranges(min_lon, max_lon):
+    """
+    Split a box's longitude span into [(low, high), ...] within -180..180: one range
+    normally, two when the box crosses the antimeridian.
+    """
+    if max_lon - min_lon >= 360:
+        return [(-180.0, 180.0)]
+    if min_lon < -180:
+        return [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return [(min_lon, max_lon)]
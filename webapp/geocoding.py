@@ -0,0 +1,462 @@
+# webapp/geocoding.py
+"""
+Reverse geocoding of browser coordinates to a city name for event searches.
+
+Lookups are answered offline from a city table (GeoNames-style: name, admin1, country,
+coordinates, population). The bundled webapp/data/cities.csv covers Kenya and East
+Africa in detail and major cities elsewhere; `flask build-geocoder --source` builds the
+index from a full GeoNames dump (e.g. cities15000.txt) instead.
+
+The index is a set of .npy files (unit vectors of the cities, populations and labels)
+that every worker opens with mmap_mode='r', so they share one copy through the page
+cache; each worker builds a cKDTree over the mapped points without copying them. The
+index is built from the bundled table on first use if it does not exist yet. Next to it,
+source.json records the table it was built from (path, mtime and SHA-256, and the
+GeoNames options); a worker loading an index whose table has changed since rebuilds it.
+
+A point is resolved to the largest city whose area (a radius growing with the square
+root of its population) contains it, otherwise to the nearest city within
+max_distance_km. Points farther from every known city go to Nominatim, if enabled.
+
+Nominatim answers are cached in a GeocodeCache keyed on the geohash of the point
+(precision 6 is a cell of about 1.2 x 0.6 km), so nearby browsers share one lookup. The
+cache keeps an LRU in memory in front of a SQLite table that survives restarts. Offline
+answers take microseconds and are not cached, so they always come from the current index.
+"""
+import csv
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import requests
+from scipy.spatial import cKDTree
+
+from webapp.cache import TTLCache
+from webapp.geo import EARTH_RADIUS_KM
+
+BUNDLED_CITIES = os.path.join(os.path.dirname(__file__), 'data', 'cities.csv')
+INDEX_FILES = ('points', 'populations', 'labels')
+INDEX_STAMP = 'source.json'
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/reverse'
+NOMINATIM_USER_AGENT = 'EventFlowAI/1.0'
+
+# Area of a city: CITY_RADIUS_PER_SQRT_POPULATION * sqrt(population) km, at least
+# MIN_CITY_RADIUS_KM (Nairobi ~21 km, Kisumu ~8 km, a town of 20 000 ~2 km)
+CITY_RADIUS_PER_SQRT_POPULATION = 0.01
+MIN_CITY_RADIUS_KM = 2.0
+LARGEST_CITY_RADIUS_KM = 60.0
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+DEFAULT_GEOHASH_PRECISION = 6
+DEFAULT_GEOCODE_TTL = 30 * 86400
+# Places nobody knows are looked up again sooner than resolved ones
+DEFAULT_NEGATIVE_GEOCODE_TTL = 86400
+
+
+def geohash(lat, lng, precision=DEFAULT_GEOHASH_PRECISION):
+    """Standard base32 geohash of a point; each extra character narrows the cell ~32 times"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        coordinate, bounds = (lng, lng_range) if even else (lat, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+class GeocodeCache:
+    """
+    Cache of geocoding results: reverse lookups keyed on the geohash of the point,
+    forward lookups on the normalized location string. An LRU TTLCache in memory sits in
+    front of an optional SQLite table. Results (None included, with the shorter
+    negative_ttl) are cached; exceptions raised by the lookup are not. An unreadable
+    SQLite table counts as a miss.
+    """
+
+    def __init__(self, path=None, precision=DEFAULT_GEOHASH_PRECISION, ttl=DEFAULT_GEOCODE_TTL,
+                 negative_ttl=DEFAULT_NEGATIVE_GEOCODE_TTL, max_entries=10000):
+        """Create the cache; without a path only the in-memory tier is used"""
+        self.precision = precision
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._connection = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS geocode_cache ('
+                '  key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL'
+                ')'
+            )
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'lookups_failed': 0, 'persistent_errors': 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def reverse(self, lat, lng, lookup):
+        """Return the cached result for the point's geohash cell, calling lookup(lat, lng) on a miss"""
+        return self.get_or_lookup(f'reverse:{geohash(lat, lng, self.precision)}', lambda: lookup(lat, lng))
+
+    def forward(self, location, lookup):
+        """Return the cached result for a location string, calling lookup(location) on a miss"""
+        key = 'forward:' + ' '.join(location.lower().split())
+        return self.get_or_lookup(key, lambda: lookup(location))
+
+    def get_or_lookup(self, key, lookup):
+        """Return the cached value of key (which may be None), calling lookup() on a miss"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._count('memory_hits')
+            return entry[0]
+
+        if self._connection is not None:
+            try:
+                with self._lock:
+                    row = self._connection.execute(
+                        'SELECT value, expires_at FROM geocode_cache WHERE key = ?', (key,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                self._count('persistent_errors')
+                print(f"Error reading geocode cache: {e}")
+                row = None
+            if row is not None and row[1] > time.time():
+                self._count('persistent_hits')
+                value = json.loads(row[0])
+                self._memory.set(key, (value,), ttl=row[1] - time.time())
+                return value
+
+        self._count('misses')
+        try:
+            value = lookup()
+        except Exception:
+            self._count('lookups_failed')
+            raise
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._memory.set(key, (value,), ttl=ttl)
+        if self._connection is None:
+            return
+        with self._lock:
+            try:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO geocode_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), time.time() + ttl)
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._connection.execute('DELETE FROM geocode_cache WHERE expires_at < ?', (time.time(),))
+            except sqlite3.Error as e:
+                self.counters['persistent_errors'] += 1
+                print(f"Error writing geocode cache: {e}")
+
+    def stats(self):
+        """Return hit/miss counters, the hit ratio and the lookups that went upstream"""
+        with self._lock:
+            counters = dict(self.counters)
+        hits = counters['memory_hits'] + counters['persistent_hits']
+        lookups = hits + counters['misses']
+        return dict(
+            counters,
+            entries=len(self._memory),
+            precision=self.precision,
+            persistent=self._connection is not None,
+            hit_ratio=hits / lookups if lookups else 0.0
+        )
+
+
+def unit_vectors(latitudes, longitudes):
+    """Convert degrees to points on the unit sphere, so that euclidean nearest is great-circle nearest"""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lng = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    """Great-circle distance in km for a chord between unit vectors"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.asarray(chord) / 2))
+
+
+def km_to_chord(km):
+    """Chord between unit vectors for a great-circle distance in km"""
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+def read_city_table(path):
+    """Read the bundled CSV format; yields (name, admin1, country, lat, lng, population)"""
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield (row['name'], row['admin1'], row['country'], float(row['latitude']),
+                   float(row['longitude']), int(row['population'] or 0))
+
+
+def read_geonames(path, admin1_path=None, countries_path=None, min_population=0):
+    """
+    Read a GeoNames cities dump (cities500.txt ... cities15000.txt, tab separated). Admin1
+    and country codes are replaced by names when admin1CodesASCII.txt and countryInfo.txt
+    are given. Yields (name, admin1, country, lat, lng, population).
+    """
+    admin1_names = {}
+    if admin1_path:
+        with open(admin1_path, encoding='utf-8') as f:
+            for line in f:
+                columns = line.rstrip('\n').split('\t')
+                admin1_names[columns[0]] = columns[1]
+    country_names = {}
+    if countries_path:
+        with open(countries_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.startswith('#'):
+                    columns = line.rstrip('\n').split('\t')
+                    country_names[columns[0]] = columns[4]
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            columns = line.rstrip('\n').split('\t')
+            population = int(columns[14] or 0)
+            if population < min_population:
+                continue
+            country_code, admin1_code = columns[8], columns[10]
+            yield (
+                columns[1],
+                admin1_names.get(f'{country_code}.{admin1_code}', admin1_code),
+                country_names.get(country_code, country_code),
+                float(columns[4]),
+                float(columns[5]),
+                population
+            )
+
+
+def read_cities(source, admin1_path=None, countries_path=None, min_population=0):
+    """Read a city table: the bundled CSV format, or else a GeoNames dump"""
+    if source.endswith('.csv'):
+        return read_city_table(source)
+    return read_geonames(source, admin1_path, countries_path, min_population)
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_stamp(source, admin1_path=None, countries_path=None, min_population=0):
+    """Describe the city table an index is built from, for index_is_current()"""
+    return {
+        'source': os.path.abspath(source),
+        'mtime_ns': os.stat(source).st_mtime_ns,
+        'sha256': file_sha256(source),
+        'admin1_path': admin1_path and os.path.abspath(admin1_path),
+        'countries_path': countries_path and os.path.abspath(countries_path),
+        'min_population': min_population,
+    }
+
+
+def read_stamp(data_dir):
+    """Return the source stamp of the index in data_dir, or None"""
+    try:
+        with open(os.path.join(data_dir, INDEX_STAMP), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def index_is_current(stamp):
+    """
+    Check whether the table named by a stamp is unchanged: same mtime, or else same
+    contents. A table that no longer exists keeps its index.
+    """
+    try:
+        if os.stat(stamp['source']).st_mtime_ns == stamp['mtime_ns']:
+            return True
+        return file_sha256(stamp['source']) == stamp['sha256']
+    except FileNotFoundError:
+        return True
+
+
+def build_index(cities, data_dir, stamp=None):
+    """
+    Write the memory-mappable index for (name, admin1, country, lat, lng, population)
+    rows to data_dir, with the source stamp (see source_stamp()) if given. Files are
+    written under temporary names and renamed into place, so workers building
+    concurrently or reading meanwhile never see partial files; the stamp is written last.
+    Returns the number of cities.
+    """
+    cities = list(cities)
+    if not cities:
+        raise ValueError('No cities to index')
+    os.makedirs(data_dir, exist_ok=True)
+    arrays = {
+        'points': unit_vectors([city[3] for city in cities], [city[4] for city in cities]),
+        'populations': np.array([city[5] for city in cities], dtype=np.float64),
+        'labels': np.array([city[:3] for city in cities], dtype=str),
+    }
+    suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+    for name in INDEX_FILES:
+        np.save(os.path.join(data_dir, name + suffix), arrays[name])
+    for name in INDEX_FILES:
+        os.replace(os.path.join(data_dir, name + suffix), os.path.join(data_dir, name + '.npy'))
+    if stamp is not None:
+        stamp_path = os.path.join(data_dir, INDEX_STAMP)
+        with open(stamp_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(stamp, f)
+        os.replace(stamp_path + suffix, stamp_path)
+    return len(cities)
+
+
+def nominatim_reverse(lat, lng, timeout=3):
+    """
+    Resolve coordinates with Nominatim to the city, county, state or country, in that
+    order of preference. Returns None if Nominatim has no usable answer.
+    """
+    response = requests.get(
+        NOMINATIM_URL,
+        params={'lat': lat, 'lon': lng, 'format': 'json'},
+        headers={'User-Agent': NOMINATIM_USER_AGENT},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    address = response.json().get('address', {})
+    return (
+        address.get('city') or
+        address.get('county') or
+        address.get('state') or
+        address.get('country')
+    )
+
+
+class ReverseGeocoder:
+    """Offline city lookup with an optional Nominatim fallback, whose answers are cached"""
+
+    def __init__(self, data_dir, source=BUNDLED_CITIES, max_distance_km=25,
+                 nominatim=True, nominatim_timeout=3, cache=None):
+        """
+        data_dir: where the .npy index lives (built from `source` if missing or unstamped,
+        rebuilt from the table it was built from if that changed)
+        max_distance_km: points farther than this from every city are not resolved offline
+        nominatim: fall back to Nominatim for those points
+        cache: GeocodeCache for the Nominatim resolutions (in-memory only by default)
+        """
+        self.data_dir = data_dir
+        self.source = source
+        self.max_distance_km = max_distance_km
+        self.nominatim = nominatim
+        self.nominatim_timeout = nominatim_timeout
+        self.cache = cache or GeocodeCache()
+        self._load_lock = threading.Lock()
+        self._tree = None
+        self._lock = threading.Lock()
+        self.counters = {'offline_hits': 0, 'offline_misses': 0, 'nominatim_calls': 0, 'nominatim_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def load(self):
+        """Map the index files, (re)building them from their source table first if needed"""
+        with self._load_lock:
+            if self._tree is not None:
+                return
+            paths = [os.path.join(self.data_dir, name + '.npy') for name in INDEX_FILES]
+            stamp = read_stamp(self.data_dir)
+            if stamp is None or not all(os.path.exists(path) for path in paths):
+                print(f"Building reverse geocoding index in {self.data_dir} from {self.source}")
+                build_index(read_cities(self.source), self.data_dir, source_stamp(self.source))
+            elif not index_is_current(stamp):
+                print(f"Rebuilding reverse geocoding index in {self.data_dir}: {stamp['source']} changed")
+                options = {name: stamp[name] for name in ('admin1_path', 'countries_path', 'min_population')}
+                build_index(
+                    read_cities(stamp['source'], **options), self.data_dir, source_stamp(stamp['source'], **options)
+                )
+            arrays = [np.load(path, mmap_mode='r') for path in paths]
+            self._points, self._populations, self._labels = arrays
+            self._tree = cKDTree(self._points, copy_data=False)
+
+    def nearest_city(self, lat, lng):
+        """
+        Return {'city', 'state', 'country', 'distance_km'} for a point, or None if no city
+        in the index is within max_distance_km.
+        """
+        self.load()
+        point = unit_vectors([lat], [lng])[0]
+        search_km = max(self.max_distance_km, LARGEST_CITY_RADIUS_KM)
+        candidates = self._tree.query_ball_point(point, km_to_chord(search_km))
+        if not candidates:
+            return None
+        candidates = np.asarray(candidates)
+        distances = chord_to_km(np.linalg.norm(self._points[candidates] - point, axis=1))
+        populations = self._populations[candidates]
+        radii = np.clip(CITY_RADIUS_PER_SQRT_POPULATION * np.sqrt(populations), MIN_CITY_RADIUS_KM, LARGEST_CITY_RADIUS_KM)
+
+        inside = np.flatnonzero(distances <= radii)
+        if len(inside):
+            # The largest city whose area contains the point
+            best = inside[np.argmax(populations[inside])]
+        else:
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance_km:
+                return None
+        city, state, country = (str(value) for value in self._labels[candidates[best]])
+        return {'city': city, 'state': state, 'country': country, 'distance_km': float(distances[best])}
+
+    def resolve(self, lat, lng):
+        """Return a location name usable as a SerpApi search location, or None"""
+        try:
+            city = self.nearest_city(lat, lng)
+            if city is not None:
+                self._count('offline_hits')
+                return city['city']
+            self._count('offline_misses')
+            if not self.nominatim:
+                return None
+            return self.cache.reverse(lat, lng, self._nominatim)
+        except Exception as e:
+            print(f"Error in reverse geocoding: {e}")
+            return None
+
+    def _nominatim(self, lat, lng):
+        """Uncached Nominatim lookup; raises on failure so that the failure is not cached"""
+        self._count('nominatim_calls')
+        try:
+            return nominatim_reverse(lat, lng, timeout=self.nominatim_timeout)
+        except Exception:
+            self._count('nominatim_errors')
+            raise
+
+    def stats(self):
+        """Return lookup counters and the number of indexed cities"""
+        with self._lock:
+            counters = dict(self.counters)
+        counters['cities'] = len(self._labels) if self._tree is not None else None
+        counters['cache'] = self.cache.stats()
+        return counters
+
@@ -0,0 +1,206 @@
+# webapp/interaction_buffer.py
+"""
+Write-behind buffer for tracked interactions.
+
+/api/track_interaction only validates the request and queues the interaction here.
+A background thread flushes the queue when it reaches `batch_size` interactions or
+every `flush_interval` seconds: one multi-row INSERT for the interactions and one
+aggregated popularity update per affected event (see webapp/popularity.py). With
+popularity shards enabled the flusher also folds the shards every `fold_interval`
+seconds, and on PostgreSQL it creates upcoming monthly interaction partitions every
+`partition_interval` seconds (see webapp/partitions.py). Whatever is still queued when
+the process exits is flushed by an atexit hook.
+
+A batch that fails on its data (e.g. a foreign key violation) is split in halves and
+retried until the offending rows are isolated; those are logged and counted as dead
+letters instead of being requeued forever. Other errors (e.g. a lost connection)
+requeue the rows that were not written. Listeners registered with add_listener() are
+called with each batch after it is committed.
+"""
+import atexit
+import threading
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+
+from webapp.models import db, UserEventInteraction
+from webapp.partitions import ensure_partitions
+from webapp.popularity import record_popularity, fold_popularity_shards
+from webapp.rollups import record_interaction_rollups
+
+
+def is_row_error(error):
+    """True if a write failed because of the rows themselves rather than the database"""
+    if isinstance(error, (IntegrityError, DataError)):
+        return True
+    # Parameters the driver could not bind (e.g. unserializable metadata)
+    return isinstance(error, StatementError) and not isinstance(error, DBAPIError)
+
+
+def write_interactions(rows, popularity_shards=0):
+    """
+    Insert interaction rows (dicts of user_id, event_id, interaction_type, timestamp,
+    interaction_metadata), update the hourly rollups and apply their popularity boosts,
+    without committing.
+    """
+    if not rows:
+        return
+
+    db.session.execute(insert(UserEventInteraction), rows)
+    record_interaction_rollups(rows)
+    record_popularity(rows, shards=popularity_shards)
+
+
+class InteractionBuffer:
+    """Queue of interactions flushed to the database in batches"""
+
+    def __init__(self, app, batch_size=500, flush_interval=1.0, max_pending=50000,
+                 popularity_shards=0, fold_interval=10.0, partition_interval=6 * 3600):
+        """Create an idle buffer; the flusher thread starts with the first interaction"""
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.popularity_shards = popularity_shards
+        self.fold_interval = fold_interval
+        self._last_fold = time.monotonic()
+        self.partition_interval = partition_interval
+        self._last_partition_check = None
+        self.enabled = True
+        self.flushed = 0
+        self.dropped = 0
+        self.dead_letters = 0
+        self._listeners = []
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        atexit.register(self.stop)
+
+    def add_listener(self, callback):
+        """Call callback(rows) after each batch of interaction rows is committed"""
+        self._listeners.append(callback)
+
+    def notify_written(self, rows):
+        """Pass committed rows to the listeners (also used for synchronous writes)"""
+        for callback in self._listeners:
+            try:
+                callback(rows)
+            except Exception as e:
+                self.app.logger.error(f"Error in interaction listener {callback.__name__}: {e}")
+
+    def add(self, row):
+        """Queue one interaction row"""
+        with self._lock:
+            self._pending.append(row)
+            pending = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='interaction-buffer', daemon=True)
+                self._thread.start()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        """Flush on size or time until stopped"""
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self.popularity_shards and time.monotonic() - self._last_fold >= self.fold_interval:
+                self.fold()
+            if self.partition_interval and (self._last_partition_check is None or
+                                            time.monotonic() - self._last_partition_check >= self.partition_interval):
+                self.maintain_partitions()
+
+    def maintain_partitions(self):
+        """Create the upcoming monthly interaction partitions (no-op unless partitioned)"""
+        self._last_partition_check = time.monotonic()
+        with self.app.app_context():
+            try:
+                for name in ensure_partitions():
+                    self.app.logger.info(f"Created interaction partition {name}")
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Error creating interaction partitions: {e}")
+
+    def fold(self):
+        """Fold pending popularity shards into the events"""
+        self._last_fold = time.monotonic()
+        with self.app.app_context():
+            try:
+                return fold_popularity_shards()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Error folding popularity shards: {e}")
+                return 0
+
+    def flush(self):
+        """Write everything queued so far. Returns the number of interactions written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+
+            written = 0
+            # Batches still to write, last one first; a failing batch is replaced by its halves
+            batches = [rows[start:start + self.batch_size] for start in range(0, len(rows), self.batch_size)]
+            batches.reverse()
+            with self.app.app_context():
+                while batches:
+                    batch = batches[-1]
+                    try:
+                        write_interactions(batch, self.popularity_shards)
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        if not is_row_error(e):
+                            self.app.logger.error(f"Error flushing {len(rows) - written} interactions: {e}")
+                            self._requeue([row for pending in reversed(batches) for row in pending])
+                            break
+                        batches.pop()
+                        if len(batch) == 1:
+                            self.dead_letters += 1
+                            self.app.logger.error(f"Dropping interaction that cannot be written: {batch[0]!r}: {e}")
+                        else:
+                            middle = len(batch) // 2
+                            batches.extend((batch[middle:], batch[:middle]))
+                        continue
+                    batches.pop()
+                    written += len(batch)
+                    self.flushed += len(batch)
+                    self.notify_written(batch)
+            return written
+
+    def _requeue(self, rows):
+        """Put rows back at the front of the queue, dropping the oldest beyond max_pending"""
+        with self._lock:
+            self._pending = rows + self._pending
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+
+    def stop(self):
+        """Stop the flusher thread and flush what is left"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+        if self.popularity_shards:
+            self.fold()
+
+    def stats(self):
+        """Return queue counters for monitoring"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'dead_letters': self.dead_letters
+        }
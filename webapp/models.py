@@ -3,11 +3,31 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.dialects.postgresql import JSONB
 
 # Initialize SQLAlchemy with no app yet
 db = SQLAlchemy()
 
+# Maximum number of ids bound into a single IN clause
+IN_CLAUSE_CHUNK_SIZE = 5000
+
+def _grouped_counts(event_id_column, event_ids, *filters):
+    """Count rows per event id with one GROUP BY query per chunk of ids."""
+    counts = {}
+    event_ids = list(event_ids)
+    for start in range(0, len(event_ids), IN_CLAUSE_CHUNK_SIZE):
+        chunk = event_ids[start:start + IN_CLAUSE_CHUNK_SIZE]
+        rows = db.session.query(
+            event_id_column,
+            db.func.count()
+        ).filter(
+            event_id_column.in_(chunk),
+            *filters
+        ).group_by(event_id_column).all()
+        counts.update(rows)
+    return counts
+
 # Models
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -116,6 +136,10 @@ class UserInterests(db.Model):
     # New: timestamp when this interest was added
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_user_interests_user_id', 'user_id'),
+    )
+
     def __repr__(self):
         """Return string representation of the user interest."""
         return f'<UserInterest {self.category}:{self.subcategory}>'
@@ -132,6 +156,48 @@ class EventAttendee(db.Model):
     synced_to_calendar = db.Column(db.Boolean, default=False)
     calendar_event_id = db.Column(db.String(256), nullable=True)
 
+    __table_args__ = (
+        # One attendance per user and event; also serves lookups by user_id
+        db.Index('uq_event_attendees_user_event', 'user_id', 'event_id', unique=True),
+        db.Index('ix_event_attendees_event_id', 'event_id'),
+        # Calendar-synced attendances are a small subset, looked up per user
+        db.Index(
+            'ix_event_attendees_calendar_synced', 'user_id',
+            sqlite_where=synced_to_calendar == True,
+            postgresql_where=synced_to_calendar == True
+        ),
+    )
+
+    @staticmethod
+    def join(user_id, event_id):
+        """
+        Add an attendance unless the user already attends the event and count it in
+        Event.attendee_count (no commit). Concurrent joins are resolved by the unique
+        constraint. Returns True if added.
+        """
+        dialect_insert = sqlite.insert if db.engine.dialect.name == 'sqlite' else postgresql.insert
+        statement = dialect_insert(EventAttendee).values(
+            user_id=user_id,
+            event_id=event_id,
+            joined_at=datetime.utcnow(),
+            status='attending',
+            synced_to_calendar=False
+        ).on_conflict_do_nothing(index_elements=['user_id', 'event_id'])
+        if db.session.execute(statement).rowcount == 0:
+            return False
+        Event.adjust_attendee_count(event_id, 1)
+        return True
+    
+    @staticmethod
+    def leave(user_id, event_id):
+        """Remove an attendance and uncount it from Event.attendee_count (no commit). Returns True if removed."""
+        removed = EventAttendee.query.filter_by(
+            user_id=user_id, event_id=event_id
+        ).delete(synchronize_session='fetch')
+        if removed:
+            Event.adjust_attendee_count(event_id, -removed)
+        return removed > 0
+
     def __repr__(self):
         """Return string representation of the event attendee."""
         return f'<EventAttendee user_id={self.user_id}, event_id={self.event_id}>'
@@ -164,9 +230,25 @@ class Event(db.Model):
     # New: Event metadata (e.g., for additional fields)
     event_metadata = db.Column(JSONB, nullable=True)
     
+    # Denormalized counters, see webapp/event_counters.py
+    attendee_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    recent_interaction_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        db.Index('ix_event_privacy_date', 'privacy', 'date'),
+        db.Index('ix_event_organizer_id', 'organizer_id'),
+    )
+    
     def get_attendee_count(self):
-        """Return the number of attendees for the event."""
-        return EventAttendee.query.filter_by(event_id=self.id).count()
+        """Return the number of attendees for the event (the denormalized counter)."""
+        return self.attendee_count or 0
+    
+    @staticmethod
+    def adjust_attendee_count(event_id, delta):
+        """Atomically add delta to an event's attendee_count (no commit)."""
+        Event.query.filter_by(id=event_id).update(
+            {Event.attendee_count: Event.attendee_count + delta}, synchronize_session=False
+        )
     
     def is_user_attending(self, user_id):
         """Check if a user is attending the event."""
@@ -196,16 +278,19 @@ class Event(db.Model):
         delta = self.date.date() - datetime.utcnow().date()
         return delta.days
     
-    def calculate_trending_score(self):
-        """Calculate a trending score for the event."""
+    def calculate_trending_score(self, recent_interactions=None):
+        """
+        Calculate a trending score for the event.
+        Uses the recent_interaction_count snapshot (refreshed by `flask
+        reconcile-event-counters`) unless `recent_interactions` (e.g. from
+        webapp.event_counters.recent_interaction_counts) is given.
+        """
         # Base is the event popularity
         score = self.event_popularity * 40
         
         # Recent interactions boost score
-        recent_interactions = UserEventInteraction.query.filter(
-            UserEventInteraction.event_id == self.id,
-            UserEventInteraction.timestamp > datetime.utcnow() - timedelta(days=7)
-        ).count()
+        if recent_interactions is None:
+            recent_interactions = self.recent_interaction_count or 0
         
         interaction_boost = min(30, recent_interactions)
         
@@ -216,6 +301,10 @@ class Event(db.Model):
         return score + interaction_boost + recency_score
 
 # New model: Track user interactions with events
+# On PostgreSQL this table is partitioned by month on timestamp, with primary key
+# (id, timestamp); see webapp/partitions.py. The model maps `id` alone as the primary
+# key: ids come from one sequence shared by every partition, so they are unique by
+# themselves and identify a row, even though the database only enforces (id, timestamp).
 class UserEventInteraction(db.Model):
     __tablename__ = 'user_event_interactions'
     id = db.Column(db.Integer, primary_key=True)
@@ -225,6 +314,99 @@ class UserEventInteraction(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     interaction_metadata = db.Column(JSONB, nullable=True)  # Any additional data about the interaction
     
+    __table_args__ = (
+        # Recent interactions of an event, and a user's history newest first
+        db.Index('ix_user_event_interactions_event_timestamp', event_id, timestamp),
+        db.Index('ix_user_event_interactions_user_timestamp', user_id, timestamp.desc()),
+    )
+    
     def __repr__(self):
         """Return string representation of the interaction."""
-        return f'<UserEventInteraction user_id={self.user_id}, event_id={self.event_id}, type={self.interaction_type}>'
\ No newline at end of file
+        return f'<UserEventInteraction user_id={self.user_id}, event_id={self.event_id}, type={self.interaction_type}>'
+
+# Precomputed event-event similarity, rebuilt by `flask rebuild-similarity`
+class EventSimilarity(db.Model):
+    __tablename__ = 'event_similarities'
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        """Return string representation of the similarity entry."""
+        return f'<EventSimilarity event_id={self.event_id}, neighbor_id={self.neighbor_id}, score={self.score:.3f}>'
+
+# Pending popularity boosts spread over several rows per event, folded into
+# Event.event_popularity periodically (see webapp/popularity.py)
+class EventPopularityShard(db.Model):
+    __tablename__ = 'event_popularity_shards'
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True)
+    delta = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        """Return string representation of the shard."""
+        return f'<EventPopularityShard event_id={self.event_id}, shard={self.shard}, delta={self.delta:.3f}>'
+
+# Hourly interaction counts per event and type, maintained alongside
+# user_event_interactions (see webapp/rollups.py)
+class InteractionRollup(db.Model):
+    __tablename__ = 'interaction_rollups'
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    interaction_type = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)  # Start of the hour
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        """Return string representation of the rollup."""
+        return f'<InteractionRollup event_id={self.event_id}, type={self.interaction_type}, bucket={self.bucket}, count={self.count}>'
+    
+    @staticmethod
+    def window_counts(since, event_ids=None, interaction_types=None):
+        """
+        Return {event_id: interactions since `since`}, for the given events or all events.
+        Whole hours are summed from the rollups; only the partial hour at the start of the
+        window is counted from the raw interactions.
+        """
+        first_full_hour = since.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        
+        rollup_filters = [InteractionRollup.bucket >= first_full_hour]
+        raw_filters = [UserEventInteraction.timestamp > since, UserEventInteraction.timestamp < first_full_hour]
+        if interaction_types is not None:
+            rollup_filters.append(InteractionRollup.interaction_type.in_(interaction_types))
+            raw_filters.append(UserEventInteraction.interaction_type.in_(interaction_types))
+        
+        if event_ids is None:
+            counts = dict(db.session.query(
+                InteractionRollup.event_id, db.func.sum(InteractionRollup.count)
+            ).filter(*rollup_filters).group_by(InteractionRollup.event_id))
+            partial = dict(db.session.query(
+                UserEventInteraction.event_id, db.func.count()
+            ).filter(*raw_filters).group_by(UserEventInteraction.event_id))
+        else:
+            counts = {}
+            event_ids = list(event_ids)
+            for start in range(0, len(event_ids), IN_CLAUSE_CHUNK_SIZE):
+                chunk = event_ids[start:start + IN_CLAUSE_CHUNK_SIZE]
+                counts.update(db.session.query(
+                    InteractionRollup.event_id, db.func.sum(InteractionRollup.count)
+                ).filter(InteractionRollup.event_id.in_(chunk), *rollup_filters).group_by(InteractionRollup.event_id))
+            partial = _grouped_counts(UserEventInteraction.event_id, event_ids, *raw_filters)
+        
+        for event_id, count in partial.items():
+            counts[event_id] = counts.get(event_id, 0) + count
+        return {event_id: int(count) for event_id, count in counts.items() if count}
+
+# Per-user/per-event totals of interactions removed by `flask compact-interactions`,
+# so collaborative filtering still sees them (see webapp/retention.py)
+class InteractionSummary(db.Model):
+    __tablename__ = 'interaction_summaries'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    weight_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of CF interaction weights
+    interaction_count = db.Column(db.Integer, nullable=False, default=0)
+    last_interaction_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        """Return string representation of the summary."""
+        return f'<InteractionSummary user_id={self.user_id}, event_id={self.event_id}, count={self.interaction_count}>'
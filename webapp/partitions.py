@@ -0,0 +1,176 @@
+# webapp/partitions.py
+"""
+Monthly range partitions of user_event_interactions on PostgreSQL.
+
+Migration b81f5d2c9a64 turns the table into a parent partitioned by RANGE (timestamp),
+with one partition per calendar month (user_event_interactions_y2026m10, ...) and a
+DEFAULT partition that catches anything outside them, so inserts never fail. Queries
+filtering on a recent `timestamp` window are pruned to the one or two monthly
+partitions that overlap it.
+
+ensure_partitions() creates the upcoming months ahead of time (the interaction buffer
+calls it periodically and `flask manage-partitions` can run it from cron), moving any
+rows that already landed in the DEFAULT partition. drop_partitions_before() detaches old
+months, moves the rows the retention policy still keeps (joins and other types kept
+forever, or rows younger than their type's TTL) back into the table, where they land in
+the DEFAULT partition, folds the rest into interaction_summaries, so collaborative
+filtering keeps their signal, and drops the partition.
+
+The table's primary key is (id, timestamp), since PostgreSQL requires the partition key
+in every unique constraint, while the UserEventInteraction model maps `id` alone: ids
+come from one sequence shared by all partitions, so they stay unique on their own.
+"""
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from webapp.collaborative_filtering import INTERACTION_WEIGHTS, DEFAULT_INTERACTION_WEIGHT
+from webapp.models import db
+from webapp.retention import DEFAULT_RETENTION_DAYS
+
+PARENT_TABLE = 'user_event_interactions'
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{PARENT_TABLE}_y(\d{{4}})m(\d{{2}})$')
+DEFAULT_MONTHS_AHEAD = 3
+
+
+def month_start(value):
+    """First instant of the month containing value"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    """First day of the month `count` months after month (a month start)"""
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Name of the partition holding the given month"""
+    return f'{PARENT_TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def is_partitioned():
+    """Check if user_event_interactions is a partitioned table (PostgreSQL only)"""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table"
+    ), {'table': PARENT_TABLE}).first() is not None
+
+
+def list_partitions():
+    """Return the months (as month starts) that have a partition, oldest first"""
+    names = db.session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {'table': PARENT_TABLE}).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month):
+    """
+    Create and attach the partition for one month (no commit). Rows of that month that
+    already landed in the DEFAULT partition are moved into it first, since PostgreSQL
+    refuses to attach a range the DEFAULT partition holds rows for.
+    """
+    name = partition_name(month)
+    bounds = {'start': month, 'end': add_months(month, 1)}
+    db.session.execute(text(
+        f'CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    ))
+    db.session.execute(text(
+        f'WITH moved AS ('
+        f'  DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end RETURNING *'
+        f') INSERT INTO {name} SELECT * FROM moved'
+    ), bounds)
+    db.session.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['start']:%Y-%m-%d}') TO ('{bounds['end']:%Y-%m-%d}')"
+    ))
+    return name
+
+
+def ensure_partitions(months_ahead=DEFAULT_MONTHS_AHEAD, now=None):
+    """Create the partitions for this month and the next `months_ahead`; returns the names created"""
+    if not is_partitioned():
+        return []
+    # Serialize workers doing this at the same time; released at commit
+    db.session.execute(text('SELECT pg_advisory_xact_lock(hashtext(:table))'), {'table': PARENT_TABLE})
+    existing = set(list_partitions())
+    current = month_start(now or datetime.utcnow())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            created.append(create_partition(month))
+    db.session.commit()
+    return created
+
+
+def _weight_case():
+    """SQL CASE giving the collaborative filtering weight of an interaction type"""
+    branches = ' '.join(
+        f"WHEN '{interaction_type}' THEN {weight}" for interaction_type, weight in INTERACTION_WEIGHTS.items()
+    )
+    return f'CASE interaction_type {branches} ELSE {DEFAULT_INTERACTION_WEIGHT} END'
+
+
+def _retained_condition(policy, now):
+    """SQL condition (and its parameters) matching the interactions the retention policy still keeps"""
+    params = {}
+    expired = []
+    for number, (interaction_type, days) in enumerate(sorted(policy.items())):
+        params[f'type_{number}'] = interaction_type
+        params[f'cutoff_{number}'] = now - timedelta(days=days)
+        expired.append(f'(interaction_type = :type_{number} AND timestamp < :cutoff_{number})')
+    if not expired:
+        return 'TRUE', params
+    return f"NOT ({' OR '.join(expired)})", params
+
+
+def drop_partitions_before(cutoff, policy=None, now=None):
+    """
+    Drop every monthly partition that ends on or before cutoff. Interactions the retention
+    policy ({type: days}, types not listed are kept forever) still keeps are moved into the
+    DEFAULT partition; the others are added to interaction_summaries. Returns
+    (name, rows kept) for each partition dropped.
+    """
+    if not is_partitioned():
+        return []
+    policy = DEFAULT_RETENTION_DAYS if policy is None else policy
+    retained, params = _retained_condition(policy, now or datetime.utcnow())
+    dropped = []
+    for month in list_partitions():
+        if add_months(month, 1) > cutoff:
+            break
+        name = partition_name(month)
+        db.session.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}'))
+        # With the month's range detached, the parent routes these rows to the DEFAULT partition
+        kept = db.session.execute(text(
+            f'WITH moved AS (DELETE FROM {name} WHERE {retained} RETURNING *) '
+            f'INSERT INTO {PARENT_TABLE} SELECT * FROM moved'
+        ), params).rowcount
+        db.session.execute(text(
+            f'INSERT INTO interaction_summaries '
+            f'  (user_id, event_id, weight_sum, interaction_count, last_interaction_at) '
+            f'SELECT user_id, event_id, SUM({_weight_case()}), COUNT(*), MAX(timestamp) '
+            f'FROM {name} GROUP BY user_id, event_id '
+            f'ON CONFLICT (user_id, event_id) DO UPDATE SET '
+            f'  weight_sum = interaction_summaries.weight_sum + EXCLUDED.weight_sum, '
+            f'  interaction_count = interaction_summaries.interaction_count + EXCLUDED.interaction_count, '
+            f'  last_interaction_at = GREATEST(interaction_summaries.last_interaction_at, EXCLUDED.last_interaction_at)'
+        ))
+        db.session.execute(text(f'DROP TABLE {name}'))
+        db.session.commit()
+        dropped.append((name, kept))
+    return dropped
@@ -0,0 +1,110 @@
+# webapp/popularity.py
+"""
+Server-side maintenance of Event.event_popularity.
+
+Boosts are never applied as a read-modify-write in Python. They are applied either
+directly with one atomic `UPDATE ... SET event_popularity = LEAST(1.0, event_popularity
++ :delta)` per event, or, for hot events under heavy load, added to one of several
+per-event shard rows (so concurrent writers rarely touch the same row) and folded into
+the column periodically by fold_popularity_shards().
+"""
+import random
+from collections import defaultdict
+
+from sqlalchemy import bindparam, delete, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from webapp.models import db, Event, EventPopularityShard
+
+# Popularity boost per significant interaction type (capped at 1.0 per event)
+POPULARITY_BOOSTS = {
+    'join': 0.02,
+    'bookmark': 0.01,
+    'share': 0.01,
+    'calendar_add': 0.01,
+}
+MAX_POPULARITY = 1.0
+DEFAULT_POPULARITY = 0.5
+
+
+def least(*values):
+    """Dialect-portable LEAST(): SQLite spells the scalar version min()"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.min(*values)
+    return func.least(*values)
+
+
+def popularity_deltas(interactions):
+    """Sum the popularity boosts of interaction rows per event"""
+    deltas = defaultdict(float)
+    for interaction in interactions:
+        boost = POPULARITY_BOOSTS.get(interaction['interaction_type'])
+        if boost:
+            deltas[interaction['event_id']] += boost
+    return deltas
+
+
+def apply_popularity_deltas(deltas):
+    """Atomically add {event_id: delta} to event popularity, capped at 1.0 (no commit)"""
+    if not deltas:
+        return
+    event_table = Event.__table__
+    db.session.execute(
+        update(event_table)
+        .where(event_table.c.id == bindparam('target_id'))
+        .values(event_popularity=least(
+            MAX_POPULARITY,
+            func.coalesce(event_table.c.event_popularity, DEFAULT_POPULARITY) + bindparam('delta')
+        )),
+        [{'target_id': event_id, 'delta': delta} for event_id, delta in deltas.items()]
+    )
+
+
+def add_sharded_popularity_deltas(deltas, shards, shard=None):
+    """
+    Add {event_id: delta} to a shard row of each event with an upsert (no commit).
+    The shard is picked at random unless given.
+    """
+    if not deltas:
+        return
+    if shard is None:
+        shard = random.randrange(shards)
+
+    dialect_insert = sqlite.insert if db.engine.dialect.name == 'sqlite' else postgresql.insert
+    statement = dialect_insert(EventPopularityShard)
+    statement = statement.on_conflict_do_update(
+        index_elements=['event_id', 'shard'],
+        set_={'delta': EventPopularityShard.delta + statement.excluded.delta}
+    )
+    db.session.execute(
+        statement,
+        [{'event_id': event_id, 'shard': shard, 'delta': delta} for event_id, delta in deltas.items()]
+    )
+
+
+def record_popularity(interactions, shards=0):
+    """Apply the popularity boosts of interaction rows, directly or through shards"""
+    deltas = popularity_deltas(interactions)
+    if shards > 0:
+        add_sharded_popularity_deltas(deltas, shards)
+    else:
+        apply_popularity_deltas(deltas)
+
+
+def fold_popularity_shards():
+    """
+    Move every pending shard delta into Event.event_popularity and commit.
+    The shard rows are claimed with DELETE ... RETURNING, so concurrent folds (and
+    writers adding new deltas meanwhile) never count a delta twice or lose one.
+    Returns the number of events updated.
+    """
+    claimed = db.session.execute(
+        delete(EventPopularityShard).returning(EventPopularityShard.event_id, EventPopularityShard.delta)
+    ).all()
+
+    deltas = defaultdict(float)
+    for event_id, delta in claimed:
+        deltas[event_id] += delta
+    apply_popularity_deltas(deltas)
+    db.session.commit()
+    return len(deltas)
@@ -0,0 +1,111 @@
+# webapp/query_plans.py
+"""
+Query plan checks for the application's hot queries.
+
+hot_queries() pairs each query shape used by the routes and services with the indexes
+that should serve it (the intended one first; a query may reasonably be served by
+another one depending on the data). `flask check-query-plans` runs EXPLAIN (EXPLAIN
+QUERY PLAN on SQLite) for each of them and reports the ones whose plan uses none of
+those indexes. On PostgreSQL sequential scans are disabled for the check, since on small
+tables the planner rightly prefers them; the check is whether an index can serve the
+query. Indexes of the monthly interaction partitions count as their parent index.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from webapp.models import db, Event, EventAttendee, UserEventInteraction, UserInterests
+
+
+def hot_queries(user_id=1, event_id=1, now=None):
+    """Return (name, expected indexes, statement) for every hot query shape"""
+    now = now or datetime.utcnow()
+    return [
+        (
+            'attendance of a user (join_event, event_details, has_joined_event, get_attendee)',
+            ('uq_event_attendees_user_event', 'ix_event_attendees_event_id'),
+            select(EventAttendee).where(EventAttendee.user_id == user_id, EventAttendee.event_id == event_id)
+        ),
+        (
+            'attendees of an event',
+            ('ix_event_attendees_event_id', 'uq_event_attendees_user_event'),
+            select(EventAttendee.user_id).where(EventAttendee.event_id == event_id)
+        ),
+        (
+            'calendar-synced attendances of a user',
+            ('ix_event_attendees_calendar_synced', 'uq_event_attendees_user_event'),
+            select(EventAttendee).where(EventAttendee.user_id == user_id, EventAttendee.synced_to_calendar == True)
+        ),
+        (
+            'recent interactions of an event',
+            ('ix_user_event_interactions_event_timestamp',),
+            select(db.func.count()).select_from(UserEventInteraction).where(
+                UserEventInteraction.event_id == event_id,
+                UserEventInteraction.timestamp >= now - timedelta(days=7)
+            )
+        ),
+        (
+            'interaction history of a user, newest first',
+            ('ix_user_event_interactions_user_timestamp',),
+            select(UserEventInteraction).where(
+                UserEventInteraction.user_id == user_id
+            ).order_by(UserEventInteraction.timestamp.desc()).limit(100)
+        ),
+        (
+            'upcoming public events',
+            ('ix_event_privacy_date',),
+            select(Event.id).where(Event.privacy == 'public', Event.date >= now)
+        ),
+        (
+            'events of an organizer',
+            ('ix_event_organizer_id',),
+            select(Event).where(Event.organizer_id == user_id)
+        ),
+        (
+            'interests of a user',
+            ('ix_user_interests_user_id',),
+            select(UserInterests).where(UserInterests.user_id == user_id)
+        ),
+    ]
+
+
+def explain(statement):
+    """Return the plan of a statement as a list of lines"""
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    if db.engine.dialect.name == 'sqlite':
+        return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+    db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    try:
+        return list(db.session.execute(text('EXPLAIN ' + sql)).scalars())
+    finally:
+        db.session.rollback()
+
+
+def _partition_indexes(index_name):
+    """Names of the per-partition indexes attached to a partitioned index (PostgreSQL)"""
+    if db.engine.dialect.name != 'postgresql':
+        return []
+    return list(db.session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :index"
+    ), {'index': index_name}).scalars())
+
+
+def _used_index(plan, index_names):
+    """Return the first of index_names the plan uses (directly or via a partition), or None"""
+    for index_name in index_names:
+        names = [index_name] + _partition_indexes(index_name)
+        if any(f' {name} ' in f' {line} ' for line in plan for name in names):
+            return index_name
+    return None
+
+
+def check_query_plans(user_id=1, event_id=1):
+    """Return (name, expected indexes, index used or None, plan lines) for every hot query"""
+    results = []
+    for name, index_names, statement in hot_queries(user_id, event_id):
+        plan = explain(statement)
+        results.append((name, index_names, _used_index(plan, index_names), plan))
+    return results
@@ -0,0 +1,148 @@
+# webapp/recommendation_cache.py
+"""
+Per-user cache of ranked recommendation results.
+
+Each entry is the ranked list of (event_id, score) pairs produced for a user. Entries
+expire after a TTL and are invalidated explicitly when the user's interests change,
+when they record a significant interaction, or when one of the cached events is
+edited or deleted.
+"""
+import json
+import threading
+
+from webapp.cache import TTLCache
+
+
+class InProcessRecommendationCache:
+    """Recommendation cache stored in the worker's memory (the default backend)"""
+
+    def __init__(self, ttl=600, max_entries=1000):
+        """Create an LRU cache of ranked results for up to max_entries users"""
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl, on_remove=self._entry_removed)
+        self._users_by_event = {}  # event_id -> set of user ids whose results include it
+        self._indexed = {}         # user_id -> the cached list the index was built from
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return the cached [(event_id, score), ...] for a user, or None"""
+        return self._cache.get(user_id)
+
+    def set(self, user_id, ranked):
+        """Store a user's ranked [(event_id, score), ...] list"""
+        ranked = [(int(event_id), float(score)) for event_id, score in ranked]
+        with self._lock:
+            self._unindex(user_id)
+            self._indexed[user_id] = ranked
+            for event_id, _ in ranked:
+                self._users_by_event.setdefault(event_id, set()).add(user_id)
+        self._cache.set(user_id, ranked)
+
+    def _entry_removed(self, user_id, ranked):
+        """Unindex a user whose entry was evicted, expired or deleted (not if it was replaced since)"""
+        with self._lock:
+            if self._indexed.get(user_id) is ranked:
+                self._unindex(user_id)
+
+    def _unindex(self, user_id):
+        """Remove a user from the event index (caller holds the lock)"""
+        for event_id, _ in self._indexed.pop(user_id, ()):
+            users = self._users_by_event.get(event_id)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._users_by_event[event_id]
+
+    def invalidate_user(self, user_id):
+        """Drop a user's cached results"""
+        self._cache.delete(user_id)
+        with self._lock:
+            self._unindex(user_id)
+
+    def invalidate_event(self, event_id):
+        """Drop the cached results of every user whose list includes the event"""
+        with self._lock:
+            user_ids = self._users_by_event.pop(event_id, set())
+        for user_id in user_ids:
+            self._cache.delete(user_id)
+
+    def stats(self):
+        """Return hit/miss counters and the size of the event index"""
+        with self._lock:
+            indexed_events = len(self._users_by_event)
+        return dict(self._cache.stats(), backend='memory', indexed_events=indexed_events)
+
+
+class RedisRecommendationCache:
+    """
+    Recommendation cache shared by all workers through Redis.
+    LRU eviction is delegated to the server's maxmemory-policy (e.g. allkeys-lru).
+    """
+
+    KEY_PREFIX = 'recommendations'
+
+    def __init__(self, url, ttl=600):
+        """Connect to the Redis server at url"""
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The 'redis' package is required for a shared recommendation cache")
+
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+
+    def _user_key(self, user_id):
+        return f'{self.KEY_PREFIX}:user:{user_id}'
+
+    def _event_key(self, event_id):
+        return f'{self.KEY_PREFIX}:event:{event_id}'
+
+    def get(self, user_id):
+        """Return the cached [(event_id, score), ...] for a user, or None"""
+        payload = self.client.get(self._user_key(user_id))
+        self.client.incr(f'{self.KEY_PREFIX}:stats:{"hits" if payload else "misses"}')
+        if payload is None:
+            return None
+        return [tuple(item) for item in json.loads(payload)]
+
+    def set(self, user_id, ranked):
+        """Store a user's ranked [(event_id, score), ...] list"""
+        ranked = [(int(event_id), float(score)) for event_id, score in ranked]
+        pipe = self.client.pipeline()
+        pipe.set(self._user_key(user_id), json.dumps(ranked), ex=self.ttl)
+        for event_id, _ in ranked:
+            pipe.sadd(self._event_key(event_id), user_id)
+            pipe.expire(self._event_key(event_id), self.ttl)
+        pipe.execute()
+
+    def invalidate_user(self, user_id):
+        """Drop a user's cached results"""
+        self.client.delete(self._user_key(user_id))
+
+    def invalidate_event(self, event_id):
+        """Drop the cached results of every user whose list includes the event"""
+        event_key = self._event_key(event_id)
+        user_ids = self.client.smembers(event_key)
+        pipe = self.client.pipeline()
+        for user_id in user_ids:
+            pipe.delete(self._user_key(int(user_id)))
+        pipe.delete(event_key)
+        pipe.execute()
+
+    def stats(self):
+        """Return hit/miss counters aggregated across all workers"""
+        hits = int(self.client.get(f'{self.KEY_PREFIX}:stats:hits') or 0)
+        misses = int(self.client.get(f'{self.KEY_PREFIX}:stats:misses') or 0)
+        lookups = hits + misses
+        return {
+            'backend': 'redis',
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0
+        }
+
+
+def create_recommendation_cache(url=None, ttl=600, max_entries=1000):
+    """Create the cache backend for a URL (redis://...) or the in-process default"""
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisRecommendationCache(url, ttl=ttl)
+    return InProcessRecommendationCache(ttl=ttl, max_entries=max_entries)
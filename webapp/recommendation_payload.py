@@ -0,0 +1,165 @@
+# webapp/recommendation_payload.py
+"""
+Wire formats for the AI recommendation API request.
+
+The original format is JSON with one object per event. The compact format sends the
+events as columns instead: numeric columns are packed as little-endian binary buffers,
+dates as epoch seconds, and repeated strings (category, subcategory, privacy, location)
+are dictionary encoded. The whole request is serialized with msgpack. Descriptions are
+left out unless the API asks for them.
+
+Compact request layout (msgpack map):
+
+    {
+        'format': 'columnar-v1',
+        'user': ..., 'user_data': ..., 'user_interests': ..., 'user_interactions': ...,
+        'events': {
+            'count': n,
+            'columns': {name: {'dtype': '<f8', 'data': bytes[, 'nulls': bytes]}, ...},
+            'strings': {'title': [...], 'description': [...]},
+            'dictionaries': {name: {'values': [...], 'codes': {'dtype': '<i4', 'data': bytes}}}
+        }
+    }
+
+Missing floats are NaN and missing epochs are -1. Integer columns with missing values
+(e.g. days_until_event for an event without a date) carry a 'nulls' buffer of one
+byte per row, 1 where the value is missing; decode_columnar_events returns those
+columns as NumPy masked arrays.
+"""
+import json
+from datetime import datetime
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/vnd.recommendations.columnar+msgpack'
+
+FORMAT_JSON = 'json'
+FORMAT_MSGPACK = 'msgpack'
+COLUMNAR_VERSION = 'columnar-v1'
+
+# Response header the API uses to ask for optional fields, e.g. "description"
+REQUESTED_FIELDS_HEADER = 'X-Recommendation-Fields'
+OPTIONAL_FIELDS = ('description',)
+
+EPOCH = datetime(1970, 1, 1)
+
+NUMERIC_COLUMNS = {
+    'id': '<i8',
+    'latitude': '<f8',
+    'longitude': '<f8',
+    'event_popularity': '<f4',
+    'invited': '<i4',
+    'attendee_count': '<i4',
+    'days_until_event': '<i4',
+    'distance_km': '<f4',
+    'is_trending': '|u1',
+}
+DATE_COLUMNS = ('date', 'created_at')
+DICTIONARY_COLUMNS = ('category', 'subcategory', 'privacy', 'location')
+
+
+def _epoch_seconds(value):
+    """Convert an ISO timestamp (as produced for the JSON payload) to epoch seconds"""
+    if not value:
+        return -1
+    return int((datetime.fromisoformat(value) - EPOCH).total_seconds())
+
+
+def _buffer(values, dtype):
+    """
+    Pack a column as a typed little-endian buffer. Integer columns with missing values
+    also get a 'nulls' mask, since every integer (0 included) is a real value.
+    """
+    if dtype.startswith('<f'):
+        values = [np.nan if value is None else value for value in values]
+        return {'dtype': dtype, 'data': np.asarray(values, dtype=dtype).tobytes()}
+
+    nulls = [value is None for value in values]
+    values = [0 if value is None else value for value in values]
+    column = {'dtype': dtype, 'data': np.asarray(values, dtype=dtype).tobytes()}
+    if any(nulls):
+        column['nulls'] = np.asarray(nulls, dtype='|u1').tobytes()
+    return column
+
+
+def _dictionary(values):
+    """Dictionary-encode a string column"""
+    index = {}
+    codes = [index.setdefault(value, len(index)) for value in values]
+    return {'values': list(index), 'codes': _buffer(codes, '<i4')}
+
+
+def encode_columnar_events(events_data, include_fields=()):
+    """Convert the per-event dicts of the JSON payload into the columnar layout"""
+    columns = {
+        name: _buffer([event.get(name) for event in events_data], dtype)
+        for name, dtype in NUMERIC_COLUMNS.items()
+    }
+    for name in DATE_COLUMNS:
+        columns[name] = _buffer([_epoch_seconds(event.get(name)) for event in events_data], '<i8')
+
+    strings = {'title': [event.get('title') for event in events_data]}
+    for name in OPTIONAL_FIELDS:
+        if name in include_fields:
+            strings[name] = [event.get(name) for event in events_data]
+
+    return {
+        'count': len(events_data),
+        'columns': columns,
+        'strings': strings,
+        'dictionaries': {
+            name: _dictionary([event.get(name) for event in events_data]) for name in DICTIONARY_COLUMNS
+        }
+    }
+
+
+def decode_columnar_events(payload):
+    """Convert a columnar events payload back into a dict of NumPy arrays and lists"""
+    decoded = {}
+    for name, column in payload['columns'].items():
+        values = np.frombuffer(column['data'], dtype=column['dtype'])
+        if 'nulls' in column:
+            values = np.ma.masked_array(values, mask=np.frombuffer(column['nulls'], dtype='|u1').astype(bool))
+        decoded[name] = values
+    decoded.update(payload['strings'])
+    for name, column in payload['dictionaries'].items():
+        codes = np.frombuffer(column['codes']['data'], dtype=column['codes']['dtype'])
+        decoded[name] = [column['values'][code] for code in codes.tolist()]
+    return decoded
+
+
+def encode_request(request_data, payload_format=FORMAT_JSON, include_fields=()):
+    """
+    Serialize a recommendation request. Returns (body, content_type).
+    The JSON format is the request as-is; the msgpack format is columnar.
+    """
+    if payload_format == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("The 'msgpack' package is required for the compact AI API payload")
+        compact = dict(request_data, format=COLUMNAR_VERSION)
+        compact['events'] = encode_columnar_events(request_data['events'], include_fields)
+        return msgpack.packb(compact, use_bin_type=True), MSGPACK_CONTENT_TYPE
+
+    return json.dumps(request_data).encode(), JSON_CONTENT_TYPE
+
+
+def decode_request(body, content_type):
+    """Deserialize a request body produced by encode_request (used by the stub API)"""
+    if content_type and content_type.startswith(MSGPACK_CONTENT_TYPE):
+        if msgpack is None:
+            raise RuntimeError("The 'msgpack' package is required for the compact AI API payload")
+        request_data = msgpack.unpackb(body, raw=False)
+        request_data['events'] = decode_columnar_events(request_data['events'])
+        return request_data
+    return json.loads(body)
+
+
+def requested_fields(response):
+    """Return the optional event fields the API asked for in its response headers"""
+    header = response.headers.get(REQUESTED_FIELDS_HEADER, '')
+    return {field.strip() for field in header.split(',') if field.strip() in OPTIONAL_FIELDS}
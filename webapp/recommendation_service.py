@@ -3,17 +3,29 @@
 Enhanced recommendation service implementing collaborative filtering and personalized recommendations
 based on user preferences and interactions.
 """
-import os
-import math
+import threading
+import time
 import requests
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 from flask import current_app
-from sklearn.metrics.pairwise import cosine_similarity
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from webapp.models import db, User, Event, UserInterests, EventAttendee, UserEventInteraction
+from webapp.models import db, User, UserInterests, UserEventInteraction, InteractionSummary
+from webapp.collaborative_filtering import SparseCFEngine, interaction_weight, SCORE_TIE_DECIMALS
+from webapp.ai_api_client import RecommendationAPIClient, CircuitOpenError
+from webapp.similarity_index import is_index_built, load_neighbours
+from webapp.retention import load_interaction_summaries
+from webapp.geo import haversine_km
+from webapp.event_listings import events_by_ids
+from webapp.event_counters import recent_interaction_counts
+from webapp.recommendation_payload import (
+    encode_request, requested_fields, msgpack, FORMAT_JSON, FORMAT_MSGPACK
+)
+from webapp.event_features import (
+    EventFeatures, DESCRIPTION_MATCHES_SUBCATEGORY, DESCRIPTION_MATCHES_CATEGORY
+)
 
 class EnhancedRecommendationService:
     """
@@ -22,21 +34,38 @@ class EnhancedRecommendationService:
     is used to find patterns in user behavior.
     """
     
-    def __init__(self, api_url):
+    PIPELINE_SEQUENTIAL = 'sequential'
+    PIPELINE_HEDGED = 'hedged'
+    
+    def __init__(self, api_url, api_client=None, pipeline_mode=PIPELINE_SEQUENTIAL,
+                 latency_budget=0.3, max_workers=8, payload_format=FORMAT_JSON, include_fields=()):
         """Initialize the recommendation service with API URL"""
         self.api_url = api_url
+        self.api_client = api_client or RecommendationAPIClient(api_url)
         self.min_recommendations = 10
+        self.pipeline_mode = pipeline_mode
+        self.latency_budget = latency_budget
+        if payload_format == FORMAT_MSGPACK and msgpack is None:
+            raise RuntimeError("The 'msgpack' package is required for the compact AI API payload")
+        self.payload_format = payload_format
+        # Optional event fields (e.g. descriptions) sent in the compact format; a frozenset
+        # so widening it rebinds the attribute instead of mutating a set other threads read
+        self.include_fields = frozenset(include_fields)
+        # Worker threads for the hedged pipeline only; each call to a source holds one
+        # until it returns, so slow API calls cannot queue up behind each other
+        self.max_workers = max_workers
+        self._executor = None
+        if pipeline_mode == self.PIPELINE_HEDGED:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recommendations')
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
         print(f"Initializing EnhancedRecommendationService with API URL: {api_url}")
         
         # Test API connectivity
-        try:
-            response = requests.get(f"{api_url}/health", timeout=2)
-            if response.status_code == 200:
-                print("AI API connection successful!")
-            else:
-                print(f"AI API connection test failed with status: {response.status_code}")
-        except requests.RequestException as e:
-            print(f"AI API connection test failed: {e}")
+        if self.api_client.health():
+            print("AI API connection successful!")
+        else:
+            print("AI API connection test failed")
             
     def get_recommendations(self, user, events):
         """
@@ -45,7 +74,12 @@ class EnhancedRecommendationService:
         User profiles are dynamically updated based on interactions, and collaborative filtering
         is used to find patterns in user behavior. The recommendation engine learns from past
         interactions and adapts over time to provide more relevant suggestions.
+        
+        Each recommendation records its 'source' ('api', 'cf' or 'fallback').
         """
+        if self.pipeline_mode == self.PIPELINE_HEDGED:
+            return self._get_hedged_recommendations(user, events)
+        
         try:
             # Get AI API recommendations first
             api_recommendations = self._get_api_recommendations(user, events)
@@ -84,6 +118,95 @@ class EnhancedRecommendationService:
             # Fallback to simpler recommendation method
             return self._get_fallback_recommendations(user, events, count=self.min_recommendations)
             
+    def _get_hedged_recommendations(self, user, events):
+        """
+        Run the AI API and collaborative filtering on worker threads while the fallback is
+        scored in the request thread, and merge whatever finished within the latency
+        budget. Sources that miss the budget keep running in the background but are not
+        waited for; while every worker is busy they are skipped instead of queued.
+        """
+        app = current_app._get_current_object()
+        user_id = user.id
+        event_ids = [event.id for event in events]
+        
+        def run_detached(method):
+            # Workers only see ids: the user and events are reloaded in the worker's own
+            # app context (and session), and plain (event_id, score) pairs come back
+            with app.app_context():
+                recommendations = method(db.session.get(User, user_id), events_by_ids(event_ids))
+                return [(rec['event'].id, rec['score']) for rec in recommendations]
+        
+        futures = {}
+        for source, method in (
+            ('api', self._get_api_recommendations),
+            ('cf', self._get_collaborative_filtering_recommendations),
+        ):
+            future = self._submit(run_detached, method)
+            if future is None:
+                print(f"Recommendation workers are busy; skipping source '{source}'")
+            else:
+                futures[source] = future
+        
+        # Fallback is local and cheap; it runs here so the page always has content
+        deadline = time.monotonic() + self.latency_budget
+        try:
+            fallback_recommendations = self._get_fallback_recommendations(user, events, count=self.min_recommendations)
+        except Exception as e:
+            current_app.logger.error(f"Error getting fallback recommendations: {e}")
+            fallback_recommendations = []
+        wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+        
+        events_by_id = {event.id: event for event in events}
+        results = {}
+        for source, future in futures.items():
+            if not future.done():
+                print(f"Recommendation source '{source}' missed the {self.latency_budget * 1000:.0f}ms budget")
+                continue
+            try:
+                results[source] = [
+                    {'event': events_by_id[event_id], 'score': score, 'source': source}
+                    for event_id, score in future.result(timeout=0)
+                    if event_id in events_by_id
+                ]
+            except Exception as e:
+                current_app.logger.error(f"Error getting {source} recommendations: {e}")
+                results[source] = []
+        
+        api_recommendations = results.get('api', [])
+        if len(api_recommendations) >= self.min_recommendations:
+            return api_recommendations
+        
+        combined_recommendations = self._merge_recommendations(api_recommendations, results.get('cf', []))
+        if len(combined_recommendations) < self.min_recommendations:
+            recommended_event_ids = {rec['event'].id for rec in combined_recommendations}
+            fallback_recommendations = [
+                rec for rec in fallback_recommendations
+                if rec['event'].id not in recommended_event_ids
+            ]
+            combined_recommendations.extend(
+                fallback_recommendations[:self.min_recommendations - len(combined_recommendations)]
+            )
+        
+        return combined_recommendations
+    
+    def _submit(self, fn, *args):
+        """Start fn on a free worker, or return None if all workers are busy"""
+        with self._in_flight_lock:
+            if self._in_flight >= self.max_workers:
+                return None
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release_worker()
+            raise
+        future.add_done_callback(self._release_worker)
+        return future
+    
+    def _release_worker(self, future=None):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+    
     def _get_api_recommendations(self, user, events):
         """
         Get recommendations from the AI API.
@@ -109,6 +232,26 @@ class EnhancedRecommendationService:
         user_interactions = self._get_user_interactions(user.id)
 
         # Prepare event data ensuring all required fields are present
+        events_data = self._build_events_payload(user, events)
+
+        # Prepare request data
+        request_data = {
+            'user': {'id': user.id},
+            'events': events_data,
+            'user_data': user_data,
+            'user_interests': user_interests,
+            'user_interactions': user_interactions
+        }
+
+        return self._post_recommendation_request(request_data, events)
+
+    def _build_events_payload(self, user, events):
+        """
+        Build the per-event payload for the AI API. Attendee counts are the denormalized
+        Event column and recent interaction counts are summed from the rollups for all
+        events at once, so no query is issued per event.
+        """
+        recent_counts = recent_interaction_counts([event.id for event in events])
         events_data = []
         for event in events:
             try:
@@ -139,7 +282,7 @@ class EnhancedRecommendationService:
                     'attendee_count': event.get_attendee_count(),  # Add attendee count
                     'days_until_event': days_until_event,
                     'distance_km': distance,
-                    'is_trending': event.calculate_trending_score() > 70,
+                    'is_trending': event.calculate_trending_score(recent_counts.get(event.id, 0)) > 70,
                     'created_at': event.created_at.isoformat() if event.created_at else datetime.utcnow().isoformat()
                 }
                 events_data.append(event_dict)
@@ -148,49 +291,63 @@ class EnhancedRecommendationService:
                 # Skip this event rather than failing the entire request
                 continue
 
-        # Prepare request data
-        request_data = {
-            'user': {'id': user.id},
-            'events': events_data,
-            'user_data': user_data,
-            'user_interests': user_interests,
-            'user_interactions': user_interactions
-        }
+        return events_data
 
+    def _post_recommendation_request(self, request_data, events):
+        """Send the recommendation request to the AI API and map results back to events"""
         try:
             # Log the request for debugging
             print(f"Sending request to AI API: {self.api_url}")
             
-            # Make API request with increased timeout
-            response = requests.post(
-                f"{self.api_url}/api/recommendations",
-                json=request_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=60  # Increased timeout
+            # Pooled request with connect/read timeouts, retries and a circuit breaker
+            body, content_type = encode_request(request_data, self.payload_format, self.include_fields)
+            response = self.api_client.post(
+                "/api/recommendations",
+                data=body,
+                headers={'Content-Type': content_type}
             )
             
+            if response.status_code == 415 and self.payload_format != FORMAT_JSON:
+                # The API does not understand the compact format; stay on JSON from now on
+                print("AI API rejected the compact payload, switching to JSON")
+                self.payload_format = FORMAT_JSON
+                body, content_type = encode_request(request_data)
+                response = self.api_client.post(
+                    "/api/recommendations",
+                    data=body,
+                    headers={'Content-Type': content_type}
+                )
+            
+            # The API may ask for optional fields (such as descriptions) on later requests
+            self.include_fields |= requested_fields(response)
+            
             if response.status_code == 200:
                 # Get the recommendations from the API response
                 api_recommendations = response.json().get('recommendations', [])
                 
                 # Process the recommendations
                 processed_recommendations = []
+                events_by_id = {e.id: e for e in events}
                 for rec in api_recommendations:
                     event_id = rec.get('event_id')
                     if event_id is None:
                         continue
                         
-                    event = next((e for e in events if e.id == event_id), None)
+                    event = events_by_id.get(event_id)
                     if event:
                         processed_recommendations.append({
                             'event': event,
-                            'score': rec.get('score', 0.5)
+                            'score': rec.get('score', 0.5),
+                            'source': 'api'
                         })
                     
                 return processed_recommendations
             else:
                 print(f"API Error Response ({response.status_code}): {response.text}")
                 return []  # Return empty list on error
+        except CircuitOpenError as e:
+            print(f"Skipping AI API: {e}")
+            return []  # Go straight to collaborative filtering and fallback
         except requests.RequestException as e:
             print(f"Request error getting recommendations: {e}")
             return []  # Return empty list on error
@@ -201,83 +358,110 @@ class EnhancedRecommendationService:
     def _get_collaborative_filtering_recommendations(self, user, events):
         """
         Generate recommendations using collaborative filtering based on user interactions.
-        This employs similarity metrics like cosine similarity to find patterns in user behavior.
+        Uses the precomputed item-item similarity index when it has been built, and falls
+        back to user-user similarity over the full interaction history otherwise.
         """
         try:
-            # Get all user interactions
-            interactions = UserEventInteraction.query.all()
-            
-            if not interactions:
-                return []
-                
-            # Create user-event interaction matrix
-            user_event_data = []
+            if is_index_built():
+                return self._get_item_similarity_recommendations(user, events)
+        except Exception as e:
+            print(f"Error in item similarity recommendations: {e}")
             
-            for interaction in interactions:
-                # Weight interaction based on type
-                weight = 1.0
-                if interaction.interaction_type == 'view':
-                    weight = 0.5
-                elif interaction.interaction_type == 'click':
-                    weight = 0.7
-                elif interaction.interaction_type in ['join', 'bookmark']:
-                    weight = 1.0
-                
-                user_event_data.append({
-                    'user_id': interaction.user_id,
-                    'event_id': interaction.event_id,
-                    'weight': weight
-                })
-                
-            # Create DataFrame
-            if not user_event_data:
-                return []
-                
-            df = pd.DataFrame(user_event_data)
+        return self._get_user_similarity_recommendations(user, events)
+    
+    def _get_item_similarity_recommendations(self, user, events):
+        """
+        Score events by their precomputed similarity to the events the user recently
+        interacted with. Each candidate's score is the interaction-weighted average of
+        its similarity to the user's last 100 interactions.
+        """
+        user_interactions = self._get_user_interactions(user.id)
+        if not user_interactions:
+            return []
             
-            # Create user-event matrix (pivot table)
-            user_event_matrix = df.pivot_table(
-                index='user_id',
-                columns='event_id',
-                values='weight',
-                aggfunc='mean',
-                fill_value=0
+        neighbours = load_neighbours([i['event_id'] for i in user_interactions])
+        
+        # Events the user already interacted with (including compacted interactions) are never recommended
+        user_events = {
+            event_id for (event_id,) in db.session.query(UserEventInteraction.event_id).filter(
+                UserEventInteraction.user_id == user.id
+            ).distinct()
+        }
+        user_events.update(
+            event_id for (event_id,) in db.session.query(InteractionSummary.event_id).filter(
+                InteractionSummary.user_id == user.id
             )
+        )
+        
+        event_scores = defaultdict(float)
+        total_weight = 0.0
+        for interaction in user_interactions:
+            weight = interaction_weight(interaction['interaction_type'])
+            total_weight += weight
+            for neighbor_id, similarity in neighbours.get(interaction['event_id'], []):
+                if neighbor_id not in user_events:
+                    event_scores[neighbor_id] += weight * similarity
+        
+        if total_weight == 0:
+            return []
             
-            # Get the current user's vector
-            if user.id not in user_event_matrix.index:
-                return []  # User has no interactions
-                
-            user_vector = user_event_matrix.loc[user.id]
-            
-            # Calculate similarity with other users
-            similarities = []
-            for other_user_id in user_event_matrix.index:
-                if other_user_id == user.id:
-                    continue
-                    
-                other_vector = user_event_matrix.loc[other_user_id]
-                
-                # Calculate cosine similarity
-                similarity = self._calculate_cosine_similarity(user_vector, other_vector)
-                
-                if similarity > 0:
-                    similarities.append((other_user_id, similarity))
+        cf_recommendations = []
+        events_by_id = {e.id: e for e in events}
+        
+        for event_id, score in event_scores.items():
+            event = events_by_id.get(event_id)
+            if event:
+                cf_recommendations.append({
+                    'event': event,
+                    'score': min(score / total_weight, 1.0),  # Cap at 1.0
+                    'source': 'cf'
+                })
+        
+        # Sort by score
+        cf_recommendations.sort(key=lambda x: x['score'], reverse=True)
+        
+        return cf_recommendations
+    
+    def _get_user_similarity_recommendations(self, user, events):
+        """
+        Generate recommendations using user-user collaborative filtering.
+        This employs cosine similarity over the user x event interaction matrix to find
+        users with similar behavior. Similar users tied on similarity are taken by ascending
+        user id and recommendations tied on score (to SCORE_TIE_DECIMALS decimals) are ordered by
+        ascending event id.
+        """
+        try:
+            # Load only the columns the interaction matrix needs
+            interactions = db.session.query(
+                UserEventInteraction.user_id,
+                UserEventInteraction.event_id,
+                UserEventInteraction.interaction_type
+            ).all()
             
-            # Sort by similarity (highest first)
-            similarities.sort(key=lambda x: x[1], reverse=True)
+            # Interactions removed by retention still count through their summaries
+            summaries = load_interaction_summaries()
+            engine = SparseCFEngine.from_interactions(interactions, summaries)
+            if engine is None or not engine.has_user(user.id):
+                return []  # No interactions, or user has no interactions
             
-            # Get top similar users
-            top_similar_users = [user_id for user_id, _ in similarities[:10]]
+            # Get top similar users from a single sparse mat-vec product
+            similarities = engine.similar_users(user.id, k=10)
             
-            if not top_similar_users:
+            if not similarities:
                 return []
                 
+            similarity_by_user = dict(similarities)
+            top_similar_users = list(similarity_by_user)
+                
             # Find events that similar users interacted with that the current user hasn't
-            user_events = set(UserEventInteraction.query.filter_by(user_id=user.id).with_entities(UserEventInteraction.event_id).all())
-            user_events = {event_id for (event_id,) in user_events}
-            
-            similar_user_interactions = UserEventInteraction.query.filter(
+            user_events = {event_id for user_id, event_id, _ in interactions if user_id == user.id}
+            user_events.update(event_id for user_id, event_id, _, _ in summaries if user_id == user.id)
+            
+            similar_user_interactions = db.session.query(
+                UserEventInteraction.user_id,
+                UserEventInteraction.event_id,
+                UserEventInteraction.interaction_type
+            ).filter(
                 UserEventInteraction.user_id.in_(top_similar_users),
                 ~UserEventInteraction.event_id.in_(user_events) if user_events else True
             ).all()
@@ -286,27 +470,35 @@ class EnhancedRecommendationService:
             event_scores = defaultdict(float)
             event_counts = defaultdict(int)
             
-            for interaction in similar_user_interactions:
+            for other_user_id, event_id, interaction_type in similar_user_interactions:
                 # Get similarity of the user who interacted
-                similarity = next((sim for uid, sim in similarities if uid == interaction.user_id), 0)
+                similarity = similarity_by_user.get(other_user_id, 0)
                 
                 # Weight by similarity and interaction type
                 weight = 0.5  # Default
-                if interaction.interaction_type == 'view':
+                if interaction_type == 'view':
                     weight = 0.3
-                elif interaction.interaction_type == 'click':
+                elif interaction_type == 'click':
                     weight = 0.5
-                elif interaction.interaction_type == 'join':
+                elif interaction_type == 'join':
                     weight = 1.0
-                elif interaction.interaction_type == 'bookmark':
+                elif interaction_type == 'bookmark':
                     weight = 0.8
                     
                 # Add weighted score
-                event_scores[interaction.event_id] += weight * similarity
-                event_counts[interaction.event_id] += 1
+                event_scores[event_id] += weight * similarity
+                event_counts[event_id] += 1
+            
+            # Interactions removed by retention only survive as summaries; they count with
+            # their summarized (CF matrix) weights, since their types are not kept
+            for other_user_id, event_id, weight_sum, interaction_count in summaries:
+                if other_user_id in similarity_by_user and event_id not in user_events:
+                    event_scores[event_id] += weight_sum * similarity_by_user[other_user_id]
+                    event_counts[event_id] += interaction_count
             
             # Calculate average scores
             cf_recommendations = []
+            events_by_id = {e.id: e for e in events}
             
             for event_id, score in event_scores.items():
                 count = event_counts[event_id]
@@ -314,15 +506,16 @@ class EnhancedRecommendationService:
                     avg_score = score / count
                     
                     # Find event object
-                    event = next((e for e in events if e.id == event_id), None)
+                    event = events_by_id.get(event_id)
                     if event:
                         cf_recommendations.append({
                             'event': event,
-                            'score': min(avg_score, 1.0)  # Cap at 1.0
+                            'score': min(avg_score, 1.0),  # Cap at 1.0
+                            'source': 'cf'
                         })
             
-            # Sort by score
-            cf_recommendations.sort(key=lambda x: x['score'], reverse=True)
+            # Sort by score; equal scores by ascending event id, so the order is deterministic
+            cf_recommendations.sort(key=lambda x: (-round(x['score'], SCORE_TIE_DECIMALS), x['event'].id))
             
             return cf_recommendations
             
@@ -330,26 +523,6 @@ class EnhancedRecommendationService:
             print(f"Error in collaborative filtering: {e}")
             return []
     
-    def _calculate_cosine_similarity(self, vector1, vector2):
-        """Calculate cosine similarity between two vectors"""
-        # Handle empty vectors
-        if vector1.sum() == 0 or vector2.sum() == 0:
-            return 0
-            
-        # Calculate dot product
-        dot_product = np.dot(vector1, vector2)
-        
-        # Calculate magnitudes
-        magnitude1 = np.sqrt(np.sum(vector1**2))
-        magnitude2 = np.sqrt(np.sum(vector2**2))
-        
-        # Avoid division by zero
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0
-            
-        # Calculate cosine similarity
-        return dot_product / (magnitude1 * magnitude2)
-    
     def _merge_recommendations(self, api_recs, cf_recs):
         """Merge recommendations from different sources, avoiding duplicates"""
         # Create a set of event IDs from API recommendations
@@ -373,53 +546,57 @@ class EnhancedRecommendationService:
         """
         Generate fallback recommendations based on event popularity, recency, and user interests.
         This ensures new events automatically appear in recommendations.
+        All candidates are scored in one vectorized pass over columnar feature arrays.
         """
         # Create a set of already recommended event IDs
         recommended_event_ids = set()
         if existing_recommendations:
             recommended_event_ids = {rec['event'].id for rec in existing_recommendations}
         
+        if not events or count <= 0:
+            return []
+        
         # Get user interests
         user_interests = self._get_user_interests(user.id)
         user_interest_map = self._create_interest_map(user_interests)
         
-        # Score events based on factors including recency
-        scored_events = []
+        features = EventFeatures(events)
+        interest_match_scores = self._calculate_interest_match_scores(features, user_interest_map)
         
-        for event in events:
-            # Skip already recommended events
-            if event.id in recommended_event_ids:
-                continue
-                
-            # Score this event
-            interest_match_score = self._calculate_interest_match_score(event, user_interest_map)
-            
-            # Calculate days since creation (for recency)
-            days_since_creation = 365  # Default to a year if no creation date
-            if event.created_at:
-                delta = datetime.utcnow() - event.created_at
-                days_since_creation = delta.days
-            
-            # Recency boost (exponential decay)
-            recency_boost = math.exp(-0.05 * days_since_creation)  # Higher for newer events
-            
-            # Calculate final score with recency as a significant factor
-            final_score = (
-                0.4 * interest_match_score +  # 40% interest match
-                0.3 * float(event.event_popularity or 0.5) +  # 30% popularity
-                0.3 * recency_boost  # 30% recency
-            )
-            
-            scored_events.append({
-                'event': event,
-                'score': final_score
-            })
+        # Recency boost (exponential decay), defaulting to a year if no creation date
+        days_since_creation = features.days_since_creation()
+        days_since_creation[np.isnan(days_since_creation)] = 365
+        recency_boost = np.exp(-0.05 * days_since_creation)  # Higher for newer events
         
-        # Sort by score
-        scored_events.sort(key=lambda x: x['score'], reverse=True)
+        # Calculate final score with recency as a significant factor
+        scores = (
+            0.4 * interest_match_scores +  # 40% interest match
+            0.3 * features.popularity +  # 30% popularity
+            0.3 * recency_boost  # 30% recency
+        )
         
-        # Return top events up to count
-        return scored_events[:count]
+        # Skip already recommended events
+        if recommended_event_ids:
+            scores[np.isin(features.ids, list(recommended_event_ids))] = -np.inf
+        
+        top = self._top_indices(scores, count)
+        return [
+            {'event': features.events[i], 'score': float(scores[i]), 'source': 'fallback'}
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+    
+    def _top_indices(self, scores, count):
+        """
+        Return the indices of the top `count` scores, highest first. Ties keep their
+        original order, matching a stable sort of the whole list.
+        """
+        candidates = np.arange(len(scores))
+        if len(scores) > count:
+            kth = np.argpartition(-scores, count - 1)[count - 1]
+            candidates = candidates[scores >= scores[kth]]
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order][:count]
     
     def _get_user_interests(self, user_id):
         """Get user interests from database"""
@@ -450,39 +627,32 @@ class EnhancedRecommendationService:
         
         return interest_map
     
-    def _calculate_interest_match_score(self, event, interest_map):
-        """Calculate how well an event matches user interests"""
+    def _calculate_interest_match_scores(self, features, interest_map):
+        """Calculate how well each event in a feature set matches user interests"""
         if not interest_map['categories'] and not interest_map['subcategories']:
-            return 0.5  # Neutral score if no interests
+            return np.full(len(features), 0.5)  # Neutral score if no interests
         
-        # Check for category match
-        category_match = False
-        subcategory_match = False
+        subcategory_match = features.matches_subcategories(interest_map['subcategories'])
+        category_match = features.matches_categories(interest_map['categories'])
         
-        if event.category:
-            category_match = event.category.lower() in interest_map['categories']
-            
-        if event.subcategory:
-            subcategory_match = event.subcategory.lower() in interest_map['subcategories']
-        
-        # Calculate score
-        if subcategory_match:
-            return 1.0  # Perfect match
-        elif category_match:
-            return 0.8  # Good match
-        else:
-            # Check for partial matches in description
-            if event.description:
-                desc_lower = event.description.lower()
-                for subcategory in interest_map['subcategories']:
-                    if subcategory in desc_lower:
-                        return 0.6  # Partial match
-                        
-                for category in interest_map['categories']:
-                    if category in desc_lower:
-                        return 0.5  # Weak match
-            
-            return 0.3  # No match
+        # Only scan descriptions of events without a direct category match
+        unmatched = np.flatnonzero(~(subcategory_match | category_match))
+        description_bits = features.description_bitset(
+            interest_map['subcategories'],
+            interest_map['categories'],
+            rows=unmatched
+        )
+        
+        return np.select(
+            [
+                subcategory_match,  # Perfect match
+                category_match,  # Good match
+                (description_bits & DESCRIPTION_MATCHES_SUBCATEGORY) > 0,  # Partial match
+                (description_bits & DESCRIPTION_MATCHES_CATEGORY) > 0  # Weak match
+            ],
+            [1.0, 0.8, 0.6, 0.5],
+            default=0.3  # No match
+        )
     
     def _get_user_interactions(self, user_id):
         """Get recent user interactions for recommendation learning"""
@@ -513,22 +683,4 @@ class EnhancedRecommendationService:
     
     def _calculate_distance(self, lat1, lon1, lat2, lon2):
         """Calculate distance between two points in kilometers using Haversine formula"""
-        # Radius of earth in kilometers
-        R = 6371.0
-        
-        # Convert latitude and longitude from degrees to radians
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-        
-        # Difference in coordinates
-        dlon = lon2_rad - lon1_rad
-        dlat = lat2_rad - lat1_rad
-        
-        # Haversine formula
-        a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        distance = R * c
-        
-        return distance
\ No newline at end of file
+        return haversine_km(lat1, lon1, lat2, lon2)
@@ -0,0 +1,237 @@
+# webapp/retention.py
+"""
+Retention for user_event_interactions.
+
+Each interaction type has a time-to-live (impressions 30 days, views 90 days, ...;
+joins and other strong signals are kept forever). `flask compact-interactions` walks the
+expired rows in id-ordered batches. For every batch it:
+
+1. writes the rows to a compressed archive file (JSONL.gz, or Parquet when pyarrow is
+   installed), renamed into place only once fully written,
+2. folds them into interaction_summaries (weight sum and count per user and event),
+   which collaborative filtering reads alongside the raw interactions,
+3. deletes them by primary key and commits.
+
+Each batch is its own short transaction, so the table is never locked for long.
+Hourly counts for trending live in interaction_rollups and are not affected.
+"""
+import gzip
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from webapp.collaborative_filtering import interaction_weight
+from webapp.models import db, InteractionSummary, UserEventInteraction
+
+# Days each interaction type is kept; types not listed are kept forever
+DEFAULT_RETENTION_DAYS = {
+    'impression': 30,
+    'view': 90,
+    'click': 180,
+    'recommend_click': 180,
+}
+DEFAULT_BATCH_SIZE = 10000
+ARCHIVE_FORMATS = ('jsonl', 'parquet')
+
+
+def parse_retention_policy(spec):
+    """
+    Parse "impression=30,view=90,join=forever" into {type: days}. Types set to
+    'forever' (or 0) are removed from the policy, i.e. kept forever.
+    """
+    policy = dict(DEFAULT_RETENTION_DAYS)
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        interaction_type, _, days = item.partition('=')
+        interaction_type, days = interaction_type.strip(), days.strip().lower()
+        if days in ('forever', 'none', '0', ''):
+            policy.pop(interaction_type, None)
+        else:
+            policy[interaction_type] = int(days)
+    return policy
+
+
+def load_interaction_summaries():
+    """Return (user_id, event_id, weight_sum, interaction_count) for every summary"""
+    return db.session.query(
+        InteractionSummary.user_id,
+        InteractionSummary.event_id,
+        InteractionSummary.weight_sum,
+        InteractionSummary.interaction_count
+    ).all()
+
+
+def _greatest(*values):
+    """Dialect-portable GREATEST(): SQLite spells the scalar version max()"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.max(*values)
+    return func.greatest(*values)
+
+
+def summarize_interactions(rows):
+    """Fold interaction rows into interaction_summaries with one upsert (no commit)"""
+    totals = defaultdict(lambda: [0.0, 0, None])
+    for row in rows:
+        total = totals[(row.user_id, row.event_id)]
+        total[0] += interaction_weight(row.interaction_type)
+        total[1] += 1
+        if row.timestamp and (total[2] is None or row.timestamp > total[2]):
+            total[2] = row.timestamp
+    if not totals:
+        return
+
+    dialect_insert = sqlite.insert if db.engine.dialect.name == 'sqlite' else postgresql.insert
+    statement = dialect_insert(InteractionSummary)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id', 'event_id'],
+        set_={
+            'weight_sum': InteractionSummary.weight_sum + statement.excluded.weight_sum,
+            'interaction_count': InteractionSummary.interaction_count + statement.excluded.interaction_count,
+            'last_interaction_at': _greatest(
+                func.coalesce(InteractionSummary.last_interaction_at, statement.excluded.last_interaction_at),
+                statement.excluded.last_interaction_at
+            )
+        }
+    )
+    db.session.execute(statement, [
+        {
+            'user_id': user_id,
+            'event_id': event_id,
+            'weight_sum': weight_sum,
+            'interaction_count': interaction_count,
+            'last_interaction_at': last_interaction_at
+        }
+        for (user_id, event_id), (weight_sum, interaction_count, last_interaction_at) in totals.items()
+    ])
+
+
+def _archive_record(row):
+    """Serializable dict for one interaction row"""
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'event_id': row.event_id,
+        'interaction_type': row.interaction_type,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+        'interaction_metadata': row.interaction_metadata
+    }
+
+
+def write_archive(rows, path, archive_format='jsonl'):
+    """
+    Write interaction rows to path (.jsonl.gz or .parquet). The file is written under a
+    temporary name and renamed, so a path that exists is always complete.
+    """
+    records = [_archive_record(row) for row in rows]
+    temporary_path = f'{path}.partial'
+
+    try:
+        if archive_format == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("The 'pyarrow' package is required for Parquet archives")
+            for record in records:
+                record['interaction_metadata'] = json.dumps(record['interaction_metadata'])
+            pq.write_table(pa.Table.from_pylist(records), temporary_path, compression='zstd')
+        else:
+            with gzip.open(temporary_path, 'wt', encoding='utf-8') as archive:
+                for record in records:
+                    archive.write(json.dumps(record))
+                    archive.write('\n')
+
+        os.replace(temporary_path, path)
+    finally:
+        # Only left behind if writing failed (e.g. a full disk)
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return path
+
+
+def default_archive_dir():
+    """The archive directory under the current application's instance folder"""
+    return os.path.join(current_app.instance_path, 'archive')
+
+
+class InteractionCompactor:
+    """Archives, summarizes and deletes expired interactions in batches"""
+
+    def __init__(self, policy=None, archive_dir=None, archive_format='jsonl',
+                 batch_size=DEFAULT_BATCH_SIZE, pause=0.0):
+        """
+        Configure the retention policy ({type: days}) and where archives go (by default
+        the application's instance folder, so they never depend on the working directory)
+        """
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format '{archive_format}'")
+        self.policy = DEFAULT_RETENTION_DAYS if policy is None else policy
+        self.archive_dir = archive_dir or default_archive_dir()
+        self.archive_format = archive_format
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def expired_query(self, interaction_type, now=None):
+        """Query of the interactions of a type older than its TTL"""
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.policy[interaction_type])
+        return UserEventInteraction.query.filter(
+            UserEventInteraction.interaction_type == interaction_type,
+            UserEventInteraction.timestamp < cutoff
+        )
+
+    def count_expired(self, now=None):
+        """Return {type: rows past their TTL} without changing anything"""
+        return {
+            interaction_type: self.expired_query(interaction_type, now).count()
+            for interaction_type in self.policy
+        }
+
+    def run(self, now=None, log=print):
+        """Compact every expired interaction. Returns {type: rows removed}."""
+        now = now or datetime.utcnow()
+        run_stamp = now.strftime('%Y%m%dT%H%M%S')
+        extension = 'parquet' if self.archive_format == 'parquet' else 'jsonl.gz'
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        removed = {}
+        for interaction_type in self.policy:
+            removed[interaction_type] = 0
+            batch_number = 0
+            while True:
+                rows = self.expired_query(interaction_type, now).order_by(
+                    UserEventInteraction.id
+                ).limit(self.batch_size).all()
+                if not rows:
+                    break
+
+                path = os.path.join(
+                    self.archive_dir,
+                    f'user_event_interactions-{interaction_type}-{run_stamp}-{batch_number:05d}.{extension}'
+                )
+                write_archive(rows, path, self.archive_format)
+                try:
+                    summarize_interactions(rows)
+                    UserEventInteraction.query.filter(
+                        UserEventInteraction.id.in_([row.id for row in rows])
+                    ).delete(synchronize_session=False)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # The rows are still in the table; drop the archive so a rerun does not duplicate it
+                    os.remove(path)
+                    raise
+                db.session.expunge_all()
+
+                removed[interaction_type] += len(rows)
+                batch_number += 1
+                log(f'{interaction_type}: archived and removed {removed[interaction_type]} rows ({path})')
+                if self.pause:
+                    time.sleep(self.pause)
+        return removed
@@ -0,0 +1,155 @@
+# webapp/rollups.py
+"""
+Maintenance of the interaction_rollups table: hourly interaction counts per event and
+interaction type.
+
+Rollups are updated in the same transaction as the interactions themselves: bulk inserts
+from the interaction buffer call record_interaction_rollups() directly, and interactions
+added through the ORM (event creation, joins, seeding) are picked up by an after_flush
+listener. Event.recent_interaction_count is not updated here but recomputed from the
+rollups periodically (see webapp/event_counters.py). `flask backfill-rollups` rebuilds
+the table from the raw interactions that retention has not removed yet.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import event as sa_event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from webapp.models import db, InteractionRollup, UserEventInteraction
+
+UPSERT_BATCH_SIZE = 5000
+SQLITE_HOUR_FORMAT = '%Y-%m-%d %H:00:00'
+
+
+def hour_start(timestamp):
+    """Truncate a datetime to the start of its hour"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert_statement(dialect_name):
+    """INSERT into interaction_rollups that adds to the count of an existing bucket"""
+    dialect_insert = sqlite.insert if dialect_name == 'sqlite' else postgresql.insert
+    statement = dialect_insert(InteractionRollup)
+    return statement.on_conflict_do_update(
+        index_elements=['event_id', 'interaction_type', 'bucket'],
+        set_={'count': InteractionRollup.count + statement.excluded.count}
+    )
+
+
+def upsert_rollups(connection, counts):
+    """Add {(event_id, interaction_type, bucket): count} to the rollups"""
+    if not counts:
+        return
+    statement = _upsert_statement(connection.dialect.name)
+    items = [
+        {'event_id': event_id, 'interaction_type': interaction_type, 'bucket': bucket, 'count': count}
+        for (event_id, interaction_type, bucket), count in counts.items()
+    ]
+    for start in range(0, len(items), UPSERT_BATCH_SIZE):
+        connection.execute(statement, items[start:start + UPSERT_BATCH_SIZE])
+
+
+def rollup_counts(rows):
+    """Count interaction dicts per (event_id, interaction_type, hour bucket)"""
+    return Counter(
+        (row['event_id'], row['interaction_type'], hour_start(row.get('timestamp') or datetime.utcnow()))
+        for row in rows
+    )
+
+
+def record_interaction_rollups(rows):
+    """Add interaction dicts (as bulk-inserted by the interaction buffer) to the rollups"""
+    upsert_rollups(db.session.connection(), rollup_counts(rows))
+
+
+@sa_event.listens_for(Session, 'after_flush')
+def _rollup_flushed_interactions(session, flush_context):
+    """Roll up interactions inserted through the ORM"""
+    counts = Counter(
+        (instance.event_id, instance.interaction_type, hour_start(instance.timestamp or datetime.utcnow()))
+        for instance in session.new
+        if isinstance(instance, UserEventInteraction)
+    )
+    if counts:
+        upsert_rollups(session.connection(), counts)
+
+
+def _hour_floor(column):
+    """SQL expression truncating a timestamp column to the hour"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime(SQLITE_HOUR_FORMAT, column)
+    return func.date_trunc('hour', column)
+
+
+def rebuild_starts(since=None):
+    """
+    Return {interaction_type: first bucket to rebuild} for the types that still have raw
+    interactions. Retention deletes old raw rows per type, so each type's rebuild starts
+    at its oldest retained interaction: at that hour if no rollups of the type are that
+    old (e.g. right after migrating), otherwise at the next full hour, since the rollup
+    of a partially compacted hour also counts rows that are gone. `since` only moves the
+    start later; rollups of interactions that no longer exist are never rebuilt.
+    """
+    oldest = db.session.query(
+        UserEventInteraction.interaction_type, func.min(UserEventInteraction.timestamp)
+    ).group_by(UserEventInteraction.interaction_type)
+
+    starts = {}
+    for interaction_type, timestamp in oldest:
+        if timestamp is None:
+            continue
+        start = hour_start(timestamp)
+        older_rollups = db.session.query(InteractionRollup.bucket).filter(
+            InteractionRollup.interaction_type == interaction_type,
+            InteractionRollup.bucket <= start
+        ).first()
+        if older_rollups is not None and start != timestamp:
+            start += timedelta(hours=1)
+        if since is not None:
+            start = max(start, hour_start(since))
+        starts[interaction_type] = start
+    return starts
+
+
+def backfill_rollups(since=None):
+    """
+    Rebuild the rollups from user_event_interactions and commit. Only the buckets each
+    interaction type still has raw rows for are deleted and rebuilt (see
+    rebuild_starts()), and only those from `since` on, if given; rollups of compacted or
+    dropped interactions are kept. Aggregation happens in the database; returns the
+    bucket count. Interactions tracked while this runs may be counted twice, so run it
+    while ingestion is paused (or right after migrating).
+    """
+    bucket = _hour_floor(UserEventInteraction.timestamp)
+    stored = 0
+    for interaction_type, start in rebuild_starts(since).items():
+        query = db.session.query(
+            UserEventInteraction.event_id, bucket, func.count()
+        ).filter(
+            UserEventInteraction.interaction_type == interaction_type,
+            UserEventInteraction.timestamp >= start
+        ).group_by(UserEventInteraction.event_id, bucket)
+
+        counts = {}
+        for event_id, hour, count in query:
+            if isinstance(hour, str):
+                hour = datetime.strptime(hour, '%Y-%m-%d %H:%M:%S')
+            counts[(event_id, interaction_type, hour)] = count
+
+        InteractionRollup.query.filter(
+            InteractionRollup.interaction_type == interaction_type,
+            InteractionRollup.bucket >= start
+        ).delete(synchronize_session=False)
+        upsert_rollups(db.session.connection(), counts)
+        stored += len(counts)
+    db.session.commit()
+    return stored
+
+
+def remove_interaction_rollups(rows):
+    """Subtract interaction dicts from the rollups, e.g. before deleting them (no commit)"""
+    counts = rollup_counts(rows)
+    upsert_rollups(db.session.connection(), {key: -count for key, count in counts.items()})
+    InteractionRollup.query.filter(InteractionRollup.count <= 0).delete(synchronize_session=False)
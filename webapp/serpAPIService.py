@@ -1,18 +1,479 @@
 # webapp/serpAPIService.py
 from serpapi import GoogleSearch
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, date, timedelta
+import hashlib
+import json
 import os
+import re
+import sqlite3
+import threading
+import time
+
+from webapp.cache import TTLCache
+
+# Seconds a search result stays fresh, per SerpAPI date chip: results for today change
+# quickly, upcoming events hardly at all
+SEARCH_CACHE_TTLS = {
+    'date:today': 15 * 60,
+    'date:tomorrow': 60 * 60,
+    'date:week': 3 * 3600,
+    'date:month': 6 * 3600,
+    'date:upcoming': 12 * 3600,
+}
+DEFAULT_SEARCH_CACHE_TTL = 3600
+# Searches that found nothing are cached briefly, since new events may be listed soon
+EMPTY_RESULT_TTL = 5 * 60
+COORDINATES = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+class SearchError(Exception):
+    """SerpAPI returned an error or could not be reached; the result must not be cached"""
+
+
+def search_cache_key(params):
+    """
+    Normalized cache key of a SerpAPI request: case and whitespace of the query and
+    location are folded, coordinates are rounded to ~1 km and the API key is left out.
+    """
+    normalized = {}
+    for name, value in params.items():
+        if name == 'api_key':
+            continue
+        if isinstance(value, str):
+            value = ' '.join(value.lower().split())
+            match = COORDINATES.match(value) if name == 'location' else None
+            if match:
+                value = f'{float(match.group(1)):.2f},{float(match.group(2)):.2f}'
+        normalized[name] = value
+    return json.dumps(normalized, sort_keys=True)
+
+
+class SQLiteSearchTier:
+    """Persistent tier of the search cache: one SQLite file shared by all workers"""
+
+    def __init__(self, path):
+        """Open (and create if needed) the cache database at path"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS search_results ('
+            '  key TEXT PRIMARY KEY, expires_at REAL NOT NULL, stale_until REAL NOT NULL, payload TEXT NOT NULL'
+            ')'
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key):
+        """Return (expires_at, stale_until, events) or None"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT expires_at, stale_until, payload FROM search_results WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def set(self, key, entry):
+        """Store (expires_at, stale_until, events), purging dead entries every 100 writes"""
+        expires_at, stale_until, events = entry
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO search_results (key, expires_at, stale_until, payload) VALUES (?, ?, ?, ?)',
+                (key, expires_at, stale_until, json.dumps(events))
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._connection.execute('DELETE FROM search_results WHERE stale_until < ?', (time.time(),))
+
+
+class SearchResultCache:
+    """
+    Two-tier cache of formatted search results: an in-process LRU in front of an
+    optional SQLite file. An entry is fresh for the TTL of its date chip; for
+    `stale_factor` times that long again it is still served, while a background thread
+    fetches a fresh copy (stale-while-revalidate). Empty results are fresh for at most
+    `empty_ttl` seconds and failed searches are never cached. An unreadable SQLite tier
+    counts as a miss.
+    """
+
+    def __init__(self, path=None, max_entries=500, ttls=None, stale_factor=1.0, refresh_workers=2,
+                 empty_ttl=EMPTY_RESULT_TTL):
+        """Create the cache; without a path only the in-process tier is used"""
+        self.ttls = dict(SEARCH_CACHE_TTLS, **(ttls or {}))
+        self.stale_factor = stale_factor
+        self.empty_ttl = empty_ttl
+        self._memory = TTLCache(max_entries=max_entries)
+        self._persistent = SQLiteSearchTier(path) if path else None
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='search-refresh')
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.counters = {
+            'memory_hits': 0,
+            'persistent_hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'api_fetches': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'fetch_errors': 0,
+            'persistent_errors': 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def ttl_for(self, params):
+        """Fresh lifetime of a result, by the request's date chip"""
+        return self.ttls.get(params.get('htichips'), DEFAULT_SEARCH_CACHE_TTL)
+
+    def _lookup(self, key):
+        """Return (entry, tier) from the fastest tier holding the key"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            return entry, 'memory'
+        if self._persistent is not None:
+            try:
+                entry = self._persistent.get(key)
+            except sqlite3.Error as e:
+                self._count('persistent_errors')
+                print(f"Error reading search cache: {e}")
+                return None, None
+            if entry is not None and entry[1] > time.time():
+                self._memory.set(key, entry, ttl=entry[1] - time.time())
+                return entry, 'persistent'
+        return None, None
+
+    def _store(self, key, params, events):
+        now = time.time()
+        ttl = self.ttl_for(params)
+        if not events:
+            ttl = min(ttl, self.empty_ttl)
+        entry = (now + ttl, now + ttl * (1 + self.stale_factor), events)
+        self._memory.set(key, entry, ttl=entry[1] - now)
+        if self._persistent is not None:
+            try:
+                self._persistent.set(key, entry)
+            except sqlite3.Error as e:
+                self._count('persistent_errors')
+                print(f"Error writing search cache: {e}")
+
+    def _fetch(self, key, params, fetch, single_flight=None):
+        """
+        Call the API and cache the result; raises SearchError on failure. With a
+        SingleFlight, concurrent identical fetches share one call, and the result is
+        stored before the next caller for the key (in any process) rechecks the cache.
+        """
+        def fetch_and_store():
+            self._count('api_fetches')
+            try:
+                events = fetch()
+            except Exception:
+                self._count('fetch_errors')
+                raise
+            self._store(key, params, events)
+            return events
+
+        if single_flight is None:
+            return fetch_and_store()
+        return single_flight.do(key, fetch_and_store, recheck=lambda: self.fresh(params))
+
+    def _refresh(self, key, params, fetch, single_flight):
+        try:
+            self._fetch(key, params, fetch, single_flight)
+            self._count('refreshes')
+        except Exception as e:
+            self._count('refresh_errors')
+            print(f"Background refresh of search results failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def fresh(self, params):
+        """Return the fresh cached events for params or None, without counting a lookup"""
+        entry, _ = self._lookup(search_cache_key(params))
+        if entry is not None and time.time() < entry[0]:
+            return entry[2]
+        return None
+
+    def get_or_fetch(self, params, fetch, single_flight=None):
+        """Return the cached events for params, calling fetch() (through single_flight, if given) on a miss"""
+        key = search_cache_key(params)
+        entry, tier = self._lookup(key)
+        if entry is not None:
+            expires_at, stale_until, events = entry
+            if time.time() < expires_at:
+                self._count(f'{tier}_hits')
+                return events
+            # Stale: serve it and refresh once in the background
+            self._count('stale_hits')
+            with self._lock:
+                start_refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if start_refresh:
+                self._refresher.submit(self._refresh, key, params, fetch, single_flight)
+            return events
+
+        self._count('misses')
+        return self._fetch(key, params, fetch, single_flight)
+
+    def stats(self):
+        """Return hit/miss counters and the API calls saved"""
+        with self._lock:
+            counters = dict(self.counters)
+        hits = counters['memory_hits'] + counters['persistent_hits'] + counters['stale_hits']
+        lookups = hits + counters['misses']
+        return dict(
+            counters,
+            entries=len(self._memory),
+            persistent=self._persistent is not None,
+            hit_ratio=hits / lookups if lookups else 0.0,
+            # Every hit is a SerpAPI search not made on the request path; stale hits
+            # still cost their background refresh, whether it succeeded or not
+            quota_saved=hits - counters['refreshes'] - counters['refresh_errors']
+        )
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs the function,
+    callers arriving while it runs wait for and share its result (or exception).
+
+    With a lock_dir the leader also takes an exclusive file lock for the key, so leaders
+    in other processes sharing the directory wait for it. Once it holds the lock a leader
+    calls `recheck` (e.g. a lookup in a cache shared between the processes) before running
+    the function, since another process may have finished the same call just before.
+    File locks need fcntl (POSIX).
+    """
+
+    def __init__(self, lock_dir=None, lock_stripes=256, lock_timeout=30):
+        """Create the coalescer; lock files are striped over lock_stripes files in lock_dir"""
+        if lock_dir:
+            try:
+                import fcntl  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Cross-process single-flight needs fcntl, which this platform lacks")
+            os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir
+        self.lock_stripes = lock_stripes
+        self.lock_timeout = lock_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {'leaders': 0, 'coalesced': 0, 'lock_waits': 0, 'rechecked': 0}
+
+    def do(self, key, fn, recheck=None):
+        """Run fn() once for all concurrent callers with the same key and return its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self.counters['leaders'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            if self.lock_dir:
+                call['result'] = self._run_locked(key, fn, recheck)
+            else:
+                call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+        return call['result']
+
+    def _run_locked(self, key, fn, recheck):
+        """Run fn() holding the key's file lock; waits at most lock_timeout for other processes"""
+        import fcntl
+
+        stripe = int(hashlib.sha1(key.encode()).hexdigest(), 16) % self.lock_stripes
+        with open(os.path.join(self.lock_dir, f'{stripe:03d}.lock'), 'a') as lock_file:
+            deadline = time.monotonic() + self.lock_timeout
+            waited = False
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        # The other process is stuck: fetch without the lock
+                        print("Timed out waiting for the search lock, fetching anyway")
+                        return fn()
+                    waited = True
+                    time.sleep(0.05)
+            try:
+                if waited:
+                    with self._lock:
+                        self.counters['lock_waits'] += 1
+                if recheck is not None:
+                    result = recheck()
+                    if result is not None:
+                        with self._lock:
+                            self.counters['rechecked'] += 1
+                        return result
+                return fn()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self):
+        """Return the number of calls run and the number that shared another call's result"""
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._calls))
+
 
 class EventService:
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache=None, single_flight=None, backend=None, fallback_workers=6):
+        """
+        cache: optional SearchResultCache; single_flight: SingleFlight coalescing identical
+        concurrent searches (one per service by default); backend: SerpApi base URL override;
+        fallback_workers: threads running the candidate searches of search_with_fallbacks
+        """
         self.api_key = api_key
+        self.cache = cache
+        self.single_flight = single_flight or SingleFlight()
+        self.backend = backend
+        self.fallback_workers = fallback_workers
+        self._fallback_executor = ThreadPoolExecutor(max_workers=fallback_workers, thread_name_prefix='search-fallback')
+        self._fallback_pending = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            'fallback_searches': 0, 'answered_by': {}, 'deadline_exceeded': 0, 'cancelled': 0,
+            'queued': 0, 'max_queue_wait': 0.0,
+        }
+        
+    def search_with_fallbacks(self, locations, query=None, date=None, page=1, deadline=10.0):
+        """
+        Search several locations at once and return (location, events) of the first
+        location, in priority order, with events; (None, []) if none has any.
+
+        All candidate searches start immediately, so a miss costs about one SerpApi round
+        trip instead of one per candidate. The result of a location is used as soon as every
+        higher-priority one came back empty. Candidates that have not started are cancelled;
+        running ones finish in the background and land in the search cache. A candidate's
+        `deadline` counts from when its search starts, not from when it was queued for one of
+        the `fallback_workers` threads (a search still queued after `deadline` seconds is given
+        up on); once it passes, the best result already received is returned. Searches that
+        had to queue are counted in stats().
+        """
+        locations = list(dict.fromkeys(location for location in locations if location))
+        if not locations:
+            locations = [None]
+        with self._lock:
+            self.counters['fallback_searches'] += 1
+        started = [threading.Event() for _ in locations]
+        start_times = [None] * len(locations)
+        futures = [
+            self._submit_candidate(started[index], start_times, index,
+                                   query=query, location=location, date=date, page=page)
+            for index, location in enumerate(locations)
+        ]
+        
+        chosen, events = None, []
+        try:
+            for index, (location, future) in enumerate(zip(locations, futures)):
+                # Waiting for a free worker does not use up the candidate's deadline; it has
+                # a budget of its own
+                if started[index].wait(deadline):
+                    timeout = max(0.0, start_times[index] + deadline - time.monotonic())
+                else:
+                    timeout = 0.0
+                try:
+                    events = future.result(timeout=timeout)
+                except FutureTimeoutError:
+                    # Out of time: settle for the best lower-priority result that already arrived
+                    with self._lock:
+                        self.counters['deadline_exceeded'] += 1
+                    chosen, events = next(
+                        ((other, candidate.result()) for other, candidate in zip(locations, futures)
+                         if candidate.done() and not candidate.cancelled() and candidate.result()),
+                        (None, [])
+                    )
+                    break
+                if events:
+                    chosen = location
+                    break
+        finally:
+            cancelled = sum(1 for future in futures if future.cancel())
+            with self._lock:
+                self.counters['cancelled'] += cancelled
+                if chosen is not None:
+                    answered_by = self.counters['answered_by']
+                    position = str(locations.index(chosen))
+                    answered_by[position] = answered_by.get(position, 0) + 1
+        return chosen, events
+
+    def _submit_candidate(self, started, start_times, index, **search):
+        """Queue one candidate search; start_times[index] is set and `started` fired when it runs"""
+        submitted = time.monotonic()
+
+        def run():
+            start_times[index] = time.monotonic()
+            started.set()
+            waited = start_times[index] - submitted
+            with self._lock:
+                self.counters['max_queue_wait'] = max(self.counters['max_queue_wait'], waited)
+            return self.search_events(**search)
+
+        def finished(future):
+            with self._lock:
+                self._fallback_pending -= 1
+
+        with self._lock:
+            self._fallback_pending += 1
+            if self._fallback_pending > self.fallback_workers:
+                # Every worker is busy: this search waits in the queue
+                self.counters['queued'] += 1
+        future = self._fallback_executor.submit(run)
+        future.add_done_callback(finished)
+        return future
+    
+    def stats(self):
+        """
+        Return counters of search_with_fallbacks: how often the n-th candidate answered,
+        deadlines missed, and how saturated the worker pool is (searches that queued, the
+        longest queue wait in seconds, searches queued or running now)
+        """
+        with self._lock:
+            return dict(
+                self.counters,
+                answered_by=dict(self.counters['answered_by']),
+                pending=self._fallback_pending,
+                workers=self.fallback_workers
+            )
         
     def search_events(self, query=None, location=None, date=None, page=1):
         """
-        Search for events using SerpApi Google Events with improved search parameters
+        Search for events using SerpApi Google Events with improved search parameters.
+        Results are served from the search cache when one is configured.
         """
         print(f"EventService.search_events called with: query={query}, location={location}, date={date}, page={page}")
+        params = self._build_params(query, location, date, page)
         
+        # Identical searches in flight at the same time share one SerpApi call
+        try:
+            if self.cache is None:
+                return self.single_flight.do(search_cache_key(params), lambda: self._fetch_events(params))
+            return self.cache.get_or_fetch(params, lambda: self._fetch_events(params), self.single_flight)
+        except Exception as e:
+            print(f"Error fetching events: {str(e)}")
+            return []
+    
+    def _build_params(self, query, location, date, page):
+        """Build the SerpApi Google Events parameters for a search"""
         # Ensure we have a meaningful search query
         search_query = []
         if query:
@@ -57,52 +518,50 @@ class EventService:
         if date_param:
             params["htichips"] = date_param
             
-        print(f"Final SerpAPI parameters: {params}")
+        return params
+    
+    def _fetch_events(self, params):
+        """
+        Run a search against SerpApi and return the formatted events.
+        Raises SearchError if SerpApi reports an error, so that it is not cached.
+        """
+        print(f"Final SerpAPI parameters: {dict(params, api_key='***')}")
         
-        try:
-            search = GoogleSearch(params)
-            results = search.get_dict()
-            print(f"SerpAPI response received: {'events_results' in results}")
+        results = self._search(params)
+        print(f"SerpAPI response received: {'events_results' in results}")
+        
+        if "error" in results:
+            print(f"SerpAPI error: {results['error']}")
             
-            if "error" in results:
-                print(f"SerpAPI error: {results['error']}")
-                
-                # If location error, try again without the location parameter
-                if "location parameter" in results["error"] and location:
-                    print("Location error detected, trying without location parameter")
-                    
-                    # Remove location parameter but keep it in the query
-                    params.pop("location", None)
-                    
-                    # Try search again
-                    search = GoogleSearch(params)
-                    results = search.get_dict()
-                    
-                    if "error" in results:
-                        print(f"Still got error: {results['error']}")
-                        return []
-                    
-                    if "events_results" not in results:
-                        print("No events_results in second attempt response")
-                        return []
-                        
-                    formatted_events = self._format_events(results["events_results"])
-                    print(f"Formatted {len(formatted_events)} events from second attempt")
-                    return formatted_events
-                else:
-                    return []
+            # If location error, try again without the location parameter
+            if "location parameter" not in results["error"] or "location" not in params:
+                raise SearchError(results["error"])
+            print("Location error detected, trying without location parameter")
             
-            if "events_results" not in results:
-                print("No events_results in response")
-                return []
+            # Remove location parameter but keep it in the query
+            retry_params = {name: value for name, value in params.items() if name != "location"}
             
-            formatted_events = self._format_events(results["events_results"])
-            print(f"Formatted {len(formatted_events)} events")
-            return formatted_events
+            # Try search again
+            results = self._search(retry_params)
             
-        except Exception as e:
-            print(f"Error fetching events: {str(e)}")
+            if "error" in results:
+                print(f"Still got error: {results['error']}")
+                raise SearchError(results["error"])
+        
+        if "events_results" not in results:
+            print("No events_results in response")
             return []
+        
+        formatted_events = self._format_events(results["events_results"])
+        print(f"Formatted {len(formatted_events)} events")
+        return formatted_events
+    
+    def _search(self, params):
+        """Run one SerpApi request and return the response dict"""
+        search = GoogleSearch(dict(params))
+        if self.backend:
+            search.BACKEND = self.backend
+        return search.get_dict()
     
     def _prepare_date_param(self, date_str):
         """
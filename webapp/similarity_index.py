@@ -0,0 +1,247 @@
+# webapp/similarity_index.py
+"""
+Persistent item-item similarity index.
+
+The index is a compact table of the top-N most similar events for every event, built
+offline from user_event_interactions and stored in the event_similarities table.
+Request-time collaborative filtering then only needs to look up the neighbours of the
+events a user recently interacted with.
+
+SimilarityIndexFollower keeps the table fresh between rebuilds by treating
+user_event_interactions as a changelog: it tails rows by id and folds each new
+interaction into an IncrementalSimilarityModel, rewriting only the affected rows.
+Ids are not committed in order (a transaction can commit a lower id after a higher one
+was read), so every poll re-reads the last `trailing_ids` ids and applies the ones it
+has not seen yet. Neighbours of events deleted since the model loaded them are dropped
+before rows are written.
+"""
+import time
+from datetime import datetime
+from collections import defaultdict
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from webapp.models import db, Event, EventSimilarity, UserEventInteraction, IN_CLAUSE_CHUNK_SIZE
+from webapp.collaborative_filtering import SparseCFEngine, IncrementalSimilarityModel
+from webapp.retention import load_interaction_summaries
+
+DEFAULT_NEIGHBOURS = 20
+INSERT_BATCH_SIZE = 5000
+FOLLOW_BATCH_SIZE = 1000
+# Ids below the highest one seen that are still re-read for late commits
+FOLLOW_TRAILING_IDS = 5000
+
+
+def rebuild_similarity_index(top_n=DEFAULT_NEIGHBOURS):
+    """
+    Rebuild the event_similarities table from scratch.
+    Returns the number of (event, neighbour) rows written.
+    """
+    interactions = db.session.query(
+        UserEventInteraction.user_id,
+        UserEventInteraction.event_id,
+        UserEventInteraction.interaction_type
+    ).all()
+
+    engine = SparseCFEngine.from_interactions(interactions, load_interaction_summaries())
+    now = datetime.utcnow()
+
+    try:
+        # Replace the whole index in a single transaction so readers never see a
+        # half-built table
+        EventSimilarity.query.delete()
+
+        written = 0
+        batch = []
+        if engine is not None:
+            for event_id, neighbor_id, score in engine.item_neighbours(top_n):
+                batch.append({
+                    'event_id': event_id,
+                    'neighbor_id': neighbor_id,
+                    'score': score,
+                    'updated_at': now
+                })
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    db.session.execute(insert(EventSimilarity), batch)
+                    written += len(batch)
+                    batch = []
+
+        if batch:
+            db.session.execute(insert(EventSimilarity), batch)
+            written += len(batch)
+
+        db.session.commit()
+        return written
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def is_index_built():
+    """Check if the similarity index has been built at least once"""
+    return db.session.query(EventSimilarity.event_id).limit(1).scalar() is not None
+
+
+def load_neighbours(event_ids):
+    """Return {event_id: [(neighbour_id, score), ...]} for the given events"""
+    neighbours = defaultdict(list)
+    if not event_ids:
+        return neighbours
+
+    rows = db.session.query(
+        EventSimilarity.event_id,
+        EventSimilarity.neighbor_id,
+        EventSimilarity.score
+    ).filter(EventSimilarity.event_id.in_(set(event_ids))).all()
+
+    for event_id, neighbor_id, score in rows:
+        neighbours[event_id].append((neighbor_id, score))
+    return neighbours
+
+
+class SimilarityIndexFollower:
+    """
+    Changelog consumer that applies new interactions to the similarity index.
+    Run a single follower per deployment (see `flask follow-similarity`).
+    """
+
+    def __init__(self, top_n=DEFAULT_NEIGHBOURS, batch_size=FOLLOW_BATCH_SIZE, trailing_ids=FOLLOW_TRAILING_IDS):
+        """Create a follower; call bootstrap() before polling"""
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.trailing_ids = trailing_ids
+        self.model = None
+        self.cursor = 0
+        # Ids in the trailing window that are already applied
+        self.applied = set()
+
+    def bootstrap(self):
+        """Load every interaction, rebuild the model and rewrite the whole index"""
+        interactions = db.session.query(
+            UserEventInteraction.id,
+            UserEventInteraction.user_id,
+            UserEventInteraction.event_id,
+            UserEventInteraction.interaction_type
+        ).order_by(UserEventInteraction.id).all()
+
+        engine = SparseCFEngine.from_interactions(
+            ((user_id, event_id, interaction_type) for _, user_id, event_id, interaction_type in interactions),
+            load_interaction_summaries()
+        )
+        self.model = IncrementalSimilarityModel.from_engine(engine, top_n=self.top_n)
+        self.cursor = interactions[-1][0] if interactions else 0
+        self.applied = {
+            interaction_id for interaction_id, _, _, _ in interactions
+            if interaction_id > self.cursor - self.trailing_ids
+        }
+        self._write_rows(set(self.model.dots), replace_all=True)
+
+    def poll(self):
+        """
+        Apply the next batch of interactions not applied yet: new ones past the cursor
+        and late commits inside the trailing window. Returns the number applied.
+        """
+        if self.model is None:
+            self.bootstrap()
+
+        # The already applied ids of the window come back too; fetch enough for a full batch
+        rows = db.session.query(
+            UserEventInteraction.id,
+            UserEventInteraction.user_id,
+            UserEventInteraction.event_id,
+            UserEventInteraction.interaction_type
+        ).filter(
+            UserEventInteraction.id > self.cursor - self.trailing_ids
+        ).order_by(UserEventInteraction.id).limit(self.batch_size + len(self.applied)).all()
+        rows = [row for row in rows if row[0] not in self.applied]
+
+        if not rows:
+            return 0
+
+        affected = set()
+        for _, user_id, event_id, interaction_type in rows:
+            affected |= self.model.apply(user_id, event_id, interaction_type)
+
+        try:
+            self._write_rows(affected)
+        except IntegrityError as e:
+            # An event was deleted between the existence check and the write
+            print(f"Similarity index write failed ({e.orig}), rebuilding the model")
+            self.bootstrap()
+            return len(rows)
+
+        self.cursor = max(self.cursor, rows[-1][0])
+        self.applied.update(row[0] for row in rows)
+        self.applied = {
+            interaction_id for interaction_id in self.applied
+            if interaction_id > self.cursor - self.trailing_ids
+        }
+        return len(rows)
+
+    def run(self, interval=2.0, rebuild_every=None):
+        """Poll forever, optionally re-bootstrapping every `rebuild_every` seconds"""
+        last_bootstrap = time.monotonic()
+        while True:
+            if rebuild_every and time.monotonic() - last_bootstrap >= rebuild_every:
+                self.bootstrap()
+                last_bootstrap = time.monotonic()
+
+            applied = self.poll()
+            # Drain backlogs without sleeping between full batches
+            if applied < self.batch_size:
+                time.sleep(interval)
+
+    def _forget_deleted_events(self, event_ids):
+        """
+        Drop events that no longer exist from the model, so that no row referencing them
+        is written. Returns the ids of the deleted events and of the events whose rows
+        listed them.
+        """
+        referenced = set(event_ids)
+        for event_id in event_ids:
+            referenced.update(self.model.dots.get(event_id, {}))
+        referenced = list(referenced)
+
+        existing = set()
+        for start in range(0, len(referenced), IN_CLAUSE_CHUNK_SIZE):
+            chunk = referenced[start:start + IN_CLAUSE_CHUNK_SIZE]
+            existing.update(event_id for event_id, in db.session.query(Event.id).filter(Event.id.in_(chunk)))
+
+        changed = set()
+        for event_id in set(referenced) - existing:
+            changed.add(event_id)
+            changed |= self.model.remove_event(event_id)
+        return changed
+
+    def _write_rows(self, event_ids, replace_all=False):
+        """Replace the stored neighbour rows of the given events with the model's"""
+        event_ids = set(event_ids)
+        event_ids |= self._forget_deleted_events(event_ids)
+        now = datetime.utcnow()
+        try:
+            if replace_all:
+                EventSimilarity.query.delete()
+            elif event_ids:
+                EventSimilarity.query.filter(
+                    EventSimilarity.event_id.in_(event_ids)
+                ).delete(synchronize_session=False)
+
+            batch = []
+            for event_id in event_ids:
+                for neighbor_id, score in self.model.neighbours_of(event_id):
+                    batch.append({
+                        'event_id': event_id,
+                        'neighbor_id': neighbor_id,
+                        'score': score,
+                        'updated_at': now
+                    })
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    db.session.execute(insert(EventSimilarity), batch)
+                    batch = []
+            if batch:
+                db.session.execute(insert(EventSimilarity), batch)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
@@ -0,0 +1,72 @@
+/**
+ * Interaction tracker for EventFlowAI
+ * Coalesces event interactions (impressions, clicks, joins, ...) in the browser and sends
+ * them to /api/track_interactions in batches, so a listing page costs one request per
+ * batch instead of one per interaction.
+ *
+ * Usage: window.interactionTracker.track('impression', eventId, { source: 'home_page' });
+ */
+(function () {
+    const ENDPOINT = '/api/track_interactions';
+    const FLUSH_INTERVAL_MS = 5000;  // Send queued interactions at least this often
+    const MAX_BATCH_SIZE = 50;       // Send as soon as this many are queued (server accepts up to 200)
+
+    const queue = [];
+    let timer = null;
+
+    /**
+     * Queue an interaction
+     * @param {string} interactionType - Type of interaction (view, impression, join, etc.)
+     * @param {string|number} eventId - ID of the event
+     * @param {Object} [metadata] - Optional extra data stored with the interaction
+     */
+    function track(interactionType, eventId, metadata) {
+        if (!eventId) return;
+
+        queue.push({
+            event_id: eventId,
+            interaction_type: interactionType,
+            metadata: metadata || null
+        });
+
+        if (queue.length >= MAX_BATCH_SIZE) {
+            flush();
+        } else if (!timer) {
+            timer = setTimeout(flush, FLUSH_INTERVAL_MS);
+        }
+    }
+
+    /**
+     * Send everything queued so far
+     */
+    function flush() {
+        if (timer) {
+            clearTimeout(timer);
+            timer = null;
+        }
+        if (queue.length === 0) return;
+
+        const batch = queue.splice(0, queue.length);
+        // A keepalive fetch outlives the page like a beacon, and unlike a beacon it can
+        // send application/json, which the server requires (it rejects cross-site posts)
+        fetch(ENDPOINT, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ interactions: batch }),
+            keepalive: true,
+            credentials: 'same-origin'
+        }).catch(error => {
+            console.error('Error tracking interactions:', error);
+        });
+    }
+
+    // Deliver what is left when the page is hidden or unloaded
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') {
+            flush();
+        }
+    });
+    window.addEventListener('pagehide', flush);
+
+    window.interactionTracker = { track, flush };
+})();
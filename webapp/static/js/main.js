@@ -251,7 +251,7 @@ function setupRecommendationsPage() {
         const detailsButton = card.querySelector('.details-btn');
         if (detailsButton) {
             detailsButton.addEventListener('click', () => {
-                trackEventInteraction('view_details', card.dataset.eventId);
+                trackEventInteraction('view', card.dataset.eventId);
             });
         }
         
@@ -291,21 +291,12 @@ function setupBrowseEventsPage() {
  * Track event interactions for improving recommendations
  * @param {string} interactionType - Type of interaction (view, join, etc.)
  * @param {string} eventId - ID of the event
+ * @param {Object} [metadata] - Optional extra data stored with the interaction
  */
-function trackEventInteraction(interactionType, eventId) {
+function trackEventInteraction(interactionType, eventId, metadata) {
     try {
-        // Send interaction data to backend
-        fetch('/api/track_interaction', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                event_id: eventId,
-                interaction_type: interactionType,
-                timestamp: new Date().toISOString()
-            })
-        });
+        // Queue for the next batch sent by interaction-tracker.js
+        window.interactionTracker.track(interactionType, eventId, metadata);
     } catch (error) {
         console.error('Error tracking interaction:', error);
     }
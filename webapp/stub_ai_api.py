@@ -0,0 +1,127 @@
+# webapp/stub_ai_api.py
+"""
+Local stand-in for the AI recommendation API, for exercising timeouts, retries and
+the circuit breaker without the real service.
+
+Run it with e.g. `python -m webapp.stub_ai_api --port 5001 --delay 3 --failure-rate 0.5`
+and point AI_API at http://localhost:5001, or start it in-process:
+
+    server = StubAIServer(delay=0.5, failure_rate=0.2)
+    url = server.start()
+    ...
+    server.stop()
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from webapp.recommendation_payload import decode_request
+
+
+class StubAIServer:
+    """Threaded HTTP server answering /health and /api/recommendations"""
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0, failure_rate=0.0, failure_status=503):
+        """Configure the artificial latency and the fraction of failing responses"""
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread and return the base URL"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """Shut the server down"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        """Serve in the current thread"""
+        self._server.serve_forever()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/health':
+                    self._send(200, {'status': 'ok'})
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                with stub._lock:
+                    stub.request_count += 1
+
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                time.sleep(stub.delay)
+
+                if self.path != '/api/recommendations':
+                    self._send(404, {'error': 'not found'})
+                elif random.random() < stub.failure_rate:
+                    self._send(stub.failure_status, {'error': 'simulated failure'})
+                else:
+                    self._send(200, {'recommendations': stub.recommend(body, self.headers)})
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def recommend(self, body, headers):
+        """Return random scores for up to 20 of the submitted events (JSON or columnar)"""
+        try:
+            events = decode_request(body, headers.get('Content-Type')).get('events', [])
+        except ValueError:
+            events = []
+        if isinstance(events, dict):
+            event_ids = events['id'].tolist()
+        else:
+            event_ids = [event['id'] for event in events]
+        sample = random.sample(event_ids, min(20, len(event_ids)))
+        return [{'event_id': event_id, 'score': round(random.random(), 4)} for event_id in sample]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub AI recommendation API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before answering')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--failure-status', type=int, default=503)
+    args = parser.parse_args()
+
+    server = StubAIServer(args.host, args.port, args.delay, args.failure_rate, args.failure_status)
+    print(f"Stub AI API listening on {server.url} (delay={args.delay}s, failure_rate={args.failure_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
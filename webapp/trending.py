@@ -0,0 +1,275 @@
+# webapp/trending.py
+"""
+In-memory trending leaderboard.
+
+Interaction counts are kept per hour and event for the last `max_days` days, alongside
+a time-decayed score and a top-K leaderboard by that score. The hourly interaction
+rollups are the source of truth: they are written in the same transaction as the
+interactions by every worker, so a background thread warms the leaderboard from them
+at startup and then re-reads the most recent `sync_hours` hours every
+`refresh_interval` seconds, replacing those hours' counts. In between, interactions
+this worker commits are added as soon as the write-behind buffer flushes them (see
+ingest()), so requests only ever read memory. A row counted locally and by a sync in
+the same hour is corrected by the next sync.
+
+Window counts are kept as running totals per requested window length: ingested
+interactions are added to every window they fall in, and when the hour changes the
+hours that left a window are subtracted from it, so a read costs one copy of the
+window's totals instead of a walk over every event's buckets. Only the partial hour at
+the start of the window is counted with a query.
+
+Decayed scores use forward decay: an interaction at hour h adds 2 ** ((h - landmark) /
+half_life) to its event's score. Every score decays at the same rate, so ranking by the
+stored values is the same as ranking by the decayed ones and scores only grow (except
+for sync corrections), which keeps the top-K set cheap to maintain on each update.
+"""
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from webapp.models import db, InteractionRollup, UserEventInteraction
+
+EPOCH = datetime(1970, 1, 1)
+SECONDS_PER_HOUR = 3600
+# Renormalize forward-decayed scores before 2 ** exponent can overflow a float
+MAX_DECAY_EXPONENT = 500
+
+
+def hour_bucket(timestamp):
+    """Return the hour index (hours since the epoch) of a naive UTC datetime"""
+    return int((timestamp - EPOCH).total_seconds() // SECONDS_PER_HOUR)
+
+
+class TrendingLeaderboard:
+    """Hourly interaction counts, window totals, decayed scores and a top-K leaderboard"""
+
+    def __init__(self, max_days=30, half_life_hours=24.0, top_k=200, refresh_interval=10.0, sync_hours=2):
+        """Create an empty leaderboard; start() warms it and keeps it in sync"""
+        self.max_days = max_days
+        self.half_life_hours = half_life_hours
+        self.top_k = top_k
+        self.refresh_interval = refresh_interval
+        self.sync_hours = sync_hours
+        self.hours = defaultdict(dict)    # hour -> {event_id: count}
+        self.event_totals = {}            # event_id -> interactions in the last max_days
+        self.scores = {}                  # event_id -> forward-decayed score
+        self.leaders = {}                 # top_k event_id -> score
+        self.landmark = None              # hour the decayed scores are relative to
+        self.ready = False                # loaded from the rollups
+        self.synced_at = None             # when the rollups were last read
+        self._windows = {}                # (days, exact) -> [first hour, {event_id: count}]
+        self._oldest_hour = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        """Warm the leaderboard and keep it in sync with the rollups on a background thread"""
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, args=(app,), name='trending', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the sync thread"""
+        self._stopping.set()
+
+    def _run(self, app):
+        while not self._stopping.is_set():
+            with app.app_context():
+                try:
+                    self.sync()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Error syncing the trending leaderboard: {e}")
+            self._stopping.wait(self.refresh_interval)
+
+    def sync(self):
+        """Load the rollups on first use, then re-read the most recent hours"""
+        current_hour = self._current_hour()
+        if self.ready:
+            first_hour = current_hour - self.sync_hours + 1
+        else:
+            first_hour = current_hour - self.max_days * 24
+        rows = db.session.query(
+            InteractionRollup.event_id, InteractionRollup.bucket, db.func.sum(InteractionRollup.count)
+        ).filter(
+            InteractionRollup.bucket >= EPOCH + timedelta(hours=first_hour)
+        ).group_by(
+            InteractionRollup.event_id, InteractionRollup.bucket
+        ).order_by(InteractionRollup.bucket).all()
+        db.session.commit()
+
+        synced = defaultdict(dict)
+        for event_id, bucket, count in rows:
+            synced[hour_bucket(bucket)][event_id] = int(count)
+        with self._lock:
+            self._expire()
+            for hour in set(range(first_hour, current_hour + 1)) | set(synced):
+                counts = synced.get(hour, {})
+                known = self.hours.get(hour, {})
+                for event_id in set(known) | set(counts):
+                    delta = counts.get(event_id, 0) - known.get(event_id, 0)
+                    if delta:
+                        self._add(event_id, hour, delta)
+            self.ready = True
+            self.synced_at = datetime.utcnow()
+
+    def ingest(self, rows):
+        """Count committed interaction rows (dicts with event_id and timestamp)"""
+        if not self.ready:
+            # Not loaded yet: the load reads these rows from the rollups
+            return
+        with self._lock:
+            self._expire()
+            for row in rows:
+                self._add(row['event_id'], hour_bucket(row.get('timestamp') or datetime.utcnow()), 1)
+
+    def record(self, event_id, timestamp, count=1):
+        """Count `count` interactions at timestamp"""
+        with self._lock:
+            self._add(event_id, hour_bucket(timestamp or datetime.utcnow()), count)
+
+    def _add(self, event_id, hour, count):
+        """Add count (possibly negative) to an event's hour (caller holds the lock)"""
+        if hour < self._current_hour() - self.max_days * 24:
+            return
+
+        counts = self.hours[hour]
+        counts[event_id] = counts.get(event_id, 0) + count
+        if not counts[event_id]:
+            del counts[event_id]
+        total = self.event_totals.get(event_id, 0) + count
+        for first_hour, window in self._windows.values():
+            if hour >= first_hour:
+                window[event_id] = window.get(event_id, 0) + count
+                if not window[event_id]:
+                    del window[event_id]
+
+        if total <= 0:
+            self._forget(event_id)
+            return
+        self.event_totals[event_id] = total
+
+        if self.landmark is None:
+            self.landmark = hour
+        exponent = (hour - self.landmark) / self.half_life_hours
+        if exponent > MAX_DECAY_EXPONENT:
+            self._renormalize(hour)
+            exponent = 0.0
+        score = max(0.0, self.scores.get(event_id, 0.0) + count * 2.0 ** exponent)
+        self.scores[event_id] = score
+        self._offer(event_id, score)
+
+    def _forget(self, event_id):
+        """Drop an event without interactions left in the last max_days"""
+        self.event_totals.pop(event_id, None)
+        self.scores.pop(event_id, None)
+        self.leaders.pop(event_id, None)
+
+    def _offer(self, event_id, score):
+        """Keep event_id in the top-K leaderboard if its score qualifies"""
+        if event_id in self.leaders or len(self.leaders) < self.top_k:
+            self.leaders[event_id] = score
+            return
+        weakest = min(self.leaders, key=self.leaders.get)
+        if score > self.leaders[weakest]:
+            del self.leaders[weakest]
+            self.leaders[event_id] = score
+
+    def _renormalize(self, hour):
+        """Move the decay landmark to hour, rescaling every stored score"""
+        factor = 2.0 ** ((self.landmark - hour) / self.half_life_hours)
+        self.scores = {event_id: score * factor for event_id, score in self.scores.items()}
+        self.leaders = {event_id: score * factor for event_id, score in self.leaders.items()}
+        self.landmark = hour
+
+    def _current_hour(self):
+        return hour_bucket(datetime.utcnow())
+
+    def _expire(self):
+        """Drop hours older than max_days (caller holds the lock; at most once per hour)"""
+        oldest = self._current_hour() - self.max_days * 24
+        if self._oldest_hour == oldest:
+            return
+        self._oldest_hour = oldest
+        for entry in self._windows.values():
+            self._advance_window(entry, oldest)
+        for hour in [hour for hour in self.hours if hour < oldest]:
+            for event_id, count in self.hours.pop(hour).items():
+                total = self.event_totals.get(event_id, 0) - count
+                if total <= 0:
+                    self._forget(event_id)
+                else:
+                    self.event_totals[event_id] = total
+
+    def _window(self, key, first_hour):
+        """Running totals of hours >= first_hour for a window (caller holds the lock)"""
+        entry = self._windows.get(key)
+        if entry is None:
+            totals = defaultdict(int)
+            for hour, counts in self.hours.items():
+                if hour >= first_hour:
+                    for event_id, count in counts.items():
+                        totals[event_id] += count
+            entry = self._windows[key] = [first_hour, dict(totals)]
+        self._advance_window(entry, first_hour)
+        return entry[1]
+
+    def _advance_window(self, entry, first_hour):
+        """Subtract the hours before first_hour from a window's totals (caller holds the lock)"""
+        window = entry[1]
+        for hour in range(entry[0], first_hour):
+            for event_id, count in self.hours.get(hour, {}).items():
+                remaining = window.get(event_id, 0) - count
+                if remaining > 0:
+                    window[event_id] = remaining
+                else:
+                    window.pop(event_id, None)
+        entry[0] = max(entry[0], first_hour)
+
+    def window_counts(self, days, exact=True):
+        """
+        Return {event_id: interactions in the last `days` days}. Whole hours come from the
+        running totals; with `exact` the partial hour at the start of the window is counted
+        with a query over that hour only, otherwise the whole hour is included.
+        """
+        if days > self.max_days:
+            raise ValueError(f"The leaderboard only keeps {self.max_days} days of interactions")
+        period_start = datetime.utcnow() - timedelta(days=days)
+        start_hour = hour_bucket(period_start)
+        first_full_hour = start_hour + 1 if exact else start_hour
+        with self._lock:
+            self._expire()
+            counts = dict(self._window((days, exact), first_full_hour))
+
+        if exact:
+            boundary = db.session.query(
+                UserEventInteraction.event_id, db.func.count(UserEventInteraction.id)
+            ).filter(
+                UserEventInteraction.timestamp >= period_start,
+                UserEventInteraction.timestamp < EPOCH + timedelta(hours=first_full_hour)
+            ).group_by(UserEventInteraction.event_id)
+            for event_id, count in boundary:
+                counts[event_id] = counts.get(event_id, 0) + count
+
+        return counts
+
+    def decayed_scores(self, limit):
+        """Return the top `limit` (<= top_k) (event_id, decayed score) pairs, best first"""
+        with self._lock:
+            if self.landmark is None:
+                return []
+            # Convert stored scores to decayed interaction counts as of now
+            factor = 2.0 ** ((self.landmark - self._current_hour()) / self.half_life_hours)
+            ranked = sorted(self.leaders.items(), key=lambda item: -item[1])[:limit]
+        return [(event_id, score * factor) for event_id, score in ranked]
+
+    def stats(self):
+        """Return leaderboard size information for monitoring"""
+        return {
+            'ready': self.ready,
+            'events': len(self.event_totals),
+            'leaders': len(self.leaders),
+            'windows': len(self._windows),
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None
+        }